@@ -0,0 +1,75 @@
+import threading
+
+MIN_COMPRESS_SIZE = 64  # 更短的数据压缩后通常反而变大
+PROBE_SAMPLE_SIZE = 4096  # 每个采样块的大小
+PROBE_SAMPLES = 3  # 分别从开头、中间、结尾采样
+INCOMPRESSIBLE_RATIO = 0.95  # 采样压缩后仍大于原大小的95%时视为不可压缩（如WebP图片）
+
+DEFAULT_LEVEL = 3
+LARGE_LEVEL = 9  # 大段可压缩文本值得花更多CPU换取更小的负载
+LARGE_PAYLOAD_SIZE = 256 * 1024
+HUGE_PAYLOAD_SIZE = 16 * 1024 * 1024  # 超大内容回到默认级别，避免编码耗时过长
+
+
+def probe_samples(data: bytes) -> list[bytes]:
+    """取若干采样块用于估计可压缩性"""
+    if len(data) <= PROBE_SAMPLE_SIZE * PROBE_SAMPLES:
+        return [data]
+    step = (len(data) - PROBE_SAMPLE_SIZE) // (PROBE_SAMPLES - 1)
+    return [data[i * step:i * step + PROBE_SAMPLE_SIZE] for i in range(PROBE_SAMPLES)]
+
+
+def choose_level(data: bytes, probe_compressor) -> int | None:
+    """根据采样压缩的结果选择zstd压缩级别，返回None表示不压缩
+
+    probe_compressor 应为低级别（如1）的压缩器，采样压缩的开销远小于完整压缩。
+    """
+    if len(data) < MIN_COMPRESS_SIZE:
+        return None
+    samples = probe_samples(data)
+    sampled = sum(len(sample) for sample in samples)
+    compressed = sum(len(probe_compressor.compress(sample)) for sample in samples)
+    if compressed >= sampled * INCOMPRESSIBLE_RATIO:
+        return None
+    if LARGE_PAYLOAD_SIZE <= len(data) < HUGE_PAYLOAD_SIZE:
+        return LARGE_LEVEL
+    return DEFAULT_LEVEL
+
+
+class CompressionStats:
+    """按编码方式统计次数、数据量和耗时"""
+
+    def __init__(self):
+        self._codecs = {}  # 名称 -> [次数, 输入字节, 输出字节, 耗时秒]
+        self._lock = threading.Lock()  # 编码在后台线程，读取在GUI线程
+
+    def record(self, codec: str, bytes_in: int, bytes_out: int, seconds: float):
+        with self._lock:
+            entry = self._codecs.setdefault(codec, [0, 0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += bytes_in
+            entry[2] += bytes_out
+            entry[3] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                codec: {
+                    "count": count,
+                    "bytes_in": bytes_in,
+                    "bytes_out": bytes_out,
+                    "ratio": bytes_in / bytes_out if bytes_out else None,
+                    "total_ms": seconds * 1000,
+                    "avg_ms": seconds * 1000 / count if count else 0.0,
+                }
+                for codec, (count, bytes_in, bytes_out, seconds) in self._codecs.items()
+            }
+
+    def summary(self) -> str:
+        lines = []
+        for codec, stats in sorted(self.snapshot().items()):
+            ratio = f"{stats['ratio']:.2f}" if stats['ratio'] else "-"
+            lines.append(f"{codec}: {stats['count']}次, 输入{stats['bytes_in']}字节, 压缩率{ratio}, "
+                         f"平均{stats['avg_ms']:.2f}ms, 合计{stats['total_ms']:.0f}ms")
+        return "\n".join(lines)
+
@@ -0,0 +1,135 @@
+"""比较使用/不使用zstd字典压缩短文本的压缩率和吞吐量
+
+用法：
+    python benchmarks/dictionary_benchmark.py                 # 使用 ~/.copier/history.db 中的文本
+    python benchmarks/dictionary_benchmark.py --synthetic     # 使用生成的示例文本
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zstandard
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from compression_dictionaries import DICTIONARY_SIZE, DICTIONARY_SAMPLE_MAX_CHARS  # noqa: E402
+
+
+def load_history_samples(db_path: str, limit: int) -> list[bytes]:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from history_store import HistoryStore
+    store = HistoryStore(db_path)
+    try:
+        return store.sample_texts(limit, DICTIONARY_SAMPLE_MAX_CHARS)
+    finally:
+        store.close()
+
+
+def synthetic_samples(count: int, seed: int = 0) -> list[bytes]:
+    """生成类似日常复制内容的短文本：链接、命令、日志、JSON、代码片段"""
+    rng = random.Random(seed)
+    hosts = ["github.com", "docs.python.org", "example.com", "gitlab.internal", "stackoverflow.com"]
+    words = ["config", "server", "client", "error", "timeout", "request", "user", "token", "cache",
+             "update", "deploy", "build", "release", "connect", "session", "message", "剪贴板", "同步"]
+
+    def word():
+        return rng.choice(words)
+
+    templates = [
+        lambda: f"https://{rng.choice(hosts)}/{word()}/{word()}?id={rng.randint(1, 99999)}",
+        lambda: f"git commit -m \"{word()} {word()} {word()}\" && git push origin {word()}",
+        lambda: f"2026-10-17 12:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} "
+                f"{rng.choice(['INFO', 'WARN', 'ERROR'])} [{word()}] {word()} {word()} failed after "
+                f"{rng.randint(1, 5000)}ms",
+        lambda: json.dumps({"id": rng.randint(1, 10 ** 6), "name": word(), "status": word(),
+                            "tags": [word() for _ in range(rng.randint(1, 4))]}, ensure_ascii=False),
+        lambda: f"def {word()}_{word()}(self, {word()}):\n    return self.{word()}.get({word()!r})",
+        lambda: f"ssh {word()}@{rng.randint(10, 250)}.{rng.randint(0, 255)}.0.{rng.randint(1, 254)}",
+    ]
+    return [rng.choice(templates)().encode("utf-8") for _ in range(count)]
+
+
+def measure(samples: list[bytes], compressor, decompressor, rounds: int) -> dict:
+    total = sum(len(sample) for sample in samples)
+    compressed = [compressor.compress(sample) for sample in samples]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sample in samples:
+            compressor.compress(sample)
+    compress_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for frame in compressed:
+            decompressor.decompress(frame)
+    decompress_time = time.perf_counter() - start
+
+    compressed_total = sum(len(frame) for frame in compressed)
+    return {
+        "original_bytes": total,
+        "compressed_bytes": compressed_total,
+        "ratio": total / compressed_total,
+        "compress_mb_s": total * rounds / compress_time / 1e6,
+        "decompress_mb_s": total * rounds / decompress_time / 1e6,
+        "messages_per_s": len(samples) * rounds / compress_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.path.join(os.path.expanduser("~"), ".copier", "history.db"))
+    parser.add_argument("--synthetic", action="store_true", help="使用生成的示例文本")
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--dict-size", type=int, default=DICTIONARY_SIZE)
+    parser.add_argument("--level", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    if args.synthetic or not os.path.exists(args.db):
+        samples = synthetic_samples(args.samples)
+        source = "synthetic"
+    else:
+        samples = load_history_samples(args.db, args.samples)
+        source = args.db
+    if len(samples) < 20:
+        sys.exit(f"样本太少: {len(samples)}")
+
+    # 80%用于训练，其余用于测试，避免在训练样本上评估
+    random.Random(1).shuffle(samples)
+    split = len(samples) * 4 // 5
+    train, test = samples[:split], samples[split:]
+
+    start = time.perf_counter()
+    dictionary = zstandard.train_dictionary(args.dict_size, train)
+    train_ms = (time.perf_counter() - start) * 1000
+
+    results = {
+        "source": source,
+        "train_samples": len(train),
+        "test_samples": len(test),
+        "dict_id": dictionary.dict_id(),
+        "train_ms": train_ms,
+        "plain": measure(test, zstandard.ZstdCompressor(level=args.level),
+                         zstandard.ZstdDecompressor(), args.rounds),
+        "dictionary": measure(test, zstandard.ZstdCompressor(level=args.level, dict_data=dictionary),
+                              zstandard.ZstdDecompressor(dict_data=dictionary), args.rounds),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"样本来源: {source}，训练 {len(train)} 条，测试 {len(test)} 条，"
+          f"字典 {args.dict_size} 字节，训练耗时 {train_ms:.0f}ms")
+    print(f"{'模式':<12}{'压缩率':>8}{'压缩后字节':>12}{'压缩MB/s':>10}{'解压MB/s':>10}{'条/秒':>10}")
+    for name in ("plain", "dictionary"):
+        r = results[name]
+        print(f"{name:<12}{r['ratio']:>8.2f}{r['compressed_bytes']:>12}"
+              f"{r['compress_mb_s']:>10.1f}{r['decompress_mb_s']:>10.1f}{r['messages_per_s']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""DataProcessor 和剪贴板热点路径的基准测试
+
+在 offscreen Qt 平台上运行，使用合成的截图、照片和 1KB-100MB 文本，
+统计每个用例的延迟分位数、吞吐量和峰值内存，结果可保存为JSON并与之前的结果比较。
+
+用法：
+    python benchmarks/run_benchmarks.py --list
+    python benchmarks/run_benchmarks.py --quick --output before.json
+    python benchmarks/run_benchmarks.py --quick --compare before.json
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+    python benchmarks/run_benchmarks.py --filter text.compress
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MB = 1024 * 1024
+
+SCREENSHOT_SIZES = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+PHOTO_SIZES = {
+    "1080p": (1920, 1080),
+    "12mp": (4032, 3024),
+}
+TEXT_SIZES = {
+    "1k": 1024,
+    "10k": 10 * 1024,
+    "100k": 100 * 1024,
+    "1m": MB,
+    "10m": 10 * MB,
+    "100m": 100 * MB,
+}
+QUICK_IMAGES = {"screenshot_1080p", "photo_1080p"}
+QUICK_TEXTS = {"1k", "100k", "1m"}
+
+
+def peak_rss() -> int | None:
+    """进程的峰值常驻内存（字节）"""
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+
+# ---------------------------------------------------------------- 合成语料
+
+def make_screenshot(width: int, height: int, seed: int = 0):
+    """类似桌面截图：大面积纯色、窗口边框和文字"""
+    from PySide6.QtCore import QRect
+    from PySide6.QtGui import QColor, QFont, QImage, QPainter
+
+    rng = random.Random(seed)
+    image = QImage(width, height, QImage.Format.Format_ARGB32)
+    image.fill(QColor("#2b2b2b"))
+    painter = QPainter(image)
+    painter.setFont(QFont("Sans", 11))
+    for _ in range(6):
+        w = rng.randint(width // 4, width // 2)
+        h = rng.randint(height // 4, height // 2)
+        x = rng.randint(0, width - w)
+        y = rng.randint(0, height - h)
+        painter.fillRect(QRect(x, y, w, h), QColor(rng.choice(["#ffffff", "#f3f3f3", "#1e1e1e", "#3c3f41"])))
+        painter.fillRect(QRect(x, y, w, 28), QColor(rng.choice(["#4CAF50", "#2d5a88", "#dddddd"])))
+        painter.setPen(QColor(rng.choice(["#000000", "#d4d4d4", "#333333"])))
+        for line in range(36, h - 16, 18):
+            text = " ".join(rng.choice(["def", "return", "self", "config", "剪贴板", "同步", "= 42", "print()"])
+                            for _ in range(rng.randint(3, 12)))
+            painter.drawText(x + 10, y + line, text)
+    painter.end()
+    return image
+
+
+def make_photo(width: int, height: int, seed: int = 0):
+    """类似照片：平滑的渐变叠加噪声，几乎没有可直接压缩的重复"""
+    from PIL import Image, ImageFilter
+    from PySide6.QtGui import QImage
+
+    random.seed(seed)
+    channels = []
+    for sigma, blur in ((60, 3), (45, 2), (70, 4)):
+        noise = Image.effect_noise((width, height), sigma).filter(ImageFilter.GaussianBlur(blur))
+        gradient = Image.linear_gradient("L").resize((width, height)).rotate(random.randint(0, 359))
+        channels.append(Image.blend(noise, gradient, 0.4))
+    photo = Image.merge("RGB", channels)
+    data = photo.tobytes()
+    return QImage(data, width, height, width * 3, QImage.Format.Format_RGB888).copy()
+
+
+def make_text(size: int, seed: int = 0) -> str:
+    """混合日志、代码和中文段落的文本，按UTF-8字节数截断到指定大小"""
+    rng = random.Random(seed)
+    words = ["config", "server", "timeout", "request", "session", "token", "cache", "deploy", "worker"]
+    chinese = "剪贴板内容已同步到其他设备，历史记录保存在本地数据库中，可以通过搜索快速找到。"
+
+    def block(count: int, offset: int) -> str:
+        lines = []
+        for i in range(count):
+            kind = rng.random()
+            if kind < 0.5:
+                lines.append(f"2026-10-17 12:{i % 60:02d}:{rng.randint(0, 59):02d} INFO [{rng.choice(words)}] "
+                             f"request {offset + i} finished in {rng.randint(1, 900)}ms")
+            elif kind < 0.8:
+                lines.append(f"    def {rng.choice(words)}_{i}(self, value={rng.randint(0, 99)}):"
+                             f" return self.{rng.choice(words)}[value]")
+            else:
+                start = rng.randint(0, len(chinese) - 10)
+                lines.append(chinese[start:] + chinese[:start])
+        return "\n".join(lines) + "\n"
+
+    base = block(4000, 0)
+    parts = [base]
+    total = len(base.encode("utf-8"))
+    index = 1
+    while total < size:
+        # 大文本由基础块和少量变化拼接，避免生成时间过长
+        part = base if index % 8 else block(500, index * 4000)
+        parts.append(part)
+        total += len(part.encode("utf-8"))
+        index += 1
+    return "".join(parts).encode("utf-8")[:size].decode("utf-8", errors="ignore")
+
+
+# ---------------------------------------------------------------- 用例
+
+def _images(quick: bool):
+    for name, (w, h) in SCREENSHOT_SIZES.items():
+        key = f"screenshot_{name}"
+        if not quick or key in QUICK_IMAGES:
+            yield key, (lambda w=w, h=h: make_screenshot(w, h))
+    for name, (w, h) in PHOTO_SIZES.items():
+        key = f"photo_{name}"
+        if not quick or key in QUICK_IMAGES:
+            yield key, (lambda w=w, h=h: make_photo(w, h))
+
+
+def _texts(quick: bool):
+    for name, size in TEXT_SIZES.items():
+        if not quick or name in QUICK_TEXTS:
+            yield name, size
+
+
+def build_cases(quick: bool) -> dict:
+    """返回 {用例名: 准备函数}；准备函数生成语料（不计时），返回(被测函数, 输入字节数)"""
+    cases = {}
+
+    def add(name, setup):
+        cases[name] = setup
+
+    for key, make in _images(quick):
+        def optimize(make=make):
+            from data_processor import DataProcessor
+            image, processor = make(), DataProcessor()
+            return (lambda: processor.optimize_image(image)), image.sizeInBytes()
+
+        def restore(make=make):
+            from data_processor import DataProcessor
+            processor = DataProcessor()
+            webp = processor.optimize_image(make())
+            return (lambda: processor.restore_image(webp)), len(webp)
+
+        def process(make=make):
+            from data_processor import DataProcessor
+            image, processor = make(), DataProcessor()
+            return (lambda: processor.process_clipboard_data("image", image)), image.sizeInBytes()
+
+        def fingerprint(make=make):
+            from fingerprint import image_fingerprint
+            image = make()
+            return (lambda: image_fingerprint(image)), image.sizeInBytes()
+
+        def clipboard_hash(make=make):
+            # 与 on_clipboard_change 相同：从 mimeData 取出图片并计算指纹
+            from PySide6.QtCore import QMimeData
+            from fingerprint import image_fingerprint
+            image = make()
+            mime = QMimeData()
+            mime.setImageData(image)
+            return (lambda: image_fingerprint(mime.imageData())), image.sizeInBytes()
+
+        add(f"image.optimize.{key}", optimize)
+        add(f"image.restore.{key}", restore)
+        add(f"image.process.{key}", process)
+        add(f"image.fingerprint.{key}", fingerprint)
+        add(f"clipboard.hash_image.{key}", clipboard_hash)
+
+    for key, size in _texts(quick):
+        def compress(size=size):
+            from data_processor import DataProcessor
+            data, processor = make_text(size).encode("utf-8"), DataProcessor()
+            return (lambda: processor.compress_data(data)), len(data)
+
+        def decompress(size=size):
+            from data_processor import DataProcessor
+            processor = DataProcessor()
+            compressed = processor.compress_data(make_text(size).encode("utf-8"))
+            return (lambda: processor.decompress_data(compressed)), size
+
+        def process(size=size):
+            from data_processor import DataProcessor
+            text, processor = make_text(size), DataProcessor()
+            return (lambda: processor.process_clipboard_data("text", text)), size
+
+        def restore(size=size):
+            from data_processor import DataProcessor
+            processor = DataProcessor()
+            _, data, compressed = processor.process_clipboard_data("text", make_text(size))
+            return (lambda: processor.restore_clipboard_data("text", data, compressed)), size
+
+        def stream(size=size):
+            from data_processor import DataProcessor
+            from chunked_transfer import DEFAULT_CHUNK_SIZE
+            text, processor = make_text(size), DataProcessor()
+            return (lambda: processor.compress_text_chunks(text, DEFAULT_CHUNK_SIZE)), size
+
+        def content_hash(size=size):
+            # 与 calculate_content_hash 相同：对收到的压缩负载计算指纹
+            from data_processor import DataProcessor
+            from fingerprint import bytes_fingerprint
+            compressed = DataProcessor().compress_data(make_text(size).encode("utf-8"))
+            return (lambda: bytes_fingerprint(compressed)), len(compressed)
+
+        def clipboard_hash(size=size):
+            # 与 on_clipboard_change 相同：从 mimeData 取出文本并计算指纹
+            from PySide6.QtCore import QMimeData
+            from fingerprint import text_fingerprint
+            mime = QMimeData()
+            mime.setText(make_text(size))
+            return (lambda: text_fingerprint(mime.text())), size
+
+        add(f"text.compress.{key}", compress)
+        add(f"text.decompress.{key}", decompress)
+        add(f"text.process.{key}", process)
+        add(f"text.restore.{key}", restore)
+        if size >= MB:
+            add(f"text.stream_compress.{key}", stream)
+        add(f"text.content_hash.{key}", content_hash)
+        add(f"clipboard.hash_text.{key}", clipboard_hash)
+
+    return cases
+
+
+# ---------------------------------------------------------------- 运行
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """线性插值的分位数，q取0-100"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def run_case(name: str, setup, min_time: float, min_iterations: int, max_iterations: int) -> dict:
+    from PySide6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])  # noqa: F841  QPainter/字体需要应用实例
+
+    func, nbytes = setup()
+    setup_rss = peak_rss()
+    func()  # 预热
+
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < max_iterations and (len(samples) < min_iterations or
+                                             time.perf_counter() - start < min_time):
+        t = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t)
+
+    ordered = sorted(samples)
+    mean = sum(samples) / len(samples)
+    rss = peak_rss()
+    return {
+        "name": name,
+        "iterations": len(samples),
+        "bytes": nbytes,
+        "mean_ms": mean * 1000,
+        "min_ms": ordered[0] * 1000,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p90_ms": percentile(ordered, 90) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+        "throughput_mb_s": nbytes / mean / MB if mean > 0 else None,
+        "peak_rss_mb": rss / MB if rss is not None else None,
+        # 准备语料后的峰值内存，peak_rss_mb 减去它约为用例本身的额外内存
+        "setup_rss_mb": setup_rss / MB if setup_rss is not None else None,
+    }
+
+
+def run_isolated(name: str, args) -> dict:
+    """在子进程中运行单个用例，使峰值内存只反映该用例"""
+    command = [sys.executable, os.path.abspath(__file__), "--run-case", name,
+               "--min-time", str(args.min_time), "--min-iterations", str(args.min_iterations),
+               "--max-iterations", str(args.max_iterations)]
+    if args.quick:
+        command.append("--quick")
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"name": name, "error": completed.stderr.strip().splitlines()[-1:] or ["未知错误"]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def environment() -> dict:
+    import zstandard
+    import PySide6
+    import PIL
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "pyside6": PySide6.__version__,
+        "zstandard": zstandard.__version__,
+        "pillow": PIL.__version__,
+    }
+
+
+def print_results(results: list[dict]):
+    print(f"{'用例':<38}{'次数':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'MB/s':>9}{'峰值MB':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['name']:<38} 失败: {r['error']}")
+            continue
+        throughput = f"{r['throughput_mb_s']:.1f}" if r['throughput_mb_s'] is not None else "-"
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else "-"
+        print(f"{r['name']:<38}{r['iterations']:>6}{r['p50_ms']:>10.2f}{r['p90_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{throughput:>9}{rss:>9}")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    """比较两次结果的p50延迟和峰值内存，返回变慢超过阈值的用例数"""
+    base = {r["name"]: r for r in baseline["results"] if "error" not in r}
+    print(f"基准: {baseline['environment'].get('commit')} {baseline['environment'].get('timestamp')}  "
+          f"当前: {current['environment'].get('commit')} {current['environment'].get('timestamp')}")
+    print(f"{'用例':<38}{'基准p50':>10}{'当前p50':>10}{'变化':>9}{'内存变化':>10}")
+    regressions = 0
+    for r in current["results"]:
+        old = base.get(r["name"])
+        if old is None or "error" in r:
+            continue
+        change = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+        rss_change = "-"
+        if r.get("peak_rss_mb") is not None and old.get("peak_rss_mb") is not None:
+            rss_change = f"{r['peak_rss_mb'] - old['peak_rss_mb']:+.0f}MB"
+        flag = ""
+        if change > threshold:
+            flag = "  变慢"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  变快"
+        print(f"{r['name']:<38}{old['p50_ms']:>10.2f}{r['p50_ms']:>10.2f}{change:>8.1f}%{rss_change:>10}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--list", action="store_true", help="列出所有用例")
+    parser.add_argument("--filter", action="append", default=[], help="只运行名称包含该字符串的用例，可重复")
+    parser.add_argument("--quick", action="store_true", help="只用较小的语料")
+    parser.add_argument("--min-time", type=float, default=1.0, help="每个用例至少运行的秒数")
+    parser.add_argument("--min-iterations", type=int, default=5)
+    parser.add_argument("--max-iterations", type=int, default=200)
+    parser.add_argument("--no-isolate", action="store_true", help="在同一进程中运行所有用例（峰值内存不准确）")
+    parser.add_argument("--output", help="保存JSON结果的文件")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    parser.add_argument("--compare", nargs="+", metavar="JSON",
+                        help="与基准结果比较；给出两个文件时直接比较它们，不运行用例")
+    parser.add_argument("--threshold", type=float, default=10.0, help="p50变慢超过该百分比视为退化")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0], encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            current = json.load(f)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+    cases = build_cases(args.quick)
+
+    if args.run_case:
+        result = run_case(args.run_case, cases[args.run_case], args.min_time,
+                          args.min_iterations, args.max_iterations)
+        print(json.dumps(result))
+        return
+
+    names = [name for name in cases if not args.filter or any(f in name for f in args.filter)]
+    if args.list:
+        print("\n".join(names))
+        return
+
+    results = []
+    for name in names:
+        if not args.json:
+            print(f"运行 {name} ...", file=sys.stderr)
+        if args.no_isolate:
+            try:
+                result = run_case(name, cases[name], args.min_time, args.min_iterations, args.max_iterations)
+            except Exception as e:
+                result = {"name": name, "error": str(e)}
+        else:
+            result = run_isolated(name, args)
+        results.append(result)
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_results(results)
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            baseline = json.load(f)
+        print()
+        sys.exit(1 if compare(baseline, report, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
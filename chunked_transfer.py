@@ -0,0 +1,364 @@
+import codecs
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import zstandard
+from google.protobuf.message import DecodeError
+from clipboard_pb2 import ClipboardChunk, ChunkResendRequest
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_CHUNK = "application/x-copier-chunk"
+# 支持分块传输的最低协议版本
+CHUNKED_PROTOCOL_VERSION = 2
+
+# 支持流式分块（首块携带消息头，块数据直接是zstd流）的最低协议版本
+STREAMING_PROTOCOL_VERSION = 5
+
+DEFAULT_CHUNK_SIZE = 64 * 1024  # 每块64KB，低于常见broker的最大报文限制
+MIN_CHUNK_SIZE = 1024  # 块大小下限，接收方据此限制一次传输的块数
+DEFAULT_MAX_DECOMPRESSED_SIZE = 512 * 1024 * 1024  # 解压后的内容大小上限
+# 发送方缓存已发送的块、接收方保留未完成的传输的时间（秒），两者一致，在此期间重连都能补发
+TRANSFER_RESUME_WINDOW = 600
+
+
+class ChunkSender:
+    """把大负载切分为块，并保留最近的传输以便对端重连后补发"""
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_cached_bytes: int = 64 * 1024 * 1024, cache_ttl: float = TRANSFER_RESUME_WINDOW):
+        self.chunk_size = chunk_size
+        self.max_cached_bytes = max_cached_bytes
+        self.cache_ttl = cache_ttl
+        self._transfers = OrderedDict()  # transfer_id -> (创建时间, [帧])
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def needs_chunking(self, payload: bytes) -> bool:
+        return len(payload) > self.chunk_size
+
+    def split(self, payload: bytes) -> tuple[str, list[bytes]]:
+        """切分负载，返回(transfer_id, 序列化后的帧列表)"""
+        transfer_id = uuid.uuid4().hex
+        total = max(1, (len(payload) + self.chunk_size - 1) // self.chunk_size)
+        checksum = hashlib.sha256(payload).digest()
+
+        frames = []
+        view = memoryview(payload)
+        for sequence in range(total):
+            chunk = ClipboardChunk()
+            chunk.transfer_id = transfer_id
+            chunk.sequence = sequence
+            chunk.total = total
+            chunk.total_size = len(payload)
+            chunk.data = bytes(view[sequence * self.chunk_size:(sequence + 1) * self.chunk_size])
+            if sequence == total - 1:
+                chunk.checksum = checksum
+            frames.append(chunk.SerializeToString())
+
+        self._remember(transfer_id, frames)
+        return transfer_id, frames
+
+    def split_stream(self, header: bytes, chunks: list[bytes]) -> tuple[str, list[bytes]]:
+        """把已按块大小切分的zstd流封装为帧，首帧携带序列化的ClipboardData消息头
+
+        不需要先拼接出完整的压缩数据和protobuf消息。
+        """
+        transfer_id = uuid.uuid4().hex
+        total = max(1, len(chunks))
+        total_size = sum(len(chunk) for chunk in chunks)
+        checksum = hashlib.sha256()
+        for data in chunks:
+            checksum.update(data)
+
+        frames = []
+        for sequence in range(total):
+            chunk = ClipboardChunk()
+            chunk.transfer_id = transfer_id
+            chunk.sequence = sequence
+            chunk.total = total
+            chunk.total_size = total_size
+            chunk.data = chunks[sequence] if chunks else b""
+            if sequence == 0:
+                chunk.header.MergeFromString(header)
+            if sequence == total - 1:
+                chunk.checksum = checksum.digest()
+            frames.append(chunk.SerializeToString())
+
+        self._remember(transfer_id, frames)
+        return transfer_id, frames
+
+    def frames_for_resend(self, transfer_id: str, missing) -> list[bytes]:
+        """返回需要重发的帧；传输已过期时返回空列表"""
+        with self._lock:
+            self._expire()
+            entry = self._transfers.get(transfer_id)
+            if entry is None:
+                return []
+            frames = entry[1]
+            if not missing:
+                return list(frames)
+            return [frames[i] for i in sorted(set(missing)) if 0 <= i < len(frames)]
+
+    def _remember(self, transfer_id: str, frames: list[bytes]):
+        size = sum(len(frame) for frame in frames)
+        with self._lock:
+            self._transfers[transfer_id] = (time.monotonic(), tuple(frames))
+            self._cached_bytes += size
+            self._expire()
+            # 超出缓存上限时丢弃最旧的传输
+            while self._cached_bytes > self.max_cached_bytes and len(self._transfers) > 1:
+                self._drop_oldest()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._transfers:
+            created, _ = next(iter(self._transfers.values()))
+            if now - created <= self.cache_ttl:
+                break
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        _, (_, frames) = self._transfers.popitem(last=False)
+        self._cached_bytes -= sum(len(frame) for frame in frames)
+
+
+class StreamedPayload:
+    """流式传输重组完成的结果：消息头和已解码的文本"""
+
+    def __init__(self, header: bytes, text: str):
+        self.header = header  # 序列化的ClipboardData，content为空
+        self.text = text
+
+
+class _TextStreamDecoder:
+    """增量解压zstd流并解码为UTF-8文本，解压后超过大小上限时立即报错"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.expected_size = None  # 帧头中记录的原始大小，未记录时为0
+        self.parts = []
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._writer = zstandard.ZstdDecompressor().stream_writer(self, write_size=256 * 1024)
+
+    def feed(self, data: bytes):
+        if self.expected_size is None:
+            content_size = zstandard.get_frame_parameters(data).content_size
+            if content_size == zstandard.CONTENTSIZE_UNKNOWN:
+                content_size = 0
+            elif content_size > self.max_size:
+                raise ValueError(f"解压后内容过大: {content_size} 字节")
+            self.expected_size = content_size
+        self._writer.write(data)
+
+    def write(self, data: bytes) -> int:
+        # 由stream_writer调用，接收解压后的数据
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise ValueError(f"解压后内容超过上限: {self.max_size} 字节")
+        # 边解压边解码，不保留解压后的字节
+        self.parts.append(self._utf8.decode(data))
+        return len(data)
+
+    def finish(self) -> str:
+        self.parts.append(self._utf8.decode(b"", final=True))
+        if self.expected_size and self.size != self.expected_size:
+            raise ValueError(f"解压后长度不一致: {self.size} != {self.expected_size}")
+        text = "".join(self.parts)
+        self.parts = []
+        return text
+
+
+class _IncomingTransfer:
+    def __init__(self, sender_id: str, transfer_id: str, total: int, total_size: int):
+        self.sender_id = sender_id
+        self.transfer_id = transfer_id
+        self.total = total
+        self.total_size = total_size
+        self.received = set()  # 已收到的块序号
+        self.chunks = {}  # 尚未处理的块数据
+        self.received_bytes = 0  # chunks中缓冲的字节数
+        self.checksum = b""
+        self.last_update = time.monotonic()
+        # 流式传输：按顺序边收边解压，已解压的块不再缓冲
+        self.header = None
+        self.decoder = None
+        self.next_sequence = 0
+        self.digest = None
+
+    def missing(self) -> list[int]:
+        return [i for i in range(self.total) if i not in self.received]
+
+
+class ChunkAssembler:
+    """重组收到的块，限制缓冲内存并丢弃超时的传输"""
+
+    def __init__(self, max_buffered_bytes: int = 128 * 1024 * 1024,
+                 max_transfer_size: int = 64 * 1024 * 1024, timeout: float = TRANSFER_RESUME_WINDOW,
+                 max_decompressed_size: int = DEFAULT_MAX_DECOMPRESSED_SIZE):
+        self.max_buffered_bytes = max_buffered_bytes
+        self.max_transfer_size = max_transfer_size
+        self.max_decompressed_size = max_decompressed_size
+        self.timeout = timeout
+        self._transfers = OrderedDict()  # transfer_id -> _IncomingTransfer
+        self._buffered_bytes = 0
+        self._completed = OrderedDict()  # 最近完成的transfer_id，用于忽略重发的重复块
+
+    def add_frame(self, sender_id: str, frame: bytes) -> bytes | StreamedPayload | None:
+        """加入一帧，传输完整且校验通过时返回完整负载
+
+        普通传输返回拼接后的负载；首块带消息头的流式传输在收到连续的块时即解压，
+        完成时返回 StreamedPayload。
+        """
+        chunk = ClipboardChunk()
+        try:
+            chunk.ParseFromString(frame)
+        except DecodeError as e:
+            raise ValueError(f"无法解析分块: {e}") from e
+
+        if chunk.transfer_id in self._completed:
+            return None
+        if chunk.total == 0 or chunk.sequence >= chunk.total:
+            raise ValueError(f"无效的分块序号: {chunk.sequence}/{chunk.total}")
+        if chunk.total_size > self.max_transfer_size:
+            raise ValueError(f"传输过大: {chunk.total_size} 字节")
+        self._check_total(chunk)
+
+        self.expire()
+        transfer = self._transfers.get(chunk.transfer_id)
+        if transfer is not None and (transfer.total, transfer.total_size) != (chunk.total, chunk.total_size):
+            raise ValueError(f"分块与传输不一致: {chunk.total}块/{chunk.total_size}字节，"
+                             f"此前为 {transfer.total}块/{transfer.total_size}字节")
+        if transfer is None:
+            transfer = _IncomingTransfer(sender_id, chunk.transfer_id, chunk.total, chunk.total_size)
+            self._transfers[chunk.transfer_id] = transfer
+
+        if chunk.sequence not in transfer.received:
+            self._make_room(len(chunk.data), transfer)
+            transfer.received.add(chunk.sequence)
+            transfer.chunks[chunk.sequence] = chunk.data
+            transfer.received_bytes += len(chunk.data)
+            self._buffered_bytes += len(chunk.data)
+        if chunk.checksum:
+            transfer.checksum = chunk.checksum
+        if chunk.sequence == 0 and chunk.HasField('header') and transfer.header is None:
+            transfer.header = chunk.header.SerializeToString()
+            transfer.decoder = _TextStreamDecoder(self.max_decompressed_size)
+            transfer.digest = hashlib.sha256()
+        transfer.last_update = time.monotonic()
+        self._transfers.move_to_end(chunk.transfer_id)
+
+        if transfer.decoder is not None:
+            self._drain(transfer)
+
+        if len(transfer.received) < transfer.total:
+            return None
+
+        self._discard(transfer.transfer_id)
+        self._mark_completed(transfer.transfer_id)
+        if transfer.decoder is not None:
+            return self._finish_stream(transfer)
+        payload = b"".join(transfer.chunks[i] for i in range(transfer.total))
+        if len(payload) != transfer.total_size:
+            raise ValueError(f"分块长度不一致: {len(payload)} != {transfer.total_size}")
+        if hashlib.sha256(payload).digest() != transfer.checksum:
+            raise ValueError(f"分块校验失败: {transfer.transfer_id}")
+        return payload
+
+    @staticmethod
+    def _check_total(chunk: ClipboardChunk):
+        """块数必须与负载大小一致，否则畸形的帧头会让补发请求列出数以亿计的缺失序号
+
+        除最后一块外每块大小相同，且不小于 MIN_CHUNK_SIZE。
+        """
+        max_total = max(1, -(-chunk.total_size // MIN_CHUNK_SIZE))
+        if chunk.total > max_total:
+            raise ValueError(f"块数与大小不一致: {chunk.total}块/{chunk.total_size}字节")
+        if chunk.sequence < chunk.total - 1:
+            size = len(chunk.data)
+            if size < MIN_CHUNK_SIZE or -(-chunk.total_size // size) != chunk.total:
+                raise ValueError(f"块数与大小不一致: {chunk.total}块/{chunk.total_size}字节，块大小{size}")
+
+    def _drain(self, transfer: _IncomingTransfer):
+        # 按顺序解压已到达的连续块，解压后释放块数据
+        try:
+            while transfer.next_sequence in transfer.chunks:
+                data = transfer.chunks.pop(transfer.next_sequence)
+                transfer.received_bytes -= len(data)
+                self._buffered_bytes -= len(data)
+                transfer.digest.update(data)
+                transfer.decoder.feed(data)
+                transfer.next_sequence += 1
+        except Exception as e:
+            self._discard(transfer.transfer_id)
+            self._mark_completed(transfer.transfer_id)
+            raise ValueError(f"流式解压失败: {e}") from e
+
+    def _finish_stream(self, transfer: _IncomingTransfer) -> StreamedPayload:
+        if transfer.digest.digest() != transfer.checksum:
+            raise ValueError(f"分块校验失败: {transfer.transfer_id}")
+        try:
+            text = transfer.decoder.finish()
+        except Exception as e:
+            raise ValueError(f"流式解压失败: {e}") from e
+        return StreamedPayload(transfer.header, text)
+
+    def incomplete_transfers(self) -> list[tuple[str, str, list[int]]]:
+        """返回未完成的传输[(sender_id, transfer_id, 缺失序号)]，用于重连后请求补发"""
+        self.expire()
+        return [(t.sender_id, t.transfer_id, t.missing()) for t in self._transfers.values()]
+
+    def expire(self):
+        """丢弃超时未更新的传输"""
+        now = time.monotonic()
+        for transfer_id, transfer in list(self._transfers.items()):
+            if now - transfer.last_update > self.timeout:
+                logger.warning("分块传输超时，丢弃: %s，已收到 %s/%s",
+                               transfer_id, len(transfer.received), transfer.total)
+                self._discard(transfer_id)
+
+    def buffered_bytes(self) -> int:
+        return self._buffered_bytes
+
+    def _make_room(self, size: int, current: _IncomingTransfer):
+        # 内存不足时优先丢弃最久没有进展的其他传输
+        for transfer_id in list(self._transfers):
+            if self._buffered_bytes + size <= self.max_buffered_bytes:
+                return
+            if transfer_id != current.transfer_id:
+                logger.warning("分块缓冲超出上限，丢弃传输: %s", transfer_id)
+                self._discard(transfer_id)
+        if self._buffered_bytes + size > self.max_buffered_bytes:
+            self._discard(current.transfer_id)
+            raise ValueError("分块缓冲超出内存上限")
+
+    def _discard(self, transfer_id: str):
+        transfer = self._transfers.pop(transfer_id, None)
+        if transfer is not None:
+            self._buffered_bytes -= transfer.received_bytes
+
+    def _mark_completed(self, transfer_id: str):
+        self._completed[transfer_id] = True
+        while len(self._completed) > 256:
+            self._completed.popitem(last=False)
+
+
+def build_resend_request(transfer_id: str, requester_id: str, missing) -> bytes:
+    request = ChunkResendRequest()
+    request.transfer_id = transfer_id
+    request.requester_id = requester_id
+    request.missing.extend(missing)
+    return request.SerializeToString()
+
+
+def parse_resend_request(payload: bytes) -> ChunkResendRequest:
+    request = ChunkResendRequest()
+    try:
+        request.ParseFromString(payload)
+    except DecodeError as e:
+        raise ValueError(f"无法解析重发请求: {e}") from e
+    return request
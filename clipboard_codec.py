@@ -0,0 +1,167 @@
+import json
+import base64
+import time
+from google.protobuf.message import DecodeError
+from clipboard_pb2 import ClipboardData
+from delta_sync import DELTA_PROTOCOL_VERSION
+
+# 当前协议版本：1 = protobuf 二进制格式，2 = 支持大负载分块传输，3 = 支持文本增量同步，
+# 4 = 支持不压缩直接发送，5 = 支持超大文本流式分块
+PROTOCOL_VERSION = 5
+# 支持未压缩内容的最低协议版本，更低版本的对端总是收到zstd压缩的数据
+UNCOMPRESSED_PROTOCOL_VERSION = 4
+# 旧版客户端（不在状态消息中声明版本）视为版本0
+LEGACY_PROTOCOL_VERSION = 0
+
+CONTENT_TYPE_PROTOBUF = "application/x-copier-protobuf"
+LEGACY_CONTENT_TYPE_PREFIX = "application/x-copier-"
+
+_TYPE_TO_PROTO = {
+    "text": ClipboardData.ContentType.TEXT,
+    "image": ClipboardData.ContentType.IMAGE,
+}
+_PROTO_TO_TYPE = {value: key for key, value in _TYPE_TO_PROTO.items()}
+
+
+class ClipboardMessage:
+    """解码后的剪贴板消息"""
+
+    def __init__(self, content_type: str, content: bytes, source_id: str = "",
+                 timestamp: int = 0, version: int = PROTOCOL_VERSION, compressed: bool = True,
+                 message_id: str = "", base_hash: str = "", content_hash: str = ""):
+        self.content_type = content_type  # "text" or "image"
+        self.content = content  # compressed为True时是zstd压缩后的数据，否则是原始数据
+        self.source_id = source_id
+        self.timestamp = timestamp  # 毫秒
+        self.version = version
+        self.compressed = compressed
+        self.message_id = message_id
+        self.base_hash = base_hash  # 非空时content是相对该基准文本的增量
+        self.content_hash = content_hash  # 增量还原后完整文本的指纹
+
+    @property
+    def is_delta(self) -> bool:
+        return bool(self.base_hash)
+
+
+class ClipboardCodec:
+    """content 主题的线路编解码器
+
+    支持三种格式：
+    - 版本1及以上：ClipboardData protobuf，ContentType为 application/x-copier-protobuf
+    - 版本0（原始）：ContentType为 application/x-copier-text/image，负载为zstd压缩数据
+    - 版本0（JSON）：无ContentType，负载为 {"type", "content", "timestamp"} JSON，图片为base64 PNG
+    """
+
+    def __init__(self, source_id: str):
+        self.source_id = source_id
+
+    @staticmethod
+    def negotiate_version(peer_versions) -> int:
+        """根据在线对端声明的协议版本选择发送版本，不知道任何对端时使用所有客户端都能解析的旧版格式"""
+        versions = list(peer_versions)
+        if not versions:
+            return LEGACY_PROTOCOL_VERSION
+        return max(LEGACY_PROTOCOL_VERSION, min(min(versions), PROTOCOL_VERSION))
+
+    def encode(self, content_type: str, compressed_content: bytes,
+               version: int = PROTOCOL_VERSION, message_id: str = "",
+               base_hash: str = "", content_hash: str = "", compressed: bool = True) -> tuple[str, bytes]:
+        """编码压缩后的内容，返回(MQTT ContentType, 负载)
+
+        base_hash 非空时 compressed_content 为相对该基准文本的增量，只能发给版本3及以上的对端；
+        compressed 为False时内容未压缩，只能发给版本4及以上的对端。
+        """
+        if content_type not in _TYPE_TO_PROTO:
+            raise ValueError(f"不支持的内容类型: {content_type}")
+
+        if base_hash and version < DELTA_PROTOCOL_VERSION:
+            raise ValueError(f"协议版本{version}不支持增量内容")
+        if not compressed and version < UNCOMPRESSED_PROTOCOL_VERSION:
+            raise ValueError(f"协议版本{version}不支持未压缩内容")
+        if version < 1:
+            # 旧版客户端只认识 ContentType + zstd 原始负载
+            return f"{LEGACY_CONTENT_TYPE_PREFIX}{content_type}", compressed_content
+
+        data = ClipboardData()
+        data.type = _TYPE_TO_PROTO[content_type]
+        data.source_id = self.source_id
+        data.content = compressed_content
+        data.timestamp = int(time.time() * 1000)
+        data.version = min(version, PROTOCOL_VERSION)
+        data.message_id = message_id
+        data.base_hash = base_hash
+        data.content_hash = content_hash
+        data.compression = ClipboardData.Compression.ZSTD if compressed else ClipboardData.Compression.NONE
+        return CONTENT_TYPE_PROTOBUF, data.SerializeToString()
+
+    def encode_header(self, content_type: str, version: int = PROTOCOL_VERSION, message_id: str = "") -> bytes:
+        """编码流式分块传输的消息头（content为空，内容的zstd流由各块携带）"""
+        _, header = self.encode(content_type, b"", max(version, 1), message_id)
+        return header
+
+    def decode(self, payload: bytes, mqtt_content_type: str | None = None) -> ClipboardMessage:
+        """解码 content 主题上的负载"""
+        if mqtt_content_type == CONTENT_TYPE_PROTOBUF:
+            return self._decode_protobuf(payload)
+
+        if mqtt_content_type and mqtt_content_type.startswith(LEGACY_CONTENT_TYPE_PREFIX):
+            content_type = mqtt_content_type[len(LEGACY_CONTENT_TYPE_PREFIX):]
+            if content_type not in _TYPE_TO_PROTO:
+                raise ValueError(f"不支持的内容类型: {content_type}")
+            return ClipboardMessage(content_type, bytes(payload), version=LEGACY_PROTOCOL_VERSION)
+
+        if payload[:1] == b"{":
+            return self._decode_legacy_json(payload)
+
+        # 没有ContentType时尝试按protobuf解析
+        return self._decode_protobuf(payload)
+
+    def _decode_protobuf(self, payload: bytes) -> ClipboardMessage:
+        data = ClipboardData()
+        try:
+            data.ParseFromString(payload)
+        except DecodeError as e:
+            raise ValueError(f"无法解析protobuf消息: {e}") from e
+
+        if data.version > PROTOCOL_VERSION:
+            raise ValueError(f"不支持的协议版本: {data.version}")
+        if data.type not in _PROTO_TO_TYPE:
+            raise ValueError(f"不支持的内容类型: {data.type}")
+        if data.compression not in (ClipboardData.Compression.ZSTD, ClipboardData.Compression.NONE):
+            raise ValueError(f"不支持的编码方式: {data.compression}")
+
+        return ClipboardMessage(
+            _PROTO_TO_TYPE[data.type],
+            data.content,
+            source_id=data.source_id,
+            timestamp=data.timestamp,
+            version=data.version,
+            message_id=data.message_id,
+            base_hash=data.base_hash,
+            content_hash=data.content_hash,
+            compressed=data.compression != ClipboardData.Compression.NONE,
+        )
+
+    def _decode_legacy_json(self, payload: bytes) -> ClipboardMessage:
+        try:
+            data = json.loads(payload)
+        except ValueError as e:
+            raise ValueError(f"无法解析JSON消息: {e}") from e
+
+        content_type = data.get("type")
+        content = data.get("content", "")
+        if content_type == "text":
+            content_bytes = content.encode("utf-8")
+        elif content_type == "image":
+            content_bytes = base64.b64decode(content)
+        else:
+            raise ValueError(f"不支持的内容类型: {content_type}")
+
+        return ClipboardMessage(
+            content_type,
+            content_bytes,
+            timestamp=int(data.get("timestamp", 0)) * 1000,  # 旧版为秒级时间戳
+            version=LEGACY_PROTOCOL_VERSION,
+            compressed=False,
+        )
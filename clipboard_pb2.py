@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: clipboard.proto
+# Protobuf Python Version: 4.25.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0f\x63lipboard.proto\x12\x06\x63opier\"\xc4\x02\n\rClipboardData\x12/\n\x04type\x18\x01 \x01(\x0e\x32!.copier.ClipboardData.ContentType\x12\x11\n\tsource_id\x18\x02 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x03 \x01(\x0c\x12\x11\n\ttimestamp\x18\x04 \x01(\x03\x12\x0f\n\x07version\x18\x05 \x01(\r\x12\x12\n\nmessage_id\x18\x06 \x01(\t\x12\x11\n\tbase_hash\x18\x07 \x01(\t\x12\x14\n\x0c\x63ontent_hash\x18\x08 \x01(\t\x12\x36\n\x0b\x63ompression\x18\t \x01(\x0e\x32!.copier.ClipboardData.Compression\"\"\n\x0b\x43ontentType\x12\x08\n\x04TEXT\x10\x00\x12\t\n\x05IMAGE\x10\x01\"!\n\x0b\x43ompression\x12\x08\n\x04ZSTD\x10\x00\x12\x08\n\x04NONE\x10\x01\"\xa1\x01\n\x0e\x43lipboardChunk\x12\x13\n\x0btransfer_id\x18\x01 \x01(\t\x12\x10\n\x08sequence\x18\x02 \x01(\r\x12\r\n\x05total\x18\x03 \x01(\r\x12\x12\n\ntotal_size\x18\x04 \x01(\x04\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\x12\x10\n\x08\x63hecksum\x18\x06 \x01(\x0c\x12%\n\x06header\x18\x07 \x01(\x0b\x32\x15.copier.ClipboardData\"P\n\x12\x43hunkResendRequest\x12\x13\n\x0btransfer_id\x18\x01 \x01(\t\x12\x14\n\x0crequester_id\x18\x02 \x01(\t\x12\x0f\n\x07missing\x18\x03 \x03(\r\"H\n\tDeltaNack\x12\x12\n\nmessage_id\x18\x01 \x01(\t\x12\x14\n\x0crequester_id\x18\x02 \x01(\t\x12\x11\n\tbase_hash\x18\x03 \x01(\tb\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'clipboard_pb2', _globals)
+if _descriptor._USE_C_DESCRIPTORS == False:
+  DESCRIPTOR._options = None
+  _globals['_CLIPBOARDDATA']._serialized_start=28
+  _globals['_CLIPBOARDDATA']._serialized_end=352
+  _globals['_CLIPBOARDDATA_CONTENTTYPE']._serialized_start=283
+  _globals['_CLIPBOARDDATA_CONTENTTYPE']._serialized_end=317
+  _globals['_CLIPBOARDDATA_COMPRESSION']._serialized_start=319
+  _globals['_CLIPBOARDDATA_COMPRESSION']._serialized_end=352
+  _globals['_CLIPBOARDCHUNK']._serialized_start=355
+  _globals['_CLIPBOARDCHUNK']._serialized_end=516
+  _globals['_CHUNKRESENDREQUEST']._serialized_start=518
+  _globals['_CHUNKRESENDREQUEST']._serialized_end=598
+  _globals['_DELTANACK']._serialized_start=600
+  _globals['_DELTANACK']._serialized_end=672
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+import zstandard
+from config import CONFIG_DIR
+
+logger = logging.getLogger(__name__)
+
+DICTIONARY_DIR = os.path.join(CONFIG_DIR, 'dicts')
+
+DICTIONARY_SIZE = 16 * 1024  # 训练出的字典大小
+DICTIONARY_MIN_SAMPLES = 100  # 训练所需的最少样本数
+DICTIONARY_SAMPLE_MAX_CHARS = 8 * 1024  # 只用短文本训练，长文本不依赖字典也能压缩得很好
+DICTIONARY_MAX_INPUT = 32 * 1024  # 超过该大小的内容不使用字典压缩
+
+
+class CompressionDictionaries:
+    """管理zstd压缩字典：本地训练、从对端接收、保存在 ~/.copier/dicts
+
+    字典以zstd内嵌的dict_id标识，压缩帧头中也带有该ID，解压时据此选择字典。
+    """
+
+    def __init__(self, directory: str = DICTIONARY_DIR, max_dictionaries: int = 4):
+        self.directory = directory
+        self.max_dictionaries = max_dictionaries
+        self._dictionaries = {}  # dict_id -> ZstdCompressionDict，按加入顺序，最新的在后
+        self._lock = threading.Lock()  # 训练在后台线程，接收在MQTT线程
+
+    def load(self):
+        """从磁盘加载已保存的字典"""
+        if not os.path.isdir(self.directory):
+            return
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith('.zdict')]
+        paths.sort(key=os.path.getmtime)
+        for path in paths:
+            try:
+                with open(path, 'rb') as f:
+                    dictionary = zstandard.ZstdCompressionDict(f.read())
+                dict_id = dictionary.dict_id()
+                if dict_id:
+                    with self._lock:
+                        self._dictionaries[dict_id] = dictionary
+            except Exception as e:
+                logger.error("加载压缩字典 %s 时出错: %s", path, e)
+
+    def add(self, data: bytes, expected_id: int | None = None) -> int:
+        """加入一个字典并保存到磁盘，返回dict_id"""
+        dictionary = zstandard.ZstdCompressionDict(data)
+        dict_id = dictionary.dict_id()
+        if not dict_id:
+            raise ValueError("不是有效的zstd字典")
+        if expected_id is not None and dict_id != expected_id:
+            raise ValueError(f"字典ID不匹配: {dict_id} != {expected_id}")
+
+        with self._lock:
+            if dict_id in self._dictionaries:
+                return dict_id
+            self._dictionaries[dict_id] = dictionary
+            removed = []
+            while len(self._dictionaries) > self.max_dictionaries:
+                oldest = next(iter(self._dictionaries))
+                del self._dictionaries[oldest]
+                removed.append(oldest)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(dict_id)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(dictionary.as_bytes())
+        os.replace(temp_path, path)
+        for old_id in removed:
+            try:
+                os.remove(self._path(old_id))
+            except OSError:
+                pass
+        return dict_id
+
+    def train(self, samples: list[bytes], dict_size: int = DICTIONARY_SIZE) -> int | None:
+        """用样本训练新字典，样本不足时返回None"""
+        if len(samples) < DICTIONARY_MIN_SAMPLES:
+            return None
+        dictionary = zstandard.train_dictionary(dict_size, samples)
+        return self.add(dictionary.as_bytes())
+
+    def get(self, dict_id: int) -> zstandard.ZstdCompressionDict | None:
+        with self._lock:
+            return self._dictionaries.get(dict_id)
+
+    def data(self, dict_id: int) -> bytes | None:
+        """字典的原始字节，用于发布给对端"""
+        dictionary = self.get(dict_id)
+        return dictionary.as_bytes() if dictionary is not None else None
+
+    def ids(self) -> list[int]:
+        """全部字典ID，最新的在后"""
+        with self._lock:
+            return list(self._dictionaries)
+
+    def select(self, peer_dictionaries) -> int | None:
+        """选择所有在线对端都已拥有的最新字典，没有时返回None
+
+        还不知道任何对端时也返回None，未声明字典的对端无法解压用字典压缩的数据。
+        """
+        peer_dictionaries = list(peer_dictionaries)
+        if not peer_dictionaries:
+            return None
+        for dict_id in reversed(self.ids()):
+            if all(dict_id in ids for ids in peer_dictionaries):
+                return dict_id
+        return None
+
+    def _path(self, dict_id: int) -> str:
+        return os.path.join(self.directory, f"{dict_id}.zdict")
@@ -1,5 +1,13 @@
 import json
+import logging
 import os
+import platform
+from types import MappingProxyType
+from PySide6.QtCore import QObject, QFileSystemWatcher, Signal
+
+logger = logging.getLogger(__name__)
+
+IS_WINDOWS = platform.system().lower() == 'windows'
 
 # 获取用户主目录
 HOME_DIR = os.path.expanduser('~')
@@ -13,27 +21,205 @@ DEFAULT_CONFIG = {
         "port": 1883,
         "username": "",
         "password": "",
-        "topic_prefix": "copier/clipboard"
+        "topic_prefix": "copier/clipboard",
+        "loop": "asyncio",   # 网络循环：asyncio（专用事件循环线程）或 thread（paho自带线程）
+        "max_inflight": 20,  # 同时等待确认的发布数，超过的排队发送
+        "reconnect_min_delay": 1,   # 断开后第一次重连的最长等待（秒），之后每次翻倍
+        "reconnect_max_delay": 60   # 重连等待的上限（秒）
+    },
+    "history": {
+        "max_stored": 5000   # 保存和显示的条目数
+    },
+    "image": {
+        "format": "auto",    # auto: 截图用无损WebP、照片用JPEG；也可固定为 webp 或 jpeg
+        "max_size": 1600 if IS_WINDOWS else 1920,  # 最长边超过该值时缩小
+        "quality": 70 if IS_WINDOWS else 80,       # 有损WebP和JPEG的质量
+        "webp_method": 1,    # WebP编码方法0-6，越大越慢、文件越小
+        "lossless_effort": 10  # 无损WebP的压缩力度0-100
+    },
+    "metrics": {
+        "http_port": 0,      # 大于0时在 127.0.0.1 该端口提供 /metrics（Prometheus格式）和 /metrics.json
+        "dump_interval": 0   # 大于0时每隔该秒数把指标写入 ~/.copier/metrics.json，跟踪写入 traces.json
+    },
+    "tracing": {
+        "enabled": True      # 用MQTT v5用户属性跟踪端到端同步延迟并估计对端的时钟偏差
+    },
+    "logging": {
+        "level": "INFO",     # DEBUG 时输出每条消息的收发细节
+        "console": True,     # 同时输出到控制台（没有控制台的打包版本只写 ~/.copier/logs）
+        "max_bytes": 5 * 1024 * 1024,  # 单个日志文件的大小上限，超过时轮转
+        "backup_count": 5,   # 保留的旧日志文件数
+        "rate_limit_burst": 10,      # 同一条消息在一个窗口内最多输出的次数，0为不限制
+        "rate_limit_interval": 60    # 重复消息限制的窗口（秒）
     }
 }
 
-def load_config():
-    # 确保配置目录存在
-    if not os.path.exists(CONFIG_DIR):
+# 修改后无需重新连接即可生效的mqtt设置
+LIVE_MQTT_SETTINGS = ("reconnect_min_delay", "reconnect_max_delay", "chunk_size")
+
+
+def _freeze(value):
+    """递归转换为只读的映射和元组"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class ConfigSnapshot:
+    """某一时刻配置文件内容的只读快照，各部分为只读映射，可直接用 .get() 读取"""
+
+    def __init__(self, data: dict):
+        self._data = _freeze(data)
+
+    def get(self, key: str, default=None):
+        return self._data.get(key, default)
+
+    @property
+    def mqtt(self):
+        return self._data.get('mqtt', MappingProxyType({}))
+
+    @property
+    def history(self):
+        return self._data.get('history', MappingProxyType({}))
+
+    @property
+    def image(self):
+        return self._data.get('image', MappingProxyType({}))
+
+    @property
+    def outbox(self):
+        return self._data.get('outbox', MappingProxyType({}))
+
+    def to_dict(self) -> dict:
+        """可修改的副本，修改后用 save_config 保存"""
+        return _thaw(self._data)
+
+    def changed_sections(self, other: 'ConfigSnapshot') -> set:
+        """与另一个快照相比内容不同的顶层部分"""
+        keys = set(self._data) | set(other._data)
+        return {key for key in keys if self._data.get(key) != other._data.get(key)}
+
+
+class ConfigService(QObject):
+    """缓存配置文件的解析结果，文件变化后重新读取并通知订阅者
+
+    load_config 只返回缓存的快照；调用 watch 后由 QFileSystemWatcher 发现外部修改，
+    未监视时（如命令行工具）每次按修改时间和大小检查文件。
+    """
+    changed = Signal(object, object)  # 新快照, 变化的顶层部分(set)
+
+    def __init__(self, path: str = CONFIG_FILE, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self._snapshot = None
+        self._stamp = None  # 读取时文件的(修改时间, 大小)
+        self._watcher = None
+
+    def _file_stamp(self):
         try:
-            os.makedirs(CONFIG_DIR)
-        except Exception as e:
-            print(f"无法创建配置目录: {e}")
-            return DEFAULT_CONFIG
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
 
-    if os.path.exists(CONFIG_FILE):
+    def _read(self, stamp) -> ConfigSnapshot | None:
+        """读取配置文件，文件不存在时返回默认配置，读取失败返回None"""
+        if stamp is None:
+            return ConfigSnapshot(DEFAULT_CONFIG)
         try:
-            with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
+            with open(self.path, 'r') as f:
+                return ConfigSnapshot(json.load(f))
         except Exception as e:
-            print(f"无法读取配置文件: {e}")
-            return DEFAULT_CONFIG
-    return DEFAULT_CONFIG
+            logger.warning("无法读取配置文件: %s", e)
+            return None
+
+    def snapshot(self) -> ConfigSnapshot:
+        if self._snapshot is None:
+            # 确保配置目录存在
+            if not os.path.exists(CONFIG_DIR):
+                try:
+                    os.makedirs(CONFIG_DIR)
+                except Exception as e:
+                    logger.warning("无法创建配置目录: %s", e)
+            self._stamp = self._file_stamp()
+            self._snapshot = self._read(self._stamp) or ConfigSnapshot(DEFAULT_CONFIG)
+        elif self._watcher is None:
+            self.reload()
+        return self._snapshot
+
+    def reload(self):
+        """文件变化时重新读取；读取失败（如编辑器写了一半）时保留原来的配置"""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        snapshot = self._read(stamp)
+        if snapshot is None:
+            return
+        self._stamp = stamp
+        self._update(snapshot)
+
+    def _update(self, snapshot: ConfigSnapshot):
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is None:
+            return
+        sections = snapshot.changed_sections(previous)
+        if sections:
+            logger.info("配置已更新: %s", ', '.join(sorted(sections)))
+            self.changed.emit(snapshot, sections)
+
+    def watch(self):
+        """监视配置文件的修改（需要Qt事件循环）"""
+        if self._watcher is not None:
+            return
+        self.snapshot()
+        self._watcher = QFileSystemWatcher(self)
+        # 替换保存会换掉文件，同时监视目录以便重新加入
+        self._watcher.addPath(os.path.dirname(self.path))
+        self._watch_file()
+        self._watcher.fileChanged.connect(self._on_path_changed)
+        self._watcher.directoryChanged.connect(self._on_path_changed)
+
+    def _watch_file(self):
+        if os.path.exists(self.path) and self.path not in self._watcher.files():
+            self._watcher.addPath(self.path)
+
+    def _on_path_changed(self, path):
+        self._watch_file()
+        self.reload()
+
+    def save(self, config: dict):
+        """先写临时文件再替换，其他进程不会读到写了一半的配置"""
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(config, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._stamp = self._file_stamp()
+        self._update(ConfigSnapshot(config))
+
+
+config_service = ConfigService()
+
+
+def load_config() -> ConfigSnapshot:
+    """当前配置的只读快照，文件未变化时不重新解析"""
+    return config_service.snapshot()
 
 def save_config(config):
     # 确保配置目录存在
@@ -41,11 +227,10 @@ def save_config(config):
         try:
             os.makedirs(CONFIG_DIR)
         except Exception as e:
-            print(f"无法创建配置目录: {e}")
+            logger.warning("无法创建配置目录: %s", e)
             return
 
     try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
+        config_service.save(config)
     except Exception as e:
-        print(f"无法保存配置文件: {e}")
+        logger.warning("无法保存配置文件: %s", e)
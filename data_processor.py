@@ -1,89 +1,196 @@
 import platform
 import zstandard
-from PIL import Image
 import io
 import base64
 from PySide6.QtGui import QImage
-from PySide6.QtCore import QBuffer, QByteArray, QIODevice
 import time
+import threading
+from compression_dictionaries import CompressionDictionaries, DICTIONARY_MAX_INPUT
+from adaptive_compression import CompressionStats, DEFAULT_LEVEL, choose_level
+from chunked_transfer import DEFAULT_MAX_DECOMPRESSED_SIZE
+from text_chunks import iter_utf8, utf8_length
+from image_encoding import ImageEncodeSettings, encode_image, qimage_to_pil
+from metrics import metrics
+
+# 超过该字符数的文本流式压缩为分块，不生成完整的UTF-8副本和压缩副本
+STREAM_TEXT_THRESHOLD = 8 * 1024 * 1024
 
 class DataProcessor:
-    def __init__(self):
-        self.compressor = zstandard.ZstdCompressor(level=3)  # 压缩级别1-22，数字越大压缩率越高但速度越慢
-        self.decompressor = zstandard.ZstdDecompressor()
+    def __init__(self, dictionaries: CompressionDictionaries | None = None,
+                 image_settings: ImageEncodeSettings | None = None):
+        # zstd压缩器不能在多个线程间并发使用，每个线程各持有一份
+        self._local = threading.local()
         self.is_windows = platform.system().lower() == 'windows'
+        self.dictionaries = dictionaries
+        self.image_settings = image_settings or ImageEncodeSettings.from_config()
+        self.active_dictionary_id = None  # 所有在线对端都拥有的字典，短文本用它压缩
+        self.stats = CompressionStats()  # 各编码方式的耗时统计
+        
+    @property
+    def compressor(self) -> zstandard.ZstdCompressor:
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=3)  # 压缩级别1-22，数字越大压缩率越高但速度越慢
+            self._local.compressor = compressor
+        return compressor
+        
+    @property
+    def decompressor(self) -> zstandard.ZstdDecompressor:
+        decompressor = getattr(self._local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor()
+            self._local.decompressor = decompressor
+        return decompressor
+        
+    def _level_compressor(self, level: int) -> zstandard.ZstdCompressor:
+        # 自适应压缩使用的各级别压缩器，同样每个线程一份
+        compressors = getattr(self._local, 'level_compressors', None)
+        if compressors is None:
+            compressors = {}
+            self._local.level_compressors = compressors
+        compressor = compressors.get(level)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=level)
+            compressors[level] = compressor
+        return compressor
+        
+    def _dictionary_codec(self, kind: str, dict_id: int):
+        # 每个线程按字典ID缓存压缩器/解压器
+        cache = getattr(self._local, kind, None)
+        if cache is None:
+            cache = {}
+            setattr(self._local, kind, cache)
+        codec = cache.get(dict_id)
+        if codec is None:
+            dictionary = self.dictionaries.get(dict_id) if self.dictionaries is not None else None
+            if dictionary is None:
+                raise ValueError(f"缺少压缩字典: {dict_id}")
+            if kind == 'dict_compressors':
+                codec = zstandard.ZstdCompressor(level=3, dict_data=dictionary)
+            else:
+                codec = zstandard.ZstdDecompressor(dict_data=dictionary)
+            cache[dict_id] = codec
+        return codec
         
-    def compress_data(self, data: bytes) -> bytes:
-        """压缩二进制数据"""
+    def compress_data(self, data: bytes, dict_id: int | None = None) -> bytes:
+        """压缩二进制数据，指定dict_id时使用对应的字典"""
+        if dict_id:
+            return self._dictionary_codec('dict_compressors', dict_id).compress(data)
         return self.compressor.compress(data)
         
     def decompress_data(self, compressed_data: bytes) -> bytes:
-        """解压缩二进制数据"""
+        """解压缩二进制数据，根据帧头中的dict_id选择字典"""
+        params = zstandard.get_frame_parameters(compressed_data)
+        if params.content_size != zstandard.CONTENTSIZE_UNKNOWN and \
+                params.content_size > DEFAULT_MAX_DECOMPRESSED_SIZE:
+            raise ValueError(f"解压后数据过大: {params.content_size} 字节")
+        dict_id = params.dict_id
+        if dict_id:
+            return self._dictionary_codec('dict_decompressors', dict_id).decompress(compressed_data)
         return self.decompressor.decompress(compressed_data)
+        
+    @staticmethod
+    def dictionary_id(compressed_data: bytes) -> int:
+        """压缩数据使用的字典ID，未使用字典时为0"""
+        return zstandard.get_frame_parameters(compressed_data).dict_id
+        
+    def without_dictionary(self, compressed_data: bytes) -> bytes:
+        """把使用字典压缩的数据改为普通压缩，用于发送给没有该字典的对端"""
+        if not self.dictionary_id(compressed_data):
+            return compressed_data
+        return self.compress_data(self.decompress_data(compressed_data))
     
+    def encode_image(self, qimage: QImage) -> tuple[bytes, str]:
+        """缩放并编码图片，返回(编码后的数据, 编码方式)"""
+        return encode_image(qimage_to_pil(qimage), self.image_settings)
+
     def optimize_image(self, qimage: QImage) -> bytes:
         """优化并压缩图片"""
-        # 将QImage转换为bytes
-        byte_array = QByteArray()
-        buffer = QBuffer(byte_array)
-        buffer.open(QBuffer.OpenModeFlag.WriteOnly)  # 修复：使用正确的枚举值
-        qimage.save(buffer, "PNG")
-        buffer.close()
-        
-        # 使用PIL进行图片优化
-        img_data = byte_array.data()
-        pil_image = Image.open(io.BytesIO(img_data))
-        
-        # 转换为RGB模式（如果是RGBA，移除透明通道）
-        if pil_image.mode == 'RGBA':
-            background = Image.new('RGB', pil_image.size, (255, 255, 255))
-            background.paste(pil_image, mask=pil_image.split()[3])
-            pil_image = background
-        
-        # 根据操作系统调整优化参数
-        if self.is_windows:
-            max_size = 1600  # Windows下使用较小的最大尺寸
-            quality = 70     # 降低图片质量以提高性能
-        else:
-            max_size = 1920  # macOS下保持原有设置
-            quality = 80
-        
-        # 优化图片大小
-        if max(pil_image.size) > max_size:
-            ratio = max_size / max(pil_image.size)
-            new_size = tuple(int(dim * ratio) for dim in pil_image.size)
-            pil_image = pil_image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # 保存为WebP格式
-        output = io.BytesIO()
-        pil_image.save(output, format='WebP', quality=quality, optimize=True)
-        return output.getvalue()
+        return self.encode_image(qimage)[0]
     
     def restore_image(self, image_data: bytes) -> QImage:
         """从优化的图片数据恢复QImage"""
-        pil_image = Image.open(io.BytesIO(image_data))
-        
-        # 将PIL Image转换回QImage
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format='PNG')
-        qimage = QImage()
-        qimage.loadFromData(buffer.getvalue())
-        return qimage
+        # 优先由Qt的图片插件直接解码（WebP或JPEG），避免经PIL编码再解码PNG；
+        # 部分打包环境缺少Qt的WebP插件，此时回退到PIL解码
+        qimage = QImage.fromData(image_data)
+        if not qimage.isNull():
+            return qimage
+        from PIL import Image
+        return self.pil_to_qimage(Image.open(io.BytesIO(image_data)))
 
-    def process_clipboard_data(self, content_type: str, content: str | QImage) -> tuple[str, bytes]:
-        """处理剪贴板数据，返回(类型, 压缩后的二进制数据)"""
+    @staticmethod
+    def pil_to_qimage(pil_image: 'Image.Image') -> QImage:
+        """把PIL解码出的像素直接包装为QImage，不经过PNG"""
+        if pil_image.mode not in ('RGB', 'RGBA'):
+            pil_image = pil_image.convert('RGBA' if 'A' in pil_image.getbands() else 'RGB')
+        image_format = QImage.Format.Format_RGBA8888 if pil_image.mode == 'RGBA' else QImage.Format.Format_RGB888
+        data = pil_image.tobytes()
+        bytes_per_line = pil_image.width * len(pil_image.mode)
+        # QImage不持有data的引用，copy()让返回的图片拥有自己的像素缓冲
+        return QImage(data, pil_image.width, pil_image.height, bytes_per_line, image_format).copy()
+
+    def compress_adaptive(self, data: bytes, dict_id: int | None = None) -> tuple[bytes, bool]:
+        """按内容选择编码方式，返回(数据, 是否已压缩)
+
+        不可压缩的数据（如WebP图片）直接返回原始数据；大段可压缩文本使用更高的压缩级别。
+        """
+        start = time.perf_counter()
+        if dict_id:
+            compressed = self.compress_data(data, dict_id)
+            elapsed = time.perf_counter() - start
+            if len(compressed) < len(data):
+                self.stats.record("zstd-dict", len(data), len(compressed), elapsed)
+                return compressed, True
+            self.stats.record("none", len(data), len(data), elapsed)
+            return data, False
+            
+        level = choose_level(data, self._level_compressor(1))
+        probed = time.perf_counter()
+        self.stats.record("probe", len(data), 0, probed - start)
+        if level is None:
+            self.stats.record("none", len(data), len(data), 0.0)
+            return data, False
+            
+        compressor = self.compressor if level == DEFAULT_LEVEL else self._level_compressor(level)
+        compressed = compressor.compress(data)
+        self.stats.record(f"zstd-{level}", len(data), len(compressed), time.perf_counter() - probed)
+        return compressed, True
+        
+    def compress_text_chunks(self, text: str, chunk_size: int) -> list[bytes]:
+        """流式压缩大段文本，输出按chunk_size切分，可直接作为分块传输的数据"""
+        start = time.perf_counter()
+        size = utf8_length(text)
+        # 帧头写入原始大小，拼接后的数据也能被普通的 decompress_data 解压
+        chunker = self.compressor.chunker(size=size, chunk_size=chunk_size)
+        chunks = []
+        for part in iter_utf8(text):
+            chunks.extend(chunker.compress(part))
+        chunks.extend(chunker.finish())
+        elapsed = time.perf_counter() - start
+        self.stats.record("zstd-stream", size, sum(len(chunk) for chunk in chunks), elapsed)
+        metrics.stage("compress").observe(elapsed)
+        return chunks
+        
+    def process_clipboard_data(self, content_type: str, content: str | QImage) -> tuple[str, bytes, bool]:
+        """处理剪贴板数据，返回(类型, 编码后的二进制数据, 是否已压缩)"""
         if content_type == "text":
             text_bytes = content.encode('utf-8')
-            compressed = self.compress_data(text_bytes)
-            return "text", compressed
+            # 字典对短文本效果明显，长文本本身已有足够的上下文
+            dict_id = self.active_dictionary_id if len(text_bytes) <= DICTIONARY_MAX_INPUT else None
+            with metrics.stage("compress").time():
+                data, compressed = self.compress_adaptive(text_bytes, dict_id)
+            return "text", data, compressed
         else:  # image
-            optimized = self.optimize_image(content)
-            compressed = self.compress_data(optimized)
-            return "image", compressed
+            start = time.perf_counter()
+            optimized, codec = self.encode_image(content)
+            self.stats.record(codec, content.sizeInBytes(), len(optimized), time.perf_counter() - start)
+            with metrics.stage("compress").time():
+                data, compressed = self.compress_adaptive(optimized)
+            return "image", data, compressed
     
-    def restore_clipboard_data(self, content_type: str, compressed_data: bytes) -> str | QImage:
-        """还原剪贴板数据"""
-        decompressed = self.decompress_data(compressed_data)
+    def restore_clipboard_data(self, content_type: str, compressed_data: bytes, compressed: bool = True) -> str | QImage:
+        """还原剪贴板数据，compressed为False时表示未压缩的数据（不可压缩的内容或旧版JSON消息）"""
+        decompressed = self.decompress_data(compressed_data) if compressed else compressed_data
         if content_type == "text":
             return decompressed.decode('utf-8')
         else:  # image
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class DedupCache:
+    """有容量和过期时间限制的去重缓存（LRU）
+
+    add/contains 均为O(1)；超过容量时淘汰最久未使用的条目，
+    超过ttl秒未被访问的条目视为不存在。
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> 最后访问时间
+        self._lock = threading.Lock()  # 发送在GUI线程，接收在MQTT线程
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def add(self, key: str):
+        """加入或刷新一个条目"""
+        with self._lock:
+            self._entries[key] = time.monotonic()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def contains(self, key: str) -> bool:
+        """检查条目是否存在，命中时刷新其访问时间"""
+        with self._lock:
+            last_seen = self._entries.get(key)
+            now = time.monotonic()
+            if last_seen is None or now - last_seen > self.ttl:
+                if last_seen is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return False
+            self._entries[key] = now
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+
+    def __contains__(self, key: str) -> bool:
+        return self.contains(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def purge_expired(self):
+        """清理所有过期条目"""
+        with self._lock:
+            now = time.monotonic()
+            # 条目按访问时间有序，遇到未过期的即可停止
+            while self._entries:
+                key, last_seen = next(iter(self._entries.items()))
+                if now - last_seen <= self.ttl:
+                    break
+                del self._entries[key]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """返回命中统计"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
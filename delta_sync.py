@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+import zstandard
+from google.protobuf.message import DecodeError
+from clipboard_pb2 import DeltaNack
+from fingerprint import text_fingerprint
+
+# 支持增量同步的最低协议版本
+DELTA_PROTOCOL_VERSION = 3
+
+DELTA_MIN_SIZE = 4 * 1024  # 小于4KB的文本直接完整发送
+DELTA_MAX_CANDIDATES = 3  # 每次最多尝试的基准文本数
+DELTA_MAX_RATIO = 0.5  # 增量不小于完整压缩数据的一半时不使用增量
+
+
+class DeltaBaseCache:
+    """最近通过MQTT发送或接收过的文本，作为增量的基准
+
+    按文本指纹索引，双方对同一文本计算出的指纹一致；受条目数和总字节数限制。
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # 指纹 -> UTF-8文本
+        self._size = 0
+        self._lock = threading.Lock()  # 编码在后台线程，接收在MQTT线程
+
+    def add(self, text: str, fingerprint: str | None = None) -> str:
+        """加入一条文本，返回其指纹"""
+        if fingerprint is None:
+            fingerprint = text_fingerprint(text)
+        if len(text) > self.max_bytes:
+            return fingerprint  # 字符数已超过上限，无需编码
+        data = text.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return fingerprint
+        with self._lock:
+            old = self._entries.pop(fingerprint, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[fingerprint] = data
+            self._size += len(data)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._size -= len(dropped)
+        return fingerprint
+
+    def get(self, fingerprint: str) -> bytes | None:
+        with self._lock:
+            data = self._entries.get(fingerprint)
+            if data is not None:
+                self._entries.move_to_end(fingerprint)
+            return data
+
+    def recent(self) -> list[tuple[str, bytes]]:
+        """返回全部条目，最新的在前"""
+        with self._lock:
+            return list(reversed(self._entries.items()))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DeltaCodec:
+    """以基准文本作为zstd原始内容字典计算增量
+
+    修改过的大段文本与基准大部分相同，zstd可以直接引用字典中的内容，
+    增量通常只有完整压缩数据的几个百分点。
+    """
+
+    def __init__(self, cache: DeltaBaseCache, level: int = 3):
+        self.cache = cache
+        self.level = level
+
+    def encode(self, text: str, full_size: int) -> tuple[str, str, bytes] | None:
+        """为文本选择最合适的基准计算增量，返回(基准指纹, 文本指纹, 增量)；不划算时返回None
+
+        full_size 为完整压缩后的大小，用于判断增量是否值得发送。
+        """
+        data = text.encode("utf-8")
+        if len(data) < DELTA_MIN_SIZE:
+            return None
+
+        target = text_fingerprint(text)
+        best = None
+        tried = 0
+        for base_hash, base in self.cache.recent():
+            if tried >= DELTA_MAX_CANDIDATES:
+                break
+            # 大小相差太多的文本不太可能相似
+            if base_hash == target or not len(data) // 2 <= len(base) <= len(data) * 2:
+                continue
+            tried += 1
+            delta = self._compress(base, data)
+            if best is None or len(delta) < len(best[1]):
+                best = (base_hash, delta)
+
+        if best is None or len(best[1]) >= full_size * DELTA_MAX_RATIO:
+            return None
+        return best[0], target, best[1]
+
+    def decode(self, base: bytes, delta: bytes) -> bytes:
+        decompressor = zstandard.ZstdDecompressor(dict_data=self._dictionary(base))
+        return decompressor.decompress(delta)
+
+    def _compress(self, base: bytes, data: bytes) -> bytes:
+        compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._dictionary(base))
+        return compressor.compress(data)
+
+    @staticmethod
+    def _dictionary(base: bytes) -> zstandard.ZstdCompressionDict:
+        return zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+
+class DeltaFallbackCache:
+    """发送方保留最近以增量发出的完整内容，接收方无法还原时重发"""
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # message_id -> (content_type, 完整内容, 是否已压缩)
+        self._lock = threading.Lock()
+
+    def add(self, message_id: str, content_type: str, content: bytes, compressed: bool = True):
+        with self._lock:
+            self._entries[message_id] = (content_type, content, compressed)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, message_id: str) -> tuple[str, bytes, bool] | None:
+        """取出待重发的内容；同一消息只重发一次"""
+        with self._lock:
+            return self._entries.pop(message_id, None)
+
+
+def build_delta_nack(message_id: str, requester_id: str, base_hash: str) -> bytes:
+    nack = DeltaNack()
+    nack.message_id = message_id
+    nack.requester_id = requester_id
+    nack.base_hash = base_hash
+    return nack.SerializeToString()
+
+
+def parse_delta_nack(payload: bytes) -> DeltaNack:
+    nack = DeltaNack()
+    try:
+        nack.ParseFromString(payload)
+    except DecodeError as e:
+        raise ValueError(f"无法解析增量重发请求: {e}") from e
+    if not nack.message_id:
+        raise ValueError("增量重发请求缺少message_id")
+    return nack
@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+from collections import deque
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Qt, Signal
+from PySide6.QtGui import QImage
+from data_processor import STREAM_TEXT_THRESHOLD
+from fingerprint import bytes_fingerprint, chunks_fingerprint
+from tracing import now_us
+
+logger = logging.getLogger(__name__)
+
+
+class EncodeJob:
+    """待编码的剪贴板内容"""
+
+    def __init__(self, content_type: str, content, timestamp: int, sequence: int,
+                 fingerprint: str | None = None, captured_at: int | None = None):
+        self.content_type = content_type  # "text" or "image"
+        self.content = content  # str 或 QImage
+        self.timestamp = timestamp  # 毫秒
+        self.sequence = sequence
+        self.fingerprint = fingerprint  # 捕获时计算的内容指纹
+        self.captured_at = captured_at  # 读取剪贴板的时间（微秒），用于端到端延迟跟踪
+
+
+class EncodeResult:
+    """后台编码完成后的结果"""
+
+    def __init__(self, job: EncodeJob, compressed: bytes | None, content_hash: str, preview, elapsed: float,
+                 delta: tuple[str, str, bytes] | None = None, is_compressed: bool = True,
+                 compressed_chunks: list[bytes] | None = None):
+        self.content_type = job.content_type
+        self.content = job.content
+        self.timestamp = job.timestamp
+        self.sequence = job.sequence
+        self.fingerprint = job.fingerprint
+        self.captured_at = job.captured_at
+        self.encoded_at = now_us()  # 在工作线程中编码完成的时间
+        self.compressed = compressed  # 可直接发送的数据
+        self.is_compressed = is_compressed  # 为False时内容不可压缩，compressed中是原始数据
+        self.compressed_chunks = compressed_chunks  # 超大文本的流式压缩结果（此时compressed为None）
+        self.content_hash = content_hash  # 压缩数据的指纹，与接收端的去重哈希一致
+        self.preview = preview  # 文本为原文，图片为缩放后用于预览/历史的QImage
+        self.elapsed = elapsed  # 后台处理耗时（秒）
+        self.delta = delta  # 文本相对最近同步内容的增量 (基准指纹, 文本指纹, 增量)，不划算时为None
+
+    @property
+    def compressed_size(self) -> int:
+        if self.compressed_chunks is not None:
+            return sum(len(chunk) for chunk in self.compressed_chunks)
+        return len(self.compressed)
+
+
+class _EncodeSignals(QObject):
+    # QRunnable 不是 QObject，需要单独的信号载体
+    finished = Signal(object)
+    failed = Signal(object, str)
+
+
+class _EncodeTask(QRunnable):
+    def __init__(self, job: EncodeJob, data_processor, signals: _EncodeSignals, delta_codec=None,
+                 stream_chunk_size: int | None = None):
+        super().__init__()
+        self.job = job
+        self.data_processor = data_processor
+        self.signals = signals
+        self.delta_codec = delta_codec
+        self.stream_chunk_size = stream_chunk_size
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            job = self.job
+            if job.content_type == "image":
+                preview = job.content.scaled(800, 800, Qt.AspectRatioMode.KeepAspectRatio,
+                                             Qt.TransformationMode.SmoothTransformation)
+            else:
+                preview = job.content
+            if job.content_type == "text" and self.stream_chunk_size and len(job.content) >= STREAM_TEXT_THRESHOLD:
+                # 超大文本直接流式压缩为分块
+                chunks = self.data_processor.compress_text_chunks(job.content, self.stream_chunk_size)
+                self.signals.finished.emit(
+                    EncodeResult(job, None, chunks_fingerprint(chunks), preview, time.perf_counter() - start,
+                                 compressed_chunks=chunks))
+                return
+            _, compressed, is_compressed = self.data_processor.process_clipboard_data(job.content_type, job.content)
+            content_hash = bytes_fingerprint(compressed)
+            delta = None
+            if job.content_type == "text" and self.delta_codec is not None:
+                try:
+                    delta = self.delta_codec.encode(job.content, len(compressed))
+                except Exception as e:
+                    logger.error("计算增量时出错，改为完整发送: %s", e)
+            self.signals.finished.emit(
+                EncodeResult(job, compressed, content_hash, preview, time.perf_counter() - start, delta,
+                             is_compressed))
+        except Exception as e:
+            self.signals.failed.emit(self.job, str(e))
+
+
+class EncodePipeline(QObject):
+    """在后台线程中完成缩放、优化、压缩和哈希，结果通过信号回到GUI线程
+
+    同一时间只处理一个任务；处理期间到来的新内容进入有界队列，
+    队列满时丢弃最旧的内容，因此快速连续复制时只会发送最新的内容。
+    """
+
+    finished = Signal(object)  # EncodeResult
+    failed = Signal(object, str)  # (EncodeJob, 错误信息)
+
+    MAX_PENDING = 1
+
+    def __init__(self, data_processor, max_pending: int = MAX_PENDING, delta_codec=None,
+                 stream_chunk_size: int | None = None, parent=None):
+        super().__init__(parent)
+        self.data_processor = data_processor
+        self.delta_codec = delta_codec  # 设置后文本内容会额外计算增量
+        self.stream_chunk_size = stream_chunk_size  # 设置后超大文本按该大小流式压缩为分块
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.pending = deque(maxlen=max(1, max_pending))
+        self.coalesced_count = 0
+        self.busy = False
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+        # 信号载体属于GUI线程，工作线程发出的信号会排队回到GUI线程
+        self._signals = _EncodeSignals(self)
+        self._signals.finished.connect(self._on_task_finished)
+        self._signals.failed.connect(self._on_task_failed)
+
+    def submit(self, content_type: str, content, timestamp: int | None = None,
+               fingerprint: str | None = None, captured_at: int | None = None) -> EncodeJob:
+        """提交内容进行后台编码"""
+        if content_type == "image" and isinstance(content, QImage):
+            content = content.copy()  # 与剪贴板数据脱离，避免跨线程共享
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        if captured_at is None:
+            captured_at = now_us()
+
+        with self._lock:
+            self._sequence += 1
+            job = EncodeJob(content_type, content, timestamp, self._sequence, fingerprint, captured_at)
+            if len(self.pending) == self.pending.maxlen:
+                self.coalesced_count += 1
+                logger.warning("编码队列已满，合并掉较旧的%s内容", self.pending[0].content_type)
+            self.pending.append(job)
+
+        self._start_next()
+        return job
+
+    def pending_count(self) -> int:
+        return len(self.pending)
+
+    def _start_next(self):
+        with self._lock:
+            if self.busy or not self.pending:
+                return
+            job = self.pending.popleft()
+            self.busy = True
+        self.pool.start(_EncodeTask(job, self.data_processor, self._signals, self.delta_codec,
+                                    self.stream_chunk_size))
+
+    def _on_task_finished(self, result: EncodeResult):
+        with self._lock:
+            self.busy = False
+        self.finished.emit(result)
+        self._start_next()
+
+    def _on_task_failed(self, job: EncodeJob, error: str):
+        with self._lock:
+            self.busy = False
+        self.failed.emit(job, error)
+        self._start_next()
+
+    def shutdown(self, timeout_ms: int = 2000):
+        """丢弃待处理内容并等待正在进行的任务结束"""
+        with self._lock:
+            self.pending.clear()
+        self.pool.waitForDone(timeout_ms)
@@ -0,0 +1,58 @@
+import hashlib
+from PySide6.QtGui import QImage
+from text_chunks import iter_utf8
+
+# 这两种格式的像素布局相同（0xAARRGGBB），RGB32的alpha恒为0xff，可直接哈希
+_NATIVE_FORMATS = (QImage.Format.Format_ARGB32, QImage.Format.Format_RGB32)
+
+
+def _new_hash(kind: bytes):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(kind)
+    return digest
+
+
+def image_fingerprint(image: QImage) -> str:
+    """直接对像素缓冲区计算指纹，无需编码为PNG"""
+    if image.format() not in _NATIVE_FORMATS:
+        image = image.convertToFormat(QImage.Format.Format_ARGB32)
+
+    width = image.width()
+    height = image.height()
+    digest = _new_hash(b"image")
+    digest.update(width.to_bytes(4, "little") + height.to_bytes(4, "little"))
+
+    bits = image.constBits()  # 只读memoryview，不复制像素数据
+    row_bytes = width * 4
+    bytes_per_line = image.bytesPerLine()
+    if bytes_per_line == row_bytes:
+        digest.update(bits[:row_bytes * height])
+    else:
+        # 行尾有对齐填充时逐行哈希，跳过填充字节
+        for y in range(height):
+            offset = y * bytes_per_line
+            digest.update(bits[offset:offset + row_bytes])
+    return digest.hexdigest()
+
+
+def text_fingerprint(text: str) -> str:
+    """计算文本内容的指纹"""
+    digest = _new_hash(b"text")
+    for part in iter_utf8(text):
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def bytes_fingerprint(data: bytes) -> str:
+    """计算二进制数据（如压缩后的负载）的指纹"""
+    digest = _new_hash(b"bytes")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def chunks_fingerprint(chunks) -> str:
+    """计算分段数据的指纹，与对拼接后的数据调用 bytes_fingerprint 结果相同"""
+    digest = _new_hash(b"bytes")
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
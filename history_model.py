@@ -0,0 +1,274 @@
+import logging
+import time
+from collections import OrderedDict
+from PySide6.QtCore import (QAbstractListModel, QModelIndex, QObject, QRunnable, QThreadPool,
+                            Qt, Signal)
+from PySide6.QtGui import QColor, QIcon, QImage, QPixmap
+from fingerprint import image_fingerprint, text_fingerprint
+from history_store import HistoryEntry, HistoryStore, PREVIEW_LENGTH, make_thumbnail
+
+logger = logging.getLogger(__name__)
+
+
+class ClipboardItem:
+    def __init__(self, content_type: str, content, timestamp: int, fingerprint: str | None = None,
+                 entry_id: int | None = None, store: HistoryStore | None = None):
+        self.content_type = content_type  # "text" or "image"
+        self._content = content  # 为None时按需从历史存储读取
+        self.timestamp = timestamp
+        self.fingerprint = fingerprint  # 内容指纹，首次使用时计算并缓存
+        self.entry_id = entry_id  # 历史存储中的记录ID
+        self.store = store
+        self.preview = content[:PREVIEW_LENGTH] if content_type == "text" and content else ""
+        self.click_count = 0  # 记录点击次数
+        self.last_click_time = 0  # 记录最后一次点击时间
+
+    @classmethod
+    def from_entry(cls, entry: HistoryEntry, store: HistoryStore) -> 'ClipboardItem':
+        """由历史存储的元数据创建条目，完整内容延迟加载"""
+        item = cls(entry.content_type, None, entry.timestamp, entry.fingerprint, entry.entry_id, store)
+        item.preview = entry.preview
+        item.click_count = entry.click_count
+        item.last_click_time = entry.last_click_time
+        return item
+
+    @property
+    def content(self):
+        if self._content is None and self.store is not None and self.entry_id is not None:
+            self._content = self.store.fetch_content(self.entry_id, self.content_type)
+        return self._content
+
+    def has_content_loaded(self) -> bool:
+        return self._content is not None
+
+    def release_content(self):
+        """释放内存中的完整内容（已持久化的条目可随时重新读取）"""
+        if self.store is not None and self.entry_id is not None:
+            self._content = None
+
+    def get_fingerprint(self) -> str:
+        """获取内容指纹（每个条目只计算一次）"""
+        if self.fingerprint is None:
+            if self.content_type == "text":
+                self.fingerprint = text_fingerprint(self.content)
+            else:
+                self.fingerprint = image_fingerprint(self.content)
+        return self.fingerprint
+
+    def increment_click_count(self):
+        """增加点击次数并更新最后点击时间"""
+        self.click_count += 1
+        self.last_click_time = int(time.time() * 1000)
+
+    def get_display_text(self) -> str:
+        """获取显示文本，包括点击次数"""
+        # 对于文本内容，限制长度为30个字符
+        if self.content_type == "text":
+            base_text = self.preview[:30] + "..." if len(self.preview) > 30 else self.preview
+        else:
+            base_text = "[图片]"
+
+        if self.click_count > 0:
+            return base_text + " " + f"(+{self.click_count})"  # 不使用HTML标签
+        return base_text
+
+    def get_time_text(self) -> str:
+        """获取时间显示文本"""
+        display_time = self.last_click_time if self.last_click_time > 0 else self.timestamp
+        return time.strftime("%H:%M:%S", time.localtime(display_time / 1000))
+
+
+class _ThumbnailSignals(QObject):
+    loaded = Signal(int, QImage)
+
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, entry_id: int, store: HistoryStore, image: QImage | None,
+                 size: int, signals: _ThumbnailSignals):
+        super().__init__()
+        self.entry_id = entry_id
+        self.store = store
+        self.image = image  # 内存中已有完整图片时直接缩放，否则从存储读取缩略图
+        self.size = size
+        self.signals = signals
+
+    def run(self):
+        try:
+            thumbnail = make_thumbnail(self.image) if self.image is not None else self.store.load_thumbnail(self.entry_id)
+            if thumbnail is None or thumbnail.isNull():
+                thumbnail = QImage()
+            else:
+                thumbnail = thumbnail.scaled(self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio,
+                                             Qt.TransformationMode.SmoothTransformation)
+            self.signals.loaded.emit(self.entry_id, thumbnail)
+        except Exception as e:
+            logger.error("生成缩略图时出错: %s", e)
+            self.signals.loaded.emit(self.entry_id, QImage())
+
+
+class HistoryListModel(QAbstractListModel):
+    """虚拟化的历史记录模型
+
+    只保存记录ID列表；元数据按页从存储读取并缓存，缩略图在后台线程生成，
+    QPixmap 缓存在 LRU 中，适合数万条以上的历史记录。
+    """
+
+    ItemRole = Qt.ItemDataRole.UserRole + 1
+
+    PAGE_SIZE = 100  # 每次从存储读取的元数据条数
+    ITEM_CACHE_SIZE = 2000  # 缓存的 ClipboardItem 数量
+    PIXMAP_CACHE_SIZE = 500  # 缓存的缩略图数量
+    ICON_SIZE = 32
+
+    def __init__(self, store: HistoryStore, max_entries: int, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.max_entries = max_entries
+        self._all_ids = []  # 全部记录ID，最新的在前
+        self._ids = self._all_ids  # 当前显示的ID（搜索时为搜索结果）
+        self._rows = None  # 当前显示ID到行号的映射，按需构建
+        self._items = OrderedDict()  # entry_id -> ClipboardItem (LRU)
+        self._pixmaps = OrderedDict()  # entry_id -> QPixmap (LRU)
+        self._loading = set()  # 正在生成缩略图的记录
+
+        self._thumbnail_pool = QThreadPool(self)
+        self._thumbnail_pool.setMaxThreadCount(2)
+        self._thumbnail_signals = _ThumbnailSignals(self)
+        self._thumbnail_signals.loaded.connect(self._on_thumbnail_loaded)
+
+    def load(self):
+        """从存储加载全部记录ID"""
+        self.beginResetModel()
+        self._all_ids = self.store.list_ids()
+        self._ids = self._all_ids
+        self._rows = None
+        self._items.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._ids)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._ids):
+            return None
+        item = self._item_for_row(index.row())
+        if item is None:
+            return None
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return item.get_display_text()
+        if role == Qt.ItemDataRole.ForegroundRole:
+            # 如果有点击次数，设置文本颜色为绿色，否则为默认颜色
+            return QColor("#4CAF50") if item.click_count > 0 else QColor("#ffffff")
+        if role == Qt.ItemDataRole.DecorationRole and item.content_type == "image":
+            return self._icon_for(item)
+        if role == self.ItemRole:
+            return item
+        return None
+
+    def item_at(self, index: QModelIndex) -> ClipboardItem | None:
+        if not index.isValid():
+            return None
+        return self._item_for_row(index.row())
+
+    def prepend(self, item: ClipboardItem, keep_in_memory: int):
+        """在开头插入新条目；超出保存上限时移除末尾条目"""
+        self._cache_item(item)
+        showing_all = self._ids is self._all_ids
+        if showing_all:
+            self.beginInsertRows(QModelIndex(), 0, 0)
+        self._all_ids.insert(0, item.entry_id)
+        self._rows = None
+        if showing_all:
+            self.endInsertRows()
+
+        # 较旧条目只保留元数据，完整内容需要时再从存储读取
+        if len(self._all_ids) > keep_in_memory:
+            old_item = self._items.get(self._all_ids[keep_in_memory])
+            if old_item is not None:
+                old_item.release_content()
+
+        overflow = len(self._all_ids) - self.max_entries
+        if overflow > 0:
+            if showing_all:
+                self.beginRemoveRows(QModelIndex(), self.max_entries, len(self._all_ids) - 1)
+            removed = self._all_ids[self.max_entries:]
+            del self._all_ids[self.max_entries:]
+            self._rows = None
+            for entry_id in removed:
+                self._items.pop(entry_id, None)
+                self._pixmaps.pop(entry_id, None)
+            if showing_all:
+                self.endRemoveRows()
+
+    def refresh_item(self, item: ClipboardItem):
+        """条目内容（如点击次数）变化后刷新显示"""
+        row = self._row_of(item.entry_id)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def set_filter(self, entry_ids: list[int] | None):
+        """只显示给定的记录（按给定顺序）；None表示显示全部"""
+        self.beginResetModel()
+        self._ids = self._all_ids if entry_ids is None else list(entry_ids)
+        self._rows = None
+        self.endResetModel()
+
+    def index_of_entry(self, entry_id: int) -> QModelIndex:
+        row = self._row_of(entry_id)
+        return self.index(row) if row is not None else QModelIndex()
+
+    def shutdown(self, timeout_ms: int = 1000):
+        self._thumbnail_pool.clear()
+        self._thumbnail_pool.waitForDone(timeout_ms)
+
+    def _row_of(self, entry_id: int) -> int | None:
+        if self._rows is None:
+            self._rows = {entry_id: row for row, entry_id in enumerate(self._ids)}
+        return self._rows.get(entry_id)
+
+    def _item_for_row(self, row: int) -> ClipboardItem | None:
+        entry_id = self._ids[row]
+        item = self._items.get(entry_id)
+        if item is not None:
+            self._items.move_to_end(entry_id)
+            return item
+
+        # 按页读取当前行附近尚未缓存的元数据
+        page = [i for i in self._ids[row:row + self.PAGE_SIZE] if i not in self._items]
+        for entry in self.store.load_entries(page).values():
+            self._cache_item(ClipboardItem.from_entry(entry, self.store))
+        return self._items.get(entry_id)
+
+    def _cache_item(self, item: ClipboardItem):
+        self._items[item.entry_id] = item
+        self._items.move_to_end(item.entry_id)
+        while len(self._items) > self.ITEM_CACHE_SIZE:
+            self._items.popitem(last=False)
+
+    def _icon_for(self, item: ClipboardItem):
+        pixmap = self._pixmaps.get(item.entry_id)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(item.entry_id)
+            return QIcon(pixmap) if not pixmap.isNull() else None
+
+        if item.entry_id not in self._loading:
+            self._loading.add(item.entry_id)
+            image = item.content if item.has_content_loaded() else None
+            self._thumbnail_pool.start(_ThumbnailTask(item.entry_id, self.store, image,
+                                                      self.ICON_SIZE, self._thumbnail_signals))
+        return None
+
+    def _on_thumbnail_loaded(self, entry_id: int, image: QImage):
+        # QPixmap 只能在GUI线程创建
+        self._loading.discard(entry_id)
+        self._pixmaps[entry_id] = QPixmap.fromImage(image) if not image.isNull() else QPixmap()
+        while len(self._pixmaps) > self.PIXMAP_CACHE_SIZE:
+            self._pixmaps.popitem(last=False)
+        row = self._row_of(entry_id)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
@@ -0,0 +1,458 @@
+import io
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import zstandard
+from PySide6.QtCore import QBuffer, QByteArray, Qt
+from PySide6.QtGui import QImage
+from config import CONFIG_DIR
+from text_chunks import iter_utf8, utf8_length
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB_FILE = os.path.join(CONFIG_DIR, 'history.db')
+
+THUMBNAIL_SIZE = 64
+PREVIEW_LENGTH = 200  # 元数据中保存的文本预览长度
+FTS_MAX_CHARS = 64 * 1024  # 全文索引只收录文本的前64K字符，限制索引体积
+IMAGE_SEARCH_KEYWORD = "图片"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    content_type TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    fingerprint TEXT,
+    preview TEXT,
+    thumbnail BLOB,
+    content_size INTEGER NOT NULL DEFAULT 0,
+    click_count INTEGER NOT NULL DEFAULT 0,
+    last_click_time INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS history_content (
+    id INTEGER PRIMARY KEY REFERENCES history(id) ON DELETE CASCADE,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_fingerprint ON history(fingerprint);
+"""
+
+
+class HistoryEntry:
+    """历史记录元数据，不包含完整内容"""
+
+    def __init__(self, entry_id: int, content_type: str, timestamp: int, fingerprint: str | None,
+                 preview: str, thumbnail: QImage | None, content_size: int,
+                 click_count: int = 0, last_click_time: int = 0):
+        self.entry_id = entry_id
+        self.content_type = content_type  # "text" or "image"
+        self.timestamp = timestamp  # 毫秒
+        self.fingerprint = fingerprint
+        self.preview = preview  # 文本的前若干字符
+        self.thumbnail = thumbnail  # 图片缩略图
+        self.content_size = content_size
+        self.click_count = click_count
+        self.last_click_time = last_click_time
+
+
+def _image_to_png(image: QImage) -> bytes:
+    byte_array = QByteArray()
+    buffer = QBuffer(byte_array)
+    buffer.open(QBuffer.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    buffer.close()
+    return byte_array.data()
+
+
+def _compress_text(compressor: zstandard.ZstdCompressor, text: str) -> bytes:
+    # 分段编码后流式压缩，超长文本不会同时存在完整的UTF-8副本
+    output = io.BytesIO()
+    writer = compressor.stream_writer(output, size=utf8_length(text), closefd=False)
+    for part in iter_utf8(text):
+        writer.write(part)
+    writer.flush(zstandard.FLUSH_FRAME)
+    return output.getvalue()
+
+
+def make_thumbnail(image: QImage) -> QImage:
+    return image.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.AspectRatioMode.KeepAspectRatio,
+                        Qt.TransformationMode.SmoothTransformation)
+
+
+class HistoryStore:
+    """基于SQLite（WAL模式）的剪贴板历史存储
+
+    写入在后台线程中批量完成；启动时只读取元数据和缩略图，完整内容按需读取。
+    文本以zstd压缩保存，图片以PNG保存。
+    """
+
+    def __init__(self, db_path: str = HISTORY_DB_FILE, max_entries: int = 5000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._queue = queue.Queue()
+        self._pending = {}  # 尚未写入磁盘的内容 {entry_id: content}
+        self._pending_lock = threading.Lock()
+        self._local = threading.local()
+        self._decompressor = threading.local()
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        connection = self._connect()
+        connection.executescript(_SCHEMA)
+        self.fts_tokenizer, needs_reindex = self._create_fts(connection)
+        connection.commit()
+        row = connection.execute("SELECT COALESCE(MAX(id), 0) FROM history").fetchone()
+        self._next_id = row[0] + 1
+        self._id_lock = threading.Lock()
+
+        self._writer = threading.Thread(target=self._writer_loop, name="HistoryStoreWriter", daemon=True)
+        self._writer.start()
+        if needs_reindex:
+            self._queue.put(("reindex", None))
+
+    @staticmethod
+    def _create_fts(connection) -> tuple[str | None, bool]:
+        """创建全文索引表，返回(分词器, 是否需要为已有记录建立索引)"""
+        exists = connection.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'history_fts'"
+        ).fetchone()
+        if exists:
+            return ("trigram" if "trigram" in exists[0] else "unicode61"), False
+
+        # trigram 分词器支持中文等无空格文本的子串匹配（SQLite 3.34+）
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                connection.execute(
+                    f"CREATE VIRTUAL TABLE history_fts USING fts5(body, tokenize='{tokenizer}')"
+                )
+                return tokenizer, True
+            except sqlite3.OperationalError:
+                continue
+        logger.warning("SQLite不支持FTS5，搜索将逐条检查完整文本")
+        return None, False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        # 每个线程使用独立的只读连接，WAL模式下读写互不阻塞
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
+
+    def add(self, content_type: str, content, timestamp: int, fingerprint: str | None = None) -> int:
+        """异步写入一条历史记录，立即返回记录ID"""
+        with self._id_lock:
+            entry_id = self._next_id
+            self._next_id += 1
+        if content_type == "image":
+            content = content.copy()  # 交给写线程前与调用方的图片脱离
+        with self._pending_lock:
+            self._pending[entry_id] = content
+        self._queue.put(("add", (entry_id, content_type, content, timestamp, fingerprint)))
+        return entry_id
+
+    def update_clicks(self, entry_id: int, click_count: int, last_click_time: int):
+        """异步更新点击次数"""
+        self._queue.put(("clicks", (entry_id, click_count, last_click_time)))
+
+    def load_recent(self, limit: int) -> list[HistoryEntry]:
+        """按时间倒序读取最近的元数据和缩略图"""
+        rows = self._reader().execute(
+            "SELECT id, content_type, timestamp, fingerprint, preview, thumbnail, content_size, "
+            "click_count, last_click_time FROM history ORDER BY id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def list_ids(self) -> list[int]:
+        """按时间倒序返回全部记录ID"""
+        rows = self._reader().execute("SELECT id FROM history ORDER BY id DESC").fetchall()
+        return [row[0] for row in rows]
+
+    def load_entries(self, entry_ids) -> dict[int, HistoryEntry]:
+        """批量读取元数据（不含缩略图）"""
+        entry_ids = list(entry_ids)
+        if not entry_ids:
+            return {}
+        placeholders = ",".join("?" * len(entry_ids))
+        rows = self._reader().execute(
+            "SELECT id, content_type, timestamp, fingerprint, preview, NULL, content_size, "
+            f"click_count, last_click_time FROM history WHERE id IN ({placeholders})",
+            entry_ids
+        ).fetchall()
+        return {row[0]: self._row_to_entry(row) for row in rows}
+
+    def load_thumbnail(self, entry_id: int) -> QImage | None:
+        """读取单条记录的缩略图，可在任意线程调用"""
+        row = self._reader().execute(
+            "SELECT thumbnail FROM history WHERE id = ?", (entry_id,)
+        ).fetchone()
+        if row is None or not row[0]:
+            return None
+        thumbnail = QImage()
+        thumbnail.loadFromData(row[0])
+        return thumbnail
+
+    def search(self, query: str, limit: int = 500) -> list[int]:
+        """全文搜索，返回按相关度排序的记录ID
+
+        多个词之间为AND关系；trigram分词时支持任意子串，unicode61分词时按前缀匹配。
+        bm25 需要遍历常见词的全部倒排记录，十万条历史时单次查询要数百毫秒，
+        因此先按时间倒序取出最多limit条匹配记录，再用预览文本计算相关度重新排序。
+        没有全文索引时逐条检查完整文本。
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        if len(terms) == 1 and terms[0] == IMAGE_SEARCH_KEYWORD:
+            rows = self._reader().execute(
+                "SELECT id FROM history WHERE content_type = 'image' ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+            return [row[0] for row in rows]
+
+        if self.fts_tokenizer == "trigram":
+            # trigram 至少需要3个字符，更短的词用LIKE在候选结果中过滤
+            match_terms = [term for term in terms if len(term) >= 3]
+            like_terms = [term for term in terms if len(term) < 3]
+            match_query = " AND ".join(self._quote(term) for term in match_terms)
+        elif self.fts_tokenizer == "unicode61":
+            like_terms = []
+            match_query = " AND ".join(self._quote(term) + "*" for term in terms)
+        else:
+            like_terms = terms
+            match_query = ""
+
+        if not self.fts_tokenizer:
+            return self._rank(self._scan(terms, limit), [term.lower() for term in terms])
+
+        like_args = [f"%{self._escape_like(term)}%" for term in like_terms]
+        like_sql = " AND ".join("f.body LIKE ? ESCAPE '\\'" for _ in like_terms)
+        if match_query:
+            sql = ("SELECT h.id, h.preview FROM history_fts f JOIN history h ON h.id = f.rowid "
+                   f"WHERE history_fts MATCH ?{' AND ' + like_sql if like_sql else ''} "
+                   "ORDER BY f.rowid DESC LIMIT ?")
+            args = [match_query, *like_args, limit]
+        else:
+            # 没有可用于索引的词时在索引保存的正文中逐条匹配
+            sql = ("SELECT h.id, h.preview FROM history_fts f JOIN history h ON h.id = f.rowid "
+                   f"WHERE {like_sql} ORDER BY f.rowid DESC LIMIT ?")
+            args = [*like_args, limit]
+        rows = self._reader().execute(sql, args).fetchall()
+        return self._rank(rows, [term.lower() for term in terms])
+
+    def _scan(self, terms: list[str], limit: int) -> list:
+        """不支持FTS5时按时间倒序检查完整文本，预览已命中的记录不必解压"""
+        terms = [term.lower() for term in terms]
+        decompressor = self._get_decompressor()
+        rows = self._reader().execute(
+            "SELECT h.id, h.preview, h.content_size, c.data FROM history h "
+            "JOIN history_content c ON c.id = h.id WHERE h.content_type = 'text' ORDER BY h.id DESC"
+        )
+        matched = []
+        for entry_id, preview, content_size, data in rows:
+            preview = preview or ""
+            text = preview.lower()
+            if not all(term in text for term in terms):
+                if content_size <= len(preview):
+                    continue
+                text = decompressor.decompress(data).decode('utf-8').lower()
+                if not all(term in text for term in terms):
+                    continue
+            matched.append((entry_id, preview))
+            if len(matched) >= limit:
+                break
+        return matched
+
+    @staticmethod
+    def _rank(rows: list, terms: list[str]) -> list[int]:
+        """按预览文本中的命中情况排序，得分相同时保持时间倒序"""
+        def score(preview: str) -> float:
+            preview = preview.lower()
+            total = 0.0
+            for term in terms:
+                count = preview.count(term)
+                if count:
+                    total += count / (count + 1.2)  # 与bm25相同的词频饱和
+                    if preview.startswith(term):
+                        total += 1.0
+            return total
+
+        scored = [(score(preview or ""), entry_id) for entry_id, preview in rows]
+        scored.sort(key=lambda pair: pair[0], reverse=True)  # 稳定排序，保留时间顺序
+        return [entry_id for _, entry_id in scored]
+
+    @staticmethod
+    def _quote(term: str) -> str:
+        return '"' + term.replace('"', '""') + '"'
+
+    @staticmethod
+    def _escape_like(term: str) -> str:
+        return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+    def fetch_content(self, entry_id: int, content_type: str):
+        """按需读取完整内容，返回str或QImage，不存在时返回None"""
+        with self._pending_lock:
+            if entry_id in self._pending:
+                return self._pending[entry_id]
+
+        row = self._reader().execute(
+            "SELECT data FROM history_content WHERE id = ?", (entry_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if content_type == "text":
+            return self._get_decompressor().decompress(row[0]).decode('utf-8')
+        image = QImage()
+        image.loadFromData(row[0])
+        return image
+
+    def find_text(self, fingerprint: str) -> str | None:
+        """按指纹查找历史中的文本（用于还原增量），未找到返回None"""
+        row = self._reader().execute(
+            "SELECT id FROM history WHERE fingerprint = ? AND content_type = 'text' ORDER BY id DESC LIMIT 1",
+            (fingerprint,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self.fetch_content(row[0], "text")
+
+    def sample_texts(self, limit: int, max_chars: int) -> list[bytes]:
+        """最近的短文本内容（UTF-8），用于训练压缩字典"""
+        rows = self._reader().execute(
+            "SELECT c.data FROM history h JOIN history_content c ON c.id = h.id "
+            "WHERE h.content_type = 'text' AND h.content_size <= ? ORDER BY h.id DESC LIMIT ?",
+            (max_chars, limit)
+        ).fetchall()
+        decompressor = self._get_decompressor()
+        return [decompressor.decompress(row[0]) for row in rows]
+
+    def flush(self, timeout: float | None = None):
+        """等待所有排队的写入完成"""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait(timeout)
+
+    def close(self):
+        """写完剩余数据并停止写线程"""
+        self._queue.put(("stop", None))
+        self._writer.join(timeout=5)
+
+    def _row_to_entry(self, row) -> HistoryEntry:
+        thumbnail = None
+        if row[5]:
+            thumbnail = QImage()
+            thumbnail.loadFromData(row[5])
+        return HistoryEntry(row[0], row[1], row[2], row[3], row[4] or "", thumbnail,
+                            row[6], row[7], row[8])
+
+    def _get_decompressor(self) -> zstandard.ZstdDecompressor:
+        decompressor = getattr(self._decompressor, 'value', None)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor()
+            self._decompressor.value = decompressor
+        return decompressor
+
+    def _writer_loop(self):
+        connection = self._connect()
+        compressor = zstandard.ZstdCompressor(level=3)
+        running = True
+        while running:
+            operations = [self._queue.get()]
+            # 合并排队中的操作，一次事务提交
+            while True:
+                try:
+                    operations.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            written = []
+            waiters = []
+            try:
+                for kind, args in operations:
+                    if kind == "add":
+                        self._write_entry(connection, compressor, *args)
+                        written.append(args[0])
+                    elif kind == "clicks":
+                        connection.execute(
+                            "UPDATE history SET click_count = ?, last_click_time = ? WHERE id = ?",
+                            (args[1], args[2], args[0])
+                        )
+                    elif kind == "reindex":
+                        self._reindex(connection)
+                    elif kind == "flush":
+                        waiters.append(args)
+                    elif kind == "stop":
+                        running = False
+                if written:
+                    self._trim(connection)
+                connection.commit()
+            except Exception as e:
+                logger.error("写入历史记录时出错: %s", e)
+                connection.rollback()
+            finally:
+                with self._pending_lock:
+                    for entry_id in written:
+                        self._pending.pop(entry_id, None)
+                for waiter in waiters:
+                    waiter.set()
+        connection.close()
+
+    def _write_entry(self, connection, compressor, entry_id, content_type, content, timestamp, fingerprint):
+        if content_type == "text":
+            preview = content[:PREVIEW_LENGTH]
+            thumbnail = None
+            data = _compress_text(compressor, content)
+            content_size = len(content)
+        else:
+            preview = ""
+            thumbnail = _image_to_png(make_thumbnail(content))
+            data = _image_to_png(content)
+            content_size = len(data)
+
+        connection.execute(
+            "INSERT INTO history (id, content_type, timestamp, fingerprint, preview, thumbnail, content_size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (entry_id, content_type, timestamp, fingerprint, preview, thumbnail, content_size)
+        )
+        connection.execute("INSERT INTO history_content (id, data) VALUES (?, ?)", (entry_id, data))
+        if content_type == "text" and self.fts_tokenizer:
+            connection.execute("INSERT INTO history_fts (rowid, body) VALUES (?, ?)",
+                               (entry_id, content[:FTS_MAX_CHARS]))
+
+    def _reindex(self, connection):
+        # 为建立索引前已保存的文本记录补建全文索引
+        if not self.fts_tokenizer:
+            return
+        decompressor = zstandard.ZstdDecompressor()
+        rows = connection.execute(
+            "SELECT h.id, c.data FROM history h JOIN history_content c ON c.id = h.id "
+            "WHERE h.content_type = 'text'"
+        )
+        count = 0
+        for entry_id, data in rows.fetchall():
+            text = decompressor.decompress(data).decode('utf-8')
+            connection.execute("INSERT OR REPLACE INTO history_fts (rowid, body) VALUES (?, ?)",
+                               (entry_id, text[:FTS_MAX_CHARS]))
+            count += 1
+        logger.info("已为 %s 条历史记录建立全文索引", count)
+
+    def _trim(self, connection):
+        # 超过保存上限时删除最旧的记录（内容表通过外键级联删除）
+        row = connection.execute(
+            "SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?", (self.max_entries,)
+        ).fetchone()
+        if row is None:
+            return
+        connection.execute("DELETE FROM history WHERE id <= ?", (row[0],))
+        if self.fts_tokenizer:
+            connection.execute("DELETE FROM history_fts WHERE rowid <= ?", (row[0],))
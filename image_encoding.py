@@ -0,0 +1,128 @@
+import io
+import logging
+from PySide6.QtGui import QImage
+from config import DEFAULT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = ("auto", "webp", "jpeg")
+SCREENSHOT_SAMPLE_SIZE = 256  # 判断截图时采样的最长边
+PALETTE_MAX_COLORS = 256  # 采样中颜色不超过该数量时一定是界面/图表，无损编码会使用调色板
+FLAT_EDGE_RATIO = 0.6  # 截图中至少该比例的相邻像素完全相同（大片纯色）
+SOFT_EDGE_RATIO = 0.25  # 截图中有轻微差异（渐变、噪声、照片区域）的相邻像素不超过该比例
+SOFT_EDGE_THRESHOLD = 24  # 相邻像素通道差不超过该值视为轻微差异，超过则是文字和边框的硬边缘
+
+
+class ImageEncodeSettings:
+    """图片编码参数，来自配置文件的 image 部分"""
+
+    def __init__(self, image_format: str = "auto", max_size: int = 1920, quality: int = 80,
+                 webp_method: int = 1, lossless_effort: int = 10):
+        if image_format not in IMAGE_FORMATS:
+            logger.warning("未知的图片格式 %s，使用 auto", image_format)
+            image_format = "auto"
+        self.format = image_format
+        self.max_size = max(1, int(max_size))
+        self.quality = min(100, max(1, int(quality)))
+        self.webp_method = min(6, max(0, int(webp_method)))
+        self.lossless_effort = min(100, max(0, int(lossless_effort)))
+
+    @classmethod
+    def from_config(cls, config: dict | None = None) -> 'ImageEncodeSettings':
+        values = dict(DEFAULT_CONFIG["image"])
+        values.update(config or {})
+        return cls(values["format"], values["max_size"], values["quality"],
+                   values["webp_method"], values["lossless_effort"])
+
+
+def qimage_to_pil(qimage: QImage) -> 'Image.Image':
+    """直接读取QImage的像素缓冲转换为RGB的PIL图片，透明部分以白色填充"""
+    # PIL和NumPy在第一次处理图片时才导入，不拖慢启动
+    from PIL import Image
+    if qimage.hasAlphaChannel():
+        converted = qimage.convertToFormat(QImage.Format.Format_RGBA8888)
+        mode = 'RGBA'
+    else:
+        converted = qimage.convertToFormat(QImage.Format.Format_RGB888)
+        mode = 'RGB'
+    size = (converted.width(), converted.height())
+    # 按bytesPerLine读取，兼容行尾有对齐填充的图片
+    pil_image = Image.frombytes(mode, size, converted.constBits(), 'raw', mode, converted.bytesPerLine())
+    if mode == 'RGBA':
+        background = Image.new('RGB', size, (255, 255, 255))
+        background.paste(pil_image, mask=pil_image.getchannel('A'))
+        pil_image = background
+    return pil_image
+
+
+def downscale(pil_image: 'Image.Image', max_size: int) -> 'Image.Image':
+    """把最长边缩小到max_size：先按整数倍快速合并像素，再用LANCZOS精确缩放剩余部分"""
+    from PIL import Image
+    longest = max(pil_image.size)
+    if longest <= max_size:
+        return pil_image
+    ratio = max_size / longest
+    new_size = tuple(max(1, int(dim * ratio)) for dim in pil_image.size)
+    factor = longest // max_size
+    if factor >= 2:
+        pil_image = pil_image.reduce(factor)
+    if pil_image.size == new_size:
+        return pil_image
+    return pil_image.resize(new_size, Image.Resampling.LANCZOS)
+
+
+def classify_image(pil_image: 'Image.Image') -> str:
+    """判断图片内容，返回 screenshot、mixed 或 photo
+
+    截图和界面颜色少、大片纯色且边缘锐利，适合无损压缩；照片颜色丰富、过渡平滑，适合有损压缩；
+    含有照片区域的截图介于两者之间。
+    """
+    import numpy as np
+    from PIL import Image
+    # 最近邻采样保留原有的颜色和硬边缘
+    ratio = min(1.0, SCREENSHOT_SAMPLE_SIZE / max(pil_image.size))
+    sample_size = tuple(max(2, int(dim * ratio)) for dim in pil_image.size)
+    sample = pil_image.resize(sample_size, Image.Resampling.NEAREST)
+    # getcolors在颜色超过上限时直接返回None，比统计全部颜色快得多
+    if sample.getcolors(PALETTE_MAX_COLORS) is not None:
+        return "screenshot"
+
+    pixels = np.asarray(sample, dtype=np.int16)
+
+    # 相邻像素各通道差的最大值，分为相同、轻微差异和硬边缘
+    horizontal = np.abs(np.diff(pixels, axis=1)).max(axis=2)
+    vertical = np.abs(np.diff(pixels, axis=0)).max(axis=2)
+    total = horizontal.size + vertical.size
+    flat = (np.count_nonzero(horizontal == 0) + np.count_nonzero(vertical == 0)) / total
+    hard = (np.count_nonzero(horizontal > SOFT_EDGE_THRESHOLD) +
+            np.count_nonzero(vertical > SOFT_EDGE_THRESHOLD)) / total
+    soft = 1.0 - flat - hard
+    if flat < FLAT_EDGE_RATIO:
+        return "photo"
+    return "screenshot" if soft <= SOFT_EDGE_RATIO else "mixed"
+
+
+def encode_image(pil_image: 'Image.Image', settings: ImageEncodeSettings) -> tuple[bytes, str]:
+    """按设置编码图片，返回(编码后的数据, 编码方式)"""
+    image_format = settings.format
+    # 在缩小之前判断内容，LANCZOS重新采样带来的新颜色和柔和边缘会让截图被误判为照片
+    content = classify_image(pil_image) if image_format == "auto" else None
+    pil_image = downscale(pil_image, settings.max_size)
+    if image_format == "auto":
+        if content == "photo":
+            image_format = "jpeg"
+        elif content == "mixed":
+            # 有损WebP比JPEG更好地保留文字边缘
+            image_format = "webp"
+        else:
+            image_format = "webp-lossless"
+
+    output = io.BytesIO()
+    if image_format == "webp-lossless":
+        pil_image.save(output, format='WebP', lossless=True, quality=settings.lossless_effort,
+                       method=settings.webp_method)
+    elif image_format == "jpeg":
+        pil_image.save(output, format='JPEG', quality=settings.quality, optimize=False)
+    else:
+        pil_image.save(output, format='WebP', quality=settings.quality, method=settings.webp_method)
+    return output.getvalue(), image_format
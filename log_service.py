@@ -0,0 +1,175 @@
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from config import CONFIG_DIR
+
+LOG_DIR = os.path.join(CONFIG_DIR, 'logs')
+LOG_FILE = os.path.join(LOG_DIR, 'copier.log')
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024  # 单个日志文件的大小上限
+DEFAULT_BACKUP_COUNT = 5  # 保留的旧日志文件数
+DEFAULT_RATE_LIMIT_BURST = 10  # 同一条消息在一个窗口内最多输出的次数
+DEFAULT_RATE_LIMIT_INTERVAL = 60.0  # 秒
+QUEUE_SIZE = 10000  # 等待写出的记录上限，写出跟不上时丢弃新的记录
+MAX_RATE_LIMIT_KEYS = 1000
+
+
+def _args_key(args) -> tuple:
+    """日志参数转换为可哈希的值，异常等对象按文本比较"""
+    if not args:
+        return ()
+    if isinstance(args, dict):
+        args = tuple(sorted(args.items()))
+    return tuple(arg if isinstance(arg, (str, int, float, type(None))) else str(arg) for arg in args)
+
+
+class RateLimitFilter(logging.Filter):
+    """同一条消息（日志记录器、级别、模板和参数都相同）在 interval 秒内最多输出 burst 次
+
+    超出的重复记录被省略，窗口结束后同一消息的第一条记录附带被省略的次数。
+    在产生日志的线程中执行，被省略的记录不会进入队列。
+    """
+
+    def __init__(self, burst: int = DEFAULT_RATE_LIMIT_BURST, interval: float = DEFAULT_RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.suppressed = 0  # 累计省略的记录数
+        self._windows = {}  # (logger, 级别, 模板, 参数) -> [窗口开始时间, 次数, 省略次数]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+        key = (record.name, record.levelno, record.msg, _args_key(record.args))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                if window is not None:
+                    del self._windows[key]  # 重新插入到末尾，字典保持按窗口开始时间排序
+                    if window[2]:
+                        record.msg = f"{record.msg}（此前{self.interval:g}秒内另有{window[2]}条相同消息被省略）"
+                self._windows[key] = [now, 1, 0]
+                self._prune(now)
+                return True
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+            window[2] += 1
+            self.suppressed += 1
+            return False
+
+    def _prune(self, now: float):
+        """从最早的窗口开始删除已结束的窗口，数量超过上限时也删除"""
+        while self._windows:
+            key, window = next(iter(self._windows.items()))
+            if now - window[0] < self.interval and len(self._windows) <= MAX_RATE_LIMIT_KEYS:
+                break
+            del self._windows[key]
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """把记录原样放入队列，消息和异常堆栈由写出线程格式化
+
+    标准的 QueueHandler 在调用线程中格式化以便跨进程传递，这里只在进程内传递，
+    日志参数应为字符串、数字等不会再被修改的值。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogService:
+    """日志子系统：各线程的日志经队列交给单独的线程写入轮转文件和控制台
+
+    文件保存在 ~/.copier/logs，没有控制台的打包版本（sys.stdout 为None）只写文件。
+    """
+
+    def __init__(self):
+        self.rate_limit = RateLimitFilter()
+        self._handler = None
+        self._listener = None
+
+    def start(self, settings=None, log_dir: str = LOG_DIR):
+        """配置根日志记录器并启动写出线程，重复调用只更新设置"""
+        settings = settings or {}
+        if self._listener is not None:
+            self.apply(settings)
+            return
+        handlers = []
+        formatter = logging.Formatter(LOG_FORMAT)
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir, os.path.basename(LOG_FILE)),
+                maxBytes=settings.get('max_bytes', DEFAULT_MAX_BYTES),
+                backupCount=settings.get('backup_count', DEFAULT_BACKUP_COUNT),
+                encoding='utf-8', delay=True)
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        except OSError as e:
+            if sys.stderr is not None:
+                sys.stderr.write(f"无法创建日志目录: {e}\n")
+        if settings.get('console', True) and sys.stdout is not None:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+
+        # 格式中没有进程信息，省去每条记录查询进程的开销
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        log_queue = queue.Queue(QUEUE_SIZE)
+        self._handler = _DeferredQueueHandler(log_queue)
+        self._handler.addFilter(self.rate_limit)
+        self._listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self._listener.start()
+
+        root = logging.getLogger()
+        root.addHandler(self._handler)
+        self.apply(settings)
+
+    def apply(self, settings):
+        """应用日志级别和重复消息限制，可在运行中调用"""
+        settings = settings or {}
+        level = str(settings.get('level', DEFAULT_LEVEL)).upper()
+        if not isinstance(logging.getLevelName(level), int):
+            logging.getLogger(__name__).warning("未知的日志级别 %s，使用 %s", level, DEFAULT_LEVEL)
+            level = DEFAULT_LEVEL
+        logging.getLogger().setLevel(level)
+        self.rate_limit.burst = settings.get('rate_limit_burst', DEFAULT_RATE_LIMIT_BURST)
+        self.rate_limit.interval = settings.get('rate_limit_interval', DEFAULT_RATE_LIMIT_INTERVAL)
+
+    def dropped(self) -> int:
+        """写出跟不上而丢弃的记录数"""
+        return self._handler.dropped if self._handler is not None else 0
+
+    def stop(self):
+        """写完队列中剩余的记录并关闭文件"""
+        if self._listener is None:
+            return
+        logging.getLogger().removeHandler(self._handler)
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+        self._handler = None
+
+
+log_service = LogService()
@@ -1,83 +1,115 @@
 import sys
 import time
+from startup_profile import StartupProfiler
+
+# 启动各阶段的耗时，--profile-startup 时输出
+startup_profiler = StartupProfiler()
+
 import uuid
 import json
 import io
+import logging
+import threading
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                               QLabel, QSystemTrayIcon, QMenu, QPushButton,
-                              QHBoxLayout, QListWidget, QListWidgetItem, QSplitter,
+                              QHBoxLayout, QListView, QSplitter,
                               QScrollArea, QTextEdit, QStackedWidget, QLineEdit,
                               QMessageBox)
-from PySide6.QtCore import (Qt, QTimer, QBuffer, QByteArray, QSize, QRectF,
-                           QMetaObject, Q_ARG, QSettings)
+from PySide6.QtCore import (Qt, QTimer, QSize, QRectF,
+                           QMetaObject, Q_ARG, QSettings, Signal)
 from PySide6.QtGui import (QIcon, QImage, QPixmap, QPainter, QFont, QPen, QBrush, 
                           QColor, QFontMetrics, QKeySequence, QShortcut)
-import base64
-import paho.mqtt.client as mqtt
+startup_profiler.mark("导入Qt")
 from paho.mqtt.packettypes import PacketTypes
-import pyperclip
-import hashlib
+from paho.mqtt.properties import Properties
 from settings_dialog import SettingsDialog
-from config import load_config, save_config
+from config import load_config, save_config, config_service, LIVE_MQTT_SETTINGS
 from data_processor import DataProcessor
+from image_encoding import ImageEncodeSettings
+from dedup_cache import DedupCache
+from history_store import HistoryStore
+from history_model import ClipboardItem, HistoryListModel
+from fingerprint import image_fingerprint, text_fingerprint, bytes_fingerprint
+from encode_pipeline import EncodePipeline
+from clipboard_codec import (ClipboardCodec, PROTOCOL_VERSION, LEGACY_PROTOCOL_VERSION,
+                             UNCOMPRESSED_PROTOCOL_VERSION, CONTENT_TYPE_PROTOBUF)
+from chunked_transfer import (ChunkSender, ChunkAssembler, StreamedPayload, CONTENT_TYPE_CHUNK,
+                              CHUNKED_PROTOCOL_VERSION, STREAMING_PROTOCOL_VERSION, DEFAULT_CHUNK_SIZE,
+                              MIN_CHUNK_SIZE, build_resend_request, parse_resend_request)
+from compression_dictionaries import (CompressionDictionaries, DICTIONARY_MIN_SAMPLES,
+                                      DICTIONARY_SAMPLE_MAX_CHARS)
+from outbox import Outbox, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES
+from reconnect import ReconnectScheduler, DEFAULT_MIN_DELAY, DEFAULT_MAX_DELAY
+from metrics import metrics, MetricsServer
+from metrics_panel import MetricsDialog
+from tracing import SyncTracer, KIND_PROPERTY, now_us, user_properties
+from log_service import log_service
+from delta_sync import (DeltaBaseCache, DeltaCodec, DeltaFallbackCache, DELTA_PROTOCOL_VERSION,
+                        build_delta_nack, parse_delta_nack)
 import platform
-import ssl
 import os
 
-class ClipboardItem:
-    def __init__(self, content_type: str, content, timestamp: int):
-        self.content_type = content_type  # "text" or "image"
-        self.content = content
-        self.timestamp = timestamp
-        self.click_count = 0  # 记录点击次数
-        self.last_click_time = 0  # 记录最后一次点击时间
-
-    def increment_click_count(self):
-        """增加点击次数并更新最后点击时间"""
-        self.click_count += 1
-        self.last_click_time = int(time.time() * 1000)
-
-    def get_display_text(self) -> str:
-        """获取显示文本，包括点击次数"""
-        # 对于文本内容，限制长度为30个字符
-        if self.content_type == "text":
-            base_text = self.content[:30] + "..." if len(self.content) > 30 else self.content
-        else:
-            base_text = "[图片]"
-            
-        if self.click_count > 0:
-            return base_text + " " + f"(+{self.click_count})"  # 不使用HTML标签
-        return base_text
-
-    def get_time_text(self) -> str:
-        """获取时间显示文本"""
-        display_time = self.last_click_time if self.last_click_time > 0 else self.timestamp
-        return time.strftime("%H:%M:%S", time.localtime(display_time / 1000))
+logger = logging.getLogger(__name__)
+startup_profiler.mark("导入模块")
 
 class MainWindow(QMainWindow):
+    dictionary_trained = Signal(object)  # 后台训练完成的字典ID，在GUI线程中发布和切换
+    delivery_failed = Signal(object)  # 已交给传输层但未被确认的EncodeResult，在GUI线程中写入待发送队列
     VERSION = "2.1.0"
+    HISTORY_CONTENT_IN_MEMORY = 20  # 内存中保留完整内容的最近条目数
+    SEARCH_RESULT_LIMIT = 1000
+    TEXT_PREVIEW_MAX_CHARS = 1024 * 1024  # 预览区只显示超长文本的开头部分
     
     def __init__(self):
         super().__init__()
-        print("初始化主窗口...")
+        logger.debug("初始化主窗口...")
         
         # 添加操作系统判断
         self.is_windows = platform.system().lower() == 'windows'
         self.is_macos = platform.system().lower() == 'darwin'
-        print(f"操作系统: {'macOS' if self.is_macos else 'Windows' if self.is_windows else 'Other'}")
+        logger.debug("操作系统: %s", 'macOS' if self.is_macos else 'Windows' if self.is_windows else 'Other')
         
         # 初始化pasteboard为None
         self.pasteboard = None
         
+        # 托盘图标最先显示，登录时启动也能马上看到
+        self.setup_tray()
+        startup_profiler.mark("创建托盘图标")
+        
         # 初始化数据处理器
-        print("初始化数据处理器...")
-        self.data_processor = DataProcessor()
+        logger.debug("初始化数据处理器...")
+        self.compression_dictionaries = CompressionDictionaries()
+        self.compression_dictionaries.load()
+        self.data_processor = DataProcessor(self.compression_dictionaries,
+                                            ImageEncodeSettings.from_config(load_config().get('image')))
+        
+        # 最近同步过的文本作为增量基准，修改后的大段文本只发送增量
+        self.delta_bases = DeltaBaseCache()
+        self.delta_codec = DeltaCodec(self.delta_bases)
+        self.delta_fallbacks = DeltaFallbackCache()
+        
+        # 初始化后台编码流水线，超大文本按分块大小流式压缩
+        chunk_size = max(MIN_CHUNK_SIZE, int(load_config().get('mqtt', {}).get('chunk_size', DEFAULT_CHUNK_SIZE)))
+        self.encode_pipeline = EncodePipeline(self.data_processor, delta_codec=self.delta_codec,
+                                              stream_chunk_size=chunk_size, parent=self)
+        self.encode_pipeline.finished.connect(self.on_encode_finished)
+        self.encode_pipeline.failed.connect(self.on_encode_failed)
+        self.dictionary_trained.connect(self.on_dictionary_trained)
+        self.delivery_failed.connect(self.on_delivery_failed)
+        startup_profiler.mark("初始化数据处理器")
         
         # 初始化剪贴板
         self.clipboard = QApplication.clipboard()
         
+        # 初始化历史记录存储
+        history_config = load_config().get('history', {})
+        self.history_max_stored = history_config.get('max_stored', 5000)
+        self.history_store = HistoryStore(max_entries=self.history_max_stored)
+        self.history_model = HistoryListModel(self.history_store, self.history_max_stored, self)
+        
         # 初始化UI
         self.setup_ui()
+        startup_profiler.mark("初始化界面")
         
         # 初始化剪贴板监控状态
         self.clipboard_monitoring_enabled = True  # 默认启用
@@ -86,31 +118,140 @@ class MainWindow(QMainWindow):
         self.last_processed_time = 0
         self.is_processing = False
         
+        # 去重缓存：限制容量和存活时间，避免长时间运行时内存持续增长
+        self.received_hashes = DedupCache(max_size=512, ttl=3600)
+        self.sent_hashes = DedupCache(max_size=512, ttl=3600)
+        
         # 设置快捷键
         self.setup_shortcuts()
         
-        # 连接剪贴板信号
-        self.clipboard.dataChanged.connect(self.on_clipboard_change)
-        
         # 初始化MQTT客户端
         self.client_id = f"copier_{platform.node()}_{uuid.uuid4().hex[:8]}"
-        self.mqtt_client = None
+        self.codec = ClipboardCodec(self.client_id)
+        # 端到端延迟跟踪，receiving_trace 为正在处理的收到内容的跟踪
+        self.sync_tracer = SyncTracer(self.client_id)
+        self.receiving_trace = None
+        self.peer_protocols = {}  # 在线对端的协议版本 {client_id: version}
+        self.peer_dictionaries = {}  # 在线对端拥有的压缩字典 {client_id: {dict_id}}
+        self.chunk_sender = ChunkSender(chunk_size)
+        self.chunk_assembler = ChunkAssembler()
+        self.mqtt_transport = None
         self.mqtt_connected = False
-        self.reconnect_timer = QTimer()
-        self.reconnect_timer.timeout.connect(self.setup_mqtt)
-        self.reconnect_timer.setInterval(5000)  # 5秒后重试
+        self.mqtt_connection_settings = {}  # 当前连接使用的mqtt设置
+        # 断开后按指数退避加随机等待重连，复用现有客户端
+        mqtt_config = load_config().get('mqtt', {})
+        self.reconnect_scheduler = ReconnectScheduler(mqtt_config.get('reconnect_min_delay', DEFAULT_MIN_DELAY),
+                                                      mqtt_config.get('reconnect_max_delay', DEFAULT_MAX_DELAY),
+                                                      self)
+        self.reconnect_scheduler.reconnect.connect(self.reconnect_mqtt)
         
-        # 设置MQTT连接
-        self.setup_mqtt()
+        # 离线时的待发送队列，重连后按间隔逐条发送
+        outbox_config = load_config().get('outbox', {})
+        self.outbox = Outbox(max_entries=outbox_config.get('max_entries', DEFAULT_MAX_ENTRIES),
+                             max_bytes=outbox_config.get('max_bytes', DEFAULT_MAX_BYTES))
+        self.outbox_sending = None  # (条目, 发布Future列表)
+        self.outbox_timer = QTimer(self)
+        self.outbox_timer.timeout.connect(self.drain_outbox)
+        self.outbox_timer.setInterval(outbox_config.get('drain_interval_ms', 500))
         
-        # 显示窗口
+        # 配置文件修改后（设置对话框或手动编辑）直接应用，只有连接参数变化时才重新连接
+        config_service.watch()
+        config_service.changed.connect(self.on_config_changed)
+        
+        # 显示窗口，其余的加载和MQTT连接在事件循环开始后进行
         self.show()
+        startup_profiler.mark("显示窗口")
+        QTimer.singleShot(0, self.start_services)
+
+    def start_services(self):
+        """窗口显示后加载历史记录和待发送队列，开始监听剪贴板并连接MQTT"""
+        self.load_history()
+        startup_profiler.mark("加载历史记录")
+        self.outbox.load()
+        startup_profiler.mark("加载待发送队列")
+        
+        # 连接剪贴板信号
+        self.clipboard.dataChanged.connect(self.on_clipboard_change)
+        
+        # 设置MQTT连接，连接结果在后台返回
+        self.setup_mqtt()
+        startup_profiler.mark("创建MQTT连接")
+        
+        self.setup_metrics()
+        if startup_profiler.enabled:
+            logger.info("%s", startup_profiler.report())
+
+    def setup_metrics(self):
+        """登记已有的统计，按配置开启本机HTTP端点和定期写入JSON"""
+        metrics.add_collector(self.collect_metrics)
+        metrics.add_collector(self.sync_tracer.collect)
+        metrics_config = load_config().get('metrics', {})
+        self.metrics_server = None
+        port = metrics_config.get('http_port', 0)
+        if port:
+            try:
+                self.metrics_server = MetricsServer(port)
+                self.metrics_server.start()
+                logger.info("指标端点: http://127.0.0.1:%s/metrics", self.metrics_server.port)
+            except OSError as e:
+                logger.warning("无法开启指标端点: %s", e)
+                self.metrics_server = None
+        self.metrics_dump_timer = QTimer(self)
+        self.metrics_dump_timer.timeout.connect(self.dump_metrics)
+        dump_interval = metrics_config.get('dump_interval', 0)
+        if dump_interval:
+            self.metrics_dump_timer.start(int(dump_interval * 1000))
+
+    def collect_metrics(self) -> list:
+        """把压缩、重连和待发送队列的统计转换为指标（可能在HTTP线程中调用）"""
+        samples = []
+        for codec, stats in self.data_processor.stats.snapshot().items():
+            labels = {"codec": codec}
+            samples += [
+                ("copier_compression_total", "counter", "按编码方式统计的编码次数", labels, stats["count"]),
+                ("copier_compression_input_bytes_total", "counter", "编码前的字节数", labels, stats["bytes_in"]),
+                ("copier_compression_output_bytes_total", "counter", "编码后的字节数", labels, stats["bytes_out"]),
+                ("copier_compression_seconds_total", "counter", "编码耗时（秒）", labels, stats["total_ms"] / 1000),
+            ]
+        reconnect = self.reconnect_scheduler.stats
+        samples += [
+            ("copier_reconnect_attempts_total", "counter", "重连尝试次数", {}, reconnect.attempts),
+            ("copier_reconnect_recoveries_total", "counter", "断开后恢复连接的次数", {}, reconnect.recoveries),
+            ("copier_reconnect_last_recovery_seconds", "gauge", "最近一次从断开到恢复的时间（秒）", {},
+             reconnect.last_recovery or 0),
+            ("copier_outbox_entries", "gauge", "待发送队列中的条目数", {}, len(self.outbox)),
+            ("copier_outbox_bytes", "gauge", "待发送队列中内容的字节数", {}, self.outbox.pending_bytes()),
+            ("copier_mqtt_connected", "gauge", "是否已连接MQTT服务器", {}, int(self.mqtt_connected)),
+            ("copier_log_suppressed_total", "counter", "因重复被省略的日志记录数", {},
+             log_service.rate_limit.suppressed),
+            ("copier_log_dropped_total", "counter", "写出跟不上而丢弃的日志记录数", {}, log_service.dropped()),
+        ]
+        if self.mqtt_transport:
+            samples.append(("copier_publish_pending_bytes", "gauge", "等待确认的发布负载字节数", {},
+                            self.mqtt_transport.pending_bytes()))
+        return samples
+
+    def dump_metrics(self):
+        """定期把指标写入 ~/.copier/metrics.json，端到端跟踪写入 ~/.copier/traces.json"""
+        try:
+            metrics.dump()
+            self.sync_tracer.dump()
+        except Exception as e:
+            logger.error("保存指标时出错: %s", e)
+
+    def show_metrics(self):
+        """打开调试面板"""
+        if getattr(self, 'metrics_dialog', None) is None:
+            self.metrics_dialog = MetricsDialog(self, report=self.sync_tracer.report, dump=self.sync_tracer.dump)
+        self.metrics_dialog.show()
+        self.metrics_dialog.raise_()
+        self.metrics_dialog.activateWindow()
 
     def enable_clipboard_monitoring(self):
         """启用剪贴板监听"""
-        print("启用剪贴板监听...")
+        logger.debug("启用剪贴板监听...")
         self.clipboard_monitoring_enabled = True
-        print("剪贴板监听已启用")
+        logger.debug("剪贴板监听已启用")
 
     def check_clipboard(self):
         """检查剪贴板变化"""
@@ -121,44 +262,33 @@ class MainWindow(QMainWindow):
             mime = self.clipboard.mimeData()
             current_hash = None
             
+            text = None
+            image = None
+            
             if mime.hasText():
                 text = mime.text()
                 if text:
-                    current_hash = hashlib.md5(text.encode()).hexdigest()
+                    current_hash = text_fingerprint(text)
             elif mime.hasImage():
                 image = mime.imageData()
                 if image and not image.isNull():
-                    # 转换为固定格式和大小的图片以确保一致性
-                    scaled_image = image.scaled(800, 800, Qt.AspectRatioMode.KeepAspectRatio, 
-                                             Qt.TransformationMode.SmoothTransformation)
-                    buffer = QByteArray()
-                    buffer_device = QBuffer(buffer)
-                    buffer_device.open(QBuffer.OpenModeFlag.WriteOnly)
-                    scaled_image.save(buffer_device, "PNG")
-                    buffer_device.close()
-                    current_hash = hashlib.md5(buffer.data()).hexdigest()
-                    buffer = None  # 清理缓冲区
+                    # 直接对像素缓冲区计算指纹
+                    current_hash = image_fingerprint(image)
             
             # 如果内容有变化，处理新内容
             if current_hash and current_hash != self.last_processed_hash:
-                print(f"检测到剪贴板内容变化，新哈希值: {current_hash}")
+                logger.debug("检测到剪贴板内容变化，新哈希值: %s", current_hash)
                 self.last_processed_hash = current_hash
                 
-                if mime.hasText():
-                    text = mime.text()
-                    if text:
-                        print(f"从剪贴板获取到文本，长度：{len(text)}")
-                        self.process_text(text)
-                elif mime.hasImage():
-                    image = mime.imageData()
-                    if image and not image.isNull():
-                        print("从剪贴板获取到图片")
-                        self.process_image(image)
+                if text:
+                    logger.debug("从剪贴板获取到文本，长度：%s", len(text))
+                    self.process_text(text, current_hash)
+                elif image is not None:
+                    logger.debug("从剪贴板获取到图片")
+                    self.process_image(image, current_hash)
                         
         except Exception as e:
-            print(f"检查剪贴板时出错: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("检查剪贴板时出错: %s", e)
             
         # 强制进行垃圾回收
         import gc
@@ -168,6 +298,8 @@ class MainWindow(QMainWindow):
         """更新预览区域"""
         try:
             if content_type == "text":
+                if len(content) > self.TEXT_PREVIEW_MAX_CHARS:
+                    content = content[:self.TEXT_PREVIEW_MAX_CHARS] + f"\n\n……（仅预览前{self.TEXT_PREVIEW_MAX_CHARS}个字符，共{len(content)}个字符）"
                 QMetaObject.invokeMethod(self.text_preview, "setPlainText",
                                        Qt.ConnectionType.QueuedConnection,
                                        Q_ARG(str, content))
@@ -195,9 +327,9 @@ class MainWindow(QMainWindow):
                 painter.drawPixmap(x, y, scaled_pixmap)
                 
                 # 获取当前项的时间文本
-                current_item = self.history_list.currentItem()
-                if current_item and hasattr(current_item, 'clipboard_item'):
-                    time_text = current_item.clipboard_item.get_time_text()
+                current_item = self.history_model.item_at(self.history_list.currentIndex())
+                if current_item is not None:
+                    time_text = current_item.get_time_text()
                     
                     # 设置字体和颜色
                     font = painter.font()
@@ -238,33 +370,34 @@ class MainWindow(QMainWindow):
                 self.preview_stack.setCurrentIndex(0)  # 切换到图片预览
                 
         except Exception as e:
-            print(f"更新预览时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("更新预览时出错: %s", e)
             
-    def on_history_item_clicked(self, item):
+    def on_history_item_clicked(self, index):
         """处理历史记录项的单击事件"""
-        if not hasattr(item, 'clipboard_item'):
+        clipboard_item = self.history_model.item_at(index)
+        if clipboard_item is None:
             return
         
         # 更新预览
-        clipboard_item = item.clipboard_item
         self.update_preview(clipboard_item.content_type, clipboard_item.content)
 
-    def on_history_item_double_clicked(self, item):
+    def on_history_item_double_clicked(self, index):
         """处理历史记录项的双击事件"""
-        if not hasattr(item, 'clipboard_item'):
+        clipboard_item = self.history_model.item_at(index)
+        if clipboard_item is None:
             return
             
         # 暂时禁用剪贴板监听
         self.clipboard_monitoring_enabled = False
         
         try:
-            clipboard_item = item.clipboard_item
             clipboard_item.increment_click_count()
+            if clipboard_item.entry_id is not None:
+                self.history_store.update_clicks(clipboard_item.entry_id, clipboard_item.click_count,
+                                                 clipboard_item.last_click_time)
             
             # 更新列表项显示文本和样式
-            self.update_list_item(item)
+            self.history_model.refresh_item(clipboard_item)
             
             # 复制内容到剪贴板
             if clipboard_item.content_type == "text":
@@ -276,162 +409,209 @@ class MainWindow(QMainWindow):
             self.update_preview(clipboard_item.content_type, clipboard_item.content)
             
             # 更新最后的内容哈希，防止重复添加
-            _, compressed = self.data_processor.process_clipboard_data(
-                clipboard_item.content_type, 
-                clipboard_item.content
-            )
-            self.last_processed_hash = self.calculate_content_hash(
-                clipboard_item.content_type, 
-                compressed
-            )
+            self.last_processed_hash = clipboard_item.get_fingerprint()
         finally:
             # 确保剪贴板监听最终被重新启用
             QTimer.singleShot(100, self.enable_clipboard_monitoring)
 
-    def update_list_item(self, item):
-        """更新列表项的显示"""
-        if not hasattr(item, 'clipboard_item'):
-            return
-            
-        clipboard_item = item.clipboard_item
-        
-        # 设置文本
-        item.setText(clipboard_item.get_display_text())
-        
-        # 如果有点击次数，设置文本颜色为绿色，否则恢复默认颜色
-        if clipboard_item.click_count > 0:
-            item.setForeground(QColor("#4CAF50"))
-        else:
-            item.setForeground(QColor("#ffffff"))
-        
-        # 如果是图片，设置缩略图
-        if clipboard_item.content_type == "image":
-            thumb = clipboard_item.content.scaled(32, 32, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            item.setIcon(QIcon(QPixmap.fromImage(thumb)))
-
-    def process_text(self, text):
+    def process_text(self, text, fingerprint=None, captured_at=None):
         """处理文本内容"""
         try:
             # 更新预览
             self.update_preview("text", text)
             
-            # 如果启用了MQTT，发送文本
-            if self.mqtt_client and self.mqtt_client.is_connected():
-                # 准备要发送的数据
-                data = {
-                    "type": "text",
-                    "content": text,
-                    "timestamp": int(time.time())
-                }
-                
-                # 发送数据
-                self.mqtt_client.publish(f"copier/{self.client_id}/content", 
-                                      json.dumps(data))
-                print("文本已发送")
-            else:
-                print("MQTT客户端未连接，无法发送文本")
-                
             # 添加到历史记录
-            self.add_to_history("text", text, int(time.time() * 1000))
+            timestamp = int(time.time() * 1000)
+            self.add_to_history("text", text, timestamp, fingerprint)
+            
+            # 压缩在后台线程进行，完成后再发送
+            self.encode_pipeline.submit("text", text, timestamp, fingerprint, captured_at)
             
         except Exception as e:
-            print(f"处理文本时出错: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("处理文本时出错: %s", e)
 
-    def process_image(self, image):
+    def process_image(self, image, fingerprint=None, captured_at=None):
         """处理图片内容"""
         try:
             if image.isNull():
-                print("图片内容为空")
+                logger.info("图片内容为空")
                 return
                 
-            # 转换为固定格式和大小的图片以确保一致性
-            scaled_image = image.scaled(800, 800, Qt.AspectRatioMode.KeepAspectRatio, 
-                                     Qt.TransformationMode.SmoothTransformation)
+            # 缩放、优化和压缩都在后台线程进行，完成后更新预览和历史并发送
+            self.encode_pipeline.submit("image", image, fingerprint=fingerprint, captured_at=captured_at)
             
-            # 将图片转换为base64
-            buffer = QByteArray()
-            buffer_device = QBuffer(buffer)
-            buffer_device.open(QBuffer.OpenModeFlag.WriteOnly)
-            scaled_image.save(buffer_device, "PNG")
-            buffer_device.close()
-            
-            # 更新预览
-            self.update_preview("image", scaled_image)
-            
-            # 如果启用了MQTT，发送图片
-            if self.mqtt_client and self.mqtt_client.is_connected():
-                # 准备要发送的数据
-                data = {
-                    "type": "image",
-                    "content": base64.b64encode(buffer.data()).decode(),
-                    "timestamp": int(time.time())
-                }
-                
-                # 发送数据
-                self.mqtt_client.publish(f"copier/{self.client_id}/content", 
-                                      json.dumps(data))
-                print("图片已发送")
+        except Exception as e:
+            logger.exception("处理图片时出错: %s", e)
+
+    def on_encode_finished(self, result):
+        """后台编码完成回调（GUI线程）"""
+        metrics.stage("encode").observe(result.elapsed)
+        try:
+            logger.info("%s内容编码完成，%s大小: %s，耗时: %.1fms",
+                        result.content_type, '压缩后' if result.is_compressed else '不可压缩，原始',
+                        result.compressed_size, result.elapsed * 1000)
+            
+            if result.content_type == "image":
+                # 更新预览和历史
+                self.update_preview("image", result.preview)
+                self.add_to_history("image", result.preview, result.timestamp)
+            
+            # 记录已发送的内容，收到自己内容的回显时直接忽略
+            self.sent_hashes.add(result.content_hash)
+            if result.fingerprint:
+                self.sent_hashes.add(result.fingerprint)
+            
+            # 如果启用了MQTT，发送内容
+            futures = []
+            if self.mqtt_transport and self.mqtt_transport.is_connected():
+                futures = self.send_clipboard_content(result.content_type, result.compressed, result.delta,
+                                                      result.is_compressed, result.compressed_chunks,
+                                                      {"captured": result.captured_at,
+                                                       "encoded": result.encoded_at})
+            if futures:
+                if result.content_type == "text" and result.compressed_chunks is None:
+                    # 已同步的文本可作为之后增量的基准
+                    self.delta_bases.add(result.content, result.fingerprint)
+                self.watch_delivery(result, futures)
+                logger.debug("文本已发送" if result.content_type == "text" else "图片已发送")
             else:
-                print("MQTT客户端未连接，无法发送图片")
+                # 离线或未能发送时写入待发送队列，重连后补发
+                self.add_to_outbox(result, "MQTT客户端未连接")
                 
-            # 清理资源
-            buffer = None
-            
-            # 添加到历史记录
-            self.add_to_history("image", scaled_image, int(time.time() * 1000))
-            
         except Exception as e:
-            print(f"处理图片时出错: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("发送编码结果时出错: %s", e)
+
+    def watch_delivery(self, result, futures):
+        """发布在确认前失败（如发送途中断线）时通过信号把内容写入待发送队列，Future可能在网络线程中完成"""
+        lock = threading.Lock()
+        failed = []
+
+        def done(future):
+            if not future.cancelled() and future.exception() is None:
+                return
+            with lock:
+                if failed:
+                    return  # 分块传输只补发一次
+                failed.append(future)
+            self.delivery_failed.emit(result)
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def on_delivery_failed(self, result):
+        self.add_to_outbox(result, "发送未被确认")
 
-    def on_mqtt_message(self, client, userdata, message):
-        """MQTT v5 消息回调"""
+    def add_to_outbox(self, result, reason: str):
+        """把编码结果写入待发送队列，重连后补发"""
+        try:
+            payload = result.compressed
+            if payload is None:
+                payload = b"".join(result.compressed_chunks)
+            if self.outbox.add(result.content_type, payload, result.is_compressed,
+                               result.content_hash, result.timestamp):
+                logger.warning("%s，%s已加入待发送队列", reason,
+                               '文本' if result.content_type == 'text' else '图片')
+        except Exception as e:
+            logger.exception("写入待发送队列时出错: %s", e)
+
+    def on_encode_failed(self, job, error):
+        """后台编码失败回调（GUI线程）"""
+        logger.error("编码%s内容时出错: %s", job.content_type, error)
+
+    def on_mqtt_message(self, message):
+        """MQTT v5 消息回调（GUI线程）"""
+        received_at = now_us()
+        metrics.counter("copier_messages_received_total", "收到的MQTT消息数").inc()
+        metrics.counter("copier_payload_bytes_total", "收发的MQTT负载字节数", direction="received").inc(
+            len(message.payload))
+        with metrics.stage("receive").time():
+            self.handle_mqtt_message(message, received_at)
+
+    def handle_mqtt_message(self, message, received_at):
+        """按主题处理收到的消息，耗时计入 receive 阶段；received_at 为收到消息的时间（微秒）"""
         try:
             if not self.mqtt_connected:
-                print("收到消息但MQTT未连接")
+                logger.warning("收到消息但MQTT未连接")
                 return
             
-            print(f"收到消息 - 主题: {message.topic}, QoS: {message.qos}")
+            logger.debug("收到消息 - 主题: %s, QoS: %s", message.topic, message.qos)
             
+            # 处理对端发布的压缩字典
+            if '/dictionaries/' in message.topic:
+                self.process_received_dictionary(message)
+                return
+                
             # 处理状态消息
             if message.topic.endswith('/status'):
                 try:
                     status_data = json.loads(message.payload)
                     client_id = status_data.get('client_id')
                     status = status_data.get('status')
-                    print(f"客户端状态更新 - ID: {client_id}, 状态: {status}")
+                    logger.debug("客户端状态更新 - ID: %s, 状态: %s", client_id, status)
+                    announce = (status == "online" and not message.retain and client_id != self.client_id
+                                and client_id not in self.peer_protocols)
+                    self.update_peer_protocol(client_id, status,
+                                              status_data.get('protocol_version', LEGACY_PROTOCOL_VERSION),
+                                              status_data.get('dictionaries', []))
+                    if announce:
+                        # 新上线的对端可能收不到本机已过期的保留状态，重新发布一次
+                        self.publish_status("online")
                 except:
                     pass
                 return
                 
+            # 处理分块传输
+            if message.topic.endswith('/chunk'):
+                self.process_received_chunk(message, received_at)
+                return
+                
+            # 处理端到端延迟跟踪的确认和回复
+            if message.topic.endswith('/trace'):
+                self.process_trace_message(message, received_at)
+                return
+                
+            # 处理其他客户端的补发请求
+            if message.topic.endswith('/resend'):
+                self.process_resend_request(message)
+                return
+                
+            # 处理无法还原增量的对端发来的完整内容请求
+            if message.topic.endswith('/nack'):
+                self.process_delta_nack(message)
+                return
+                
             if not message.topic.endswith('/content'):
-                print(f"未知的消息主题: {message.topic}")
+                logger.warning("未知的消息主题: %s", message.topic)
                 return
                 
             try:
-                # 获取消息属性
-                content_type = message.properties.ContentType
-                if not content_type:
-                    print("消息缺少内容类型")
+                # 解码消息（protobuf，或旧版客户端的原始/JSON格式）
+                properties = getattr(message, 'properties', None)
+                mqtt_content_type = getattr(properties, 'ContentType', None)
+                try:
+                    clipboard_message = self.codec.decode(message.payload, mqtt_content_type)
+                except ValueError as e:
+                    logger.warning("无法解码消息: %s", e)
                     return
                     
-                content_type = content_type.replace('application/x-copier-', '')
-                if content_type not in ['text', 'image']:
-                    print(f"不支持的内容类型: {content_type}")
+                # 忽略自己发出的消息
+                if clipboard_message.source_id == self.client_id:
                     return
                     
                 # 处理消息内容
-                self.process_received_data(content_type, message.payload)
+                self.begin_trace(properties, received_at)
+                try:
+                    self.process_clipboard_message(clipboard_message)
+                finally:
+                    self.finish_trace()
                 
                 # 发送确认
-                if message.properties.CorrelationData:
+                correlation_data = getattr(properties, 'CorrelationData', None)
+                if correlation_data:
                     response_topic = f"{message.topic}/ack"
-                    response_properties = mqtt.Properties(PacketTypes.PUBLISH)
-                    response_properties.CorrelationData = message.properties.CorrelationData
-                    self.mqtt_client.publish(
+                    response_properties = Properties(PacketTypes.PUBLISH)
+                    response_properties.CorrelationData = correlation_data
+                    self.mqtt_transport.publish(
                         response_topic,
                         "ok",
                         qos=1,
@@ -439,28 +619,298 @@ class MainWindow(QMainWindow):
                     )
                 
             except Exception as e:
-                print(f"处理消息内容时出错: {str(e)}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("处理消息内容时出错: %s", e)
                 
         except Exception as e:
-            print(f"MQTT消息回调出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("MQTT消息回调出错: %s", e)
+            
+    def process_received_chunk(self, message, received_at):
+        """处理接收到的分块，重组完成后按普通内容处理"""
+        sender_id = message.topic.split('/')[-2]
+        if sender_id == self.client_id:
+            return
             
-    def process_received_data(self, content_type: str, content: bytes):
+        try:
+            payload = self.chunk_assembler.add_frame(sender_id, message.payload)
+        except ValueError as e:
+            logger.error("处理分块时出错: %s", e)
+            return
+        if payload is None:
+            return
+            
+        # 每块都带有跟踪属性，以完成重组的一块为准
+        self.begin_trace(getattr(message, 'properties', None), received_at)
+        try:
+            if isinstance(payload, StreamedPayload):
+                self.process_streamed_payload(sender_id, payload)
+                return
+                
+            logger.info("分块传输重组完成，来自: %s，大小: %s", sender_id, len(payload))
+            try:
+                clipboard_message = self.codec.decode(payload, CONTENT_TYPE_PROTOBUF)
+            except ValueError as e:
+                logger.warning("无法解码分块消息: %s", e)
+                return
+                
+            self.process_clipboard_message(clipboard_message)
+        finally:
+            self.finish_trace()
+        
+    def begin_trace(self, properties, received_at):
+        """读取内容消息的跟踪属性，之后的 decoded/applied 记入该跟踪"""
+        self.receiving_trace = None
+        if load_config().get('tracing', {}).get('enabled', True):
+            self.receiving_trace = self.sync_tracer.incoming(user_properties(properties), received_at)
+            
+    def mark_trace(self, stage):
+        if self.receiving_trace is not None:
+            self.receiving_trace.mark(stage)
+            
+    def finish_trace(self):
+        """内容写入剪贴板后向发送方发送ack，重复或还原失败的内容不发送"""
+        trace, self.receiving_trace = self.receiving_trace, None
+        if trace is None or "applied" not in trace.stamps or not self.mqtt_transport:
+            return
+        topic_prefix = load_config().get('mqtt', {}).get('topic_prefix', 'copier/clipboard')
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.UserProperty = self.sync_tracer.ack_properties(trace)
+        self.mqtt_transport.publish(f"{topic_prefix}/{trace.peer_id}/trace", b"", qos=0, properties=properties)
+        
+    def process_trace_message(self, message, received_at):
+        """处理跟踪的ack（本机是发送方）或回复（本机是接收方）"""
+        props = user_properties(getattr(message, 'properties', None))
+        kind = props.get(KIND_PROPERTY)
+        if kind == "ack":
+            reply = self.sync_tracer.on_ack(props, received_at)
+            if reply is None:
+                return
+            peer_id, reply_properties = reply
+            topic_prefix = load_config().get('mqtt', {}).get('topic_prefix', 'copier/clipboard')
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.UserProperty = reply_properties
+            self.mqtt_transport.publish(f"{topic_prefix}/{peer_id}/trace", b"", qos=0, properties=properties)
+        elif kind == "reply":
+            trace = self.sync_tracer.on_reply(props, received_at)
+            if trace is not None and trace.latency() is not None:
+                logger.info("同步延迟 - 来自: %s, 复制到粘贴: %.1fms, 时钟偏差: %+.1fms ±%.1fms",
+                            trace.peer_id, trace.latency() * 1000, trace.offset / 1000, trace.uncertainty / 1000)
+        
+    def process_streamed_payload(self, sender_id, payload):
+        """处理流式传输的超大文本（分块已在接收过程中解压）"""
+        try:
+            header = self.codec.decode(payload.header, CONTENT_TYPE_PROTOBUF)
+        except ValueError as e:
+            logger.warning("无法解码流式传输的消息头: %s", e)
+            return
+        if header.content_type != "text":
+            logger.warning("流式传输不支持的内容类型: %s", header.content_type)
+            return
+        logger.info("流式传输接收完成，来自: %s，文本长度: %s", sender_id, len(payload.text))
+        self.process_received_text(payload.text)
+        
+    def process_clipboard_message(self, clipboard_message):
+        """处理解码后的消息，增量内容先用本地的基准文本还原"""
+        if not clipboard_message.is_delta:
+            self.process_received_data(clipboard_message.content_type,
+                                       clipboard_message.content,
+                                       clipboard_message.compressed)
+            return
+            
+        text_bytes = self.restore_delta(clipboard_message)
+        if text_bytes is None:
+            self.request_full_content(clipboard_message)
+            return
+        self.process_received_data("text", text_bytes, compressed=False)
+        
+    def restore_delta(self, clipboard_message) -> bytes | None:
+        """用最近同步的文本或历史记录还原增量，失败时返回None"""
+        base_hash = clipboard_message.base_hash
+        base = self.delta_bases.get(base_hash)
+        if base is None:
+            base_text = self.history_store.find_text(base_hash)
+            if base_text is not None:
+                base = base_text.encode('utf-8')
+        if base is None:
+            logger.warning("缺少增量的基准文本: %s", base_hash)
+            return None
+            
+        try:
+            text_bytes = self.delta_codec.decode(base, clipboard_message.content)
+        except Exception as e:
+            logger.error("还原增量时出错: %s", e)
+            return None
+        if clipboard_message.content_hash and \
+                text_fingerprint(text_bytes.decode('utf-8', errors='replace')) != clipboard_message.content_hash:
+            logger.warning("增量还原后的内容校验失败: %s", clipboard_message.message_id)
+            return None
+        logger.debug("增量还原成功 - 增量大小: %s, 还原后大小: %s",
+                     len(clipboard_message.content), len(text_bytes))
+        return text_bytes
+        
+    def request_full_content(self, clipboard_message):
+        """请求发送方改为发送完整内容"""
+        if not clipboard_message.source_id or not clipboard_message.message_id:
+            return
+        topic_prefix = load_config().get('mqtt', {}).get('topic_prefix', 'copier/clipboard')
+        logger.info("请求完整内容 - 消息: %s, 发送方: %s",
+                    clipboard_message.message_id, clipboard_message.source_id)
+        self.mqtt_transport.publish(
+            f"{topic_prefix}/{clipboard_message.source_id}/nack",
+            build_delta_nack(clipboard_message.message_id, self.client_id, clipboard_message.base_hash),
+            qos=1
+        )
+        
+    def process_delta_nack(self, message):
+        """对端无法还原增量时重发完整内容"""
+        try:
+            nack = parse_delta_nack(message.payload)
+        except ValueError as e:
+            logger.error("处理增量重发请求时出错: %s", e)
+            return
+            
+        fallback = self.delta_fallbacks.pop(nack.message_id)
+        if fallback is None:
+            # 已被其他对端的请求触发重发，或已过期
+            logger.info("无需重发完整内容: %s", nack.message_id)
+            return
+        logger.warning("对端 %s 无法还原增量，重发完整内容: %s", nack.requester_id, nack.message_id)
+        content_type, content, is_compressed = fallback
+        self.send_clipboard_content(content_type, content, is_compressed=is_compressed)
+        
+    def process_resend_request(self, message):
+        """按对端请求重发缺失的分块"""
+        try:
+            request = parse_resend_request(message.payload)
+        except ValueError as e:
+            logger.error("处理重发请求时出错: %s", e)
+            return
+            
+        frames = self.chunk_sender.frames_for_resend(request.transfer_id, request.missing)
+        if not frames:
+            logger.warning("无法重发，传输已过期: %s", request.transfer_id)
+            return
+            
+        logger.info("重发分块 - 传输: %s, 块数: %s, 请求方: %s",
+                    request.transfer_id, len(frames), request.requester_id)
+        self.publish_chunks(frames)
+        
+    def request_missing_chunks(self):
+        """重连后请求补发未完成传输中缺失的分块"""
+        topic_prefix = load_config().get('mqtt', {}).get('topic_prefix', 'copier/clipboard')
+        for sender_id, transfer_id, missing in self.chunk_assembler.incomplete_transfers():
+            logger.info("请求补发分块 - 传输: %s, 缺失: %s", transfer_id, len(missing))
+            self.mqtt_transport.publish(
+                f"{topic_prefix}/{sender_id}/resend",
+                build_resend_request(transfer_id, self.client_id, missing),
+                qos=1
+            )
+            
+    def publish_chunks(self, frames, trace_properties=None):
+        """发布分块，不等待每块的确认，返回各块发布的Future；trace_properties 附加在每一块上"""
+        topic_prefix = load_config().get('mqtt', {}).get('topic_prefix', 'copier/clipboard')
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.MessageExpiryInterval = 3600  # 消息1小时后过期
+        properties.ContentType = CONTENT_TYPE_CHUNK
+        if trace_properties:
+            properties.UserProperty = trace_properties
+        return [
+            self.mqtt_transport.publish(
+                f"{topic_prefix}/{self.client_id}/chunk",
+                frame,
+                qos=1,
+                retain=False,
+                properties=properties
+            )
+            for frame in frames
+        ]
+            
+    def update_peer_protocol(self, client_id, status, version, dictionaries=()):
+        """记录对端声明的协议版本和压缩字典，用于发送时协商格式"""
+        if not client_id or client_id == self.client_id:
+            return
+        if status == "online":
+            self.peer_protocols[client_id] = int(version)
+            self.peer_dictionaries[client_id] = {int(dict_id) for dict_id in dictionaries}
+        else:
+            self.peer_protocols.pop(client_id, None)
+            self.peer_dictionaries.pop(client_id, None)
+        self.update_active_dictionary()
+        
+    def update_active_dictionary(self):
+        """短文本改用所有在线对端都拥有的最新字典压缩"""
+        dict_id = self.compression_dictionaries.select(self.peer_dictionaries.values())
+        if dict_id != self.data_processor.active_dictionary_id:
+            logger.info("压缩字典切换为: %s", dict_id)
+            self.data_processor.active_dictionary_id = dict_id
+            
+    def process_received_dictionary(self, message):
+        """保存对端发布的压缩字典，并在状态中声明已拥有"""
+        if not message.payload:
+            return  # 已清除的保留消息
+        try:
+            dict_id = int(message.topic.rsplit('/', 1)[-1])
+        except ValueError:
+            logger.warning("无效的字典主题: %s", message.topic)
+            return
+        if dict_id in self.compression_dictionaries.ids():
+            return
+        try:
+            self.compression_dictionaries.add(message.payload, dict_id)
+        except Exception as e:
+            logger.error("保存压缩字典时出错: %s", e)
+            return
+        logger.info("已接收压缩字典: %s", dict_id)
+        self.update_active_dictionary()
+        self.publish_status("online")
+        
+    def publish_dictionaries(self):
+        """以保留消息发布本地的压缩字典，之后上线的对端也能收到"""
+        topic_prefix = load_config().get('mqtt', {}).get('topic_prefix', 'copier/clipboard')
+        for dict_id in self.compression_dictionaries.ids():
+            data = self.compression_dictionaries.data(dict_id)
+            if data is not None:
+                self.mqtt_transport.publish(f"{topic_prefix}/dictionaries/{dict_id}", data, qos=1, retain=True)
+                
+    def train_compression_dictionary(self):
+        """在后台线程用本地历史中的短文本训练压缩字典，完成后通过信号回到GUI线程发布"""
+        def train():
+            try:
+                samples = self.history_store.sample_texts(5000, DICTIONARY_SAMPLE_MAX_CHARS)
+                if len(samples) < DICTIONARY_MIN_SAMPLES:
+                    logger.info("历史文本太少（%s条），暂不训练压缩字典", len(samples))
+                    return
+                start = time.perf_counter()
+                dict_id = self.compression_dictionaries.train(samples)
+                logger.info("压缩字典训练完成: %s，样本: %s，耗时: %.0fms",
+                            dict_id, len(samples), (time.perf_counter() - start) * 1000)
+                self.dictionary_trained.emit(dict_id)
+            except Exception as e:
+                logger.exception("训练压缩字典时出错: %s", e)
+                
+        threading.Thread(target=train, daemon=True).start()
+        
+    def on_dictionary_trained(self, dict_id: int):
+        """发布新训练的字典并声明已拥有，再按对端拥有的字典切换"""
+        if self.mqtt_transport and self.mqtt_connected:
+            self.publish_dictionaries()
+            self.publish_status("online")
+        self.update_active_dictionary()
+            
+    def process_received_data(self, content_type: str, content: bytes, compressed: bool = True):
         """处理接收到的数据"""
         try:
             if content_type == "text":
-                self.process_received_text(content)
+                self.process_received_text(content, compressed)
             elif content_type == "image":
-                self.process_received_image(content)
+                self.process_received_image(content, compressed)
         except Exception as e:
-            print(f"处理数据时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("处理数据时出错: %s", e)
 
-    def process_received_image(self, content):
+    def is_duplicate_content(self, content_hash: str) -> bool:
+        """检查内容是否最近已收到或由本机发出"""
+        return content_hash in self.received_hashes or content_hash in self.sent_hashes
+        
+    def process_received_image(self, content, compressed=True):
         """处理接收到的图片内容"""
         try:
             # 标记正在接收内容
@@ -468,174 +918,266 @@ class MainWindow(QMainWindow):
             
             # 计算内容哈希，避免重复处理
             content_hash = self.calculate_content_hash("image", content)
-            if content_hash in self.received_hashes or content_hash in self.sent_hashes:
-                print(f"忽略重复的图片内容，哈希值: {content_hash}")
+            if self.is_duplicate_content(content_hash):
+                logger.debug("忽略重复的图片内容，哈希值: %s", content_hash)
                 return
                 
-            print(f"接收新的图片内容，哈希值: {content_hash}")
+            logger.debug("接收新的图片内容，哈希值: %s", content_hash)
             
             # 还原内容
-            image_content = self.data_processor.restore_clipboard_data("image", content)
+            with metrics.stage("decode").time():
+                image_content = self.data_processor.restore_clipboard_data("image", content, compressed)
+            self.mark_trace("decoded")
             if not image_content:
-                print("还原图片内容失败")
+                logger.warning("还原图片内容失败")
                 return
                 
-            print(f"还原后的图片大小: {image_content.size()}")
+            logger.debug("还原后的图片大小: %s", image_content.size())
             
-            # 计算还原后图片的哈希值
-            buffer = QByteArray()
-            buffer_device = QBuffer(buffer)
-            buffer_device.open(QBuffer.OpenModeFlag.WriteOnly)
-            image_content.save(buffer_device, "PNG", 100)  # 使用最高质量保存
-            buffer_device.close()
-            restored_hash = self.calculate_content_hash("image", buffer.data())
+            # 计算还原后图片的指纹，写入剪贴板后不会被当作新内容再次发送
+            restored_hash = image_fingerprint(image_content)
+            self.last_processed_hash = restored_hash
             
             self.received_hashes.add(content_hash)
             self.received_hashes.add(restored_hash)
-            self.sent_hashes.add(content_hash)
-            self.sent_hashes.add(restored_hash)
             
             # 更新预览和历史
             self.update_preview("image", image_content)
-            self.add_to_history("image", image_content, int(time.time() * 1000))
+            self.add_to_history("image", image_content, int(time.time() * 1000), restored_hash)
             
             # 更新剪贴板
-            print("更新剪贴板图片内容")
-            self.clipboard.setImage(image_content)
+            logger.debug("更新剪贴板图片内容")
+            with metrics.stage("clipboard_set").time():
+                self.clipboard.setImage(image_content)
+            self.mark_trace("applied")
             
         except Exception as e:
-            print(f"处理图片内容时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("处理图片内容时出错: %s", e)
         finally:
             # 确保标志被重置
             self.is_receiving_content = False
             
-    def process_received_text(self, content):
-        """处理接收到的文本内容"""
+    def process_received_text(self, content, compressed=True):
+        """处理接收到的文本内容，content为str时表示已还原的文本（流式传输）"""
         try:
             # 标记正在接收内容
             self.is_receiving_content = True
             
             # 计算内容哈希，避免重复处理
             content_hash = self.calculate_content_hash("text", content)
-            if content_hash in self.received_hashes or content_hash in self.sent_hashes:
-                print(f"忽略重复的文本内容，哈希值: {content_hash}")
+            if self.is_duplicate_content(content_hash):
+                logger.debug("忽略重复的文本内容，哈希值: %s", content_hash)
                 return
                 
-            print(f"接收新的文本内容，哈希值: {content_hash}")
+            logger.debug("接收新的文本内容，哈希值: %s", content_hash)
             
             # 还原内容
-            text_content = self.data_processor.restore_clipboard_data("text", content)
+            if isinstance(content, str):
+                text_content = content
+            else:
+                with metrics.stage("decode").time():
+                    text_content = self.data_processor.restore_clipboard_data("text", content, compressed)
+            self.mark_trace("decoded")
             if not text_content:
-                print("还原文本内容失败")
+                logger.warning("还原文本内容失败")
                 return
                 
-            print(f"还原后的文本长度: {len(text_content)}")
+            logger.debug("还原后的文本长度: %s", len(text_content))
             
-            # 计算还原后文本的哈希值
-            restored_hash = self.calculate_content_hash("text", text_content.encode('utf-8'))
+            # 计算还原后文本的指纹，写入剪贴板后不会被当作新内容再次发送
+            restored_hash = text_fingerprint(text_content)
+            if self.is_duplicate_content(restored_hash):
+                # 例如增量已还原后又收到其他对端触发的完整重发
+                logger.debug("忽略重复的文本内容，指纹: %s", restored_hash)
+                return
+            self.last_processed_hash = restored_hash
             
             self.received_hashes.add(content_hash)
             self.received_hashes.add(restored_hash)
-            self.sent_hashes.add(content_hash)
-            self.sent_hashes.add(restored_hash)
+            self.delta_bases.add(text_content, restored_hash)
             
             # 更新预览和历史
             self.update_preview("text", text_content)
-            self.add_to_history("text", text_content, int(time.time() * 1000))
+            self.add_to_history("text", text_content, int(time.time() * 1000), restored_hash)
             
             # 更新剪贴板
-            print("更新剪贴板文本内容")
-            self.clipboard.setText(text_content)
+            logger.debug("更新剪贴板文本内容")
+            with metrics.stage("clipboard_set").time():
+                self.clipboard.setText(text_content)
+            self.mark_trace("applied")
             
         except Exception as e:
-            print(f"处理文本内容时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("处理文本内容时出错: %s", e)
         finally:
             # 确保标志被重置
             self.is_receiving_content = False
             
-    def on_disconnect(self, client, userdata, rc):
-        """MQTT断开连接回调"""
+    def on_disconnect(self, rc):
+        """MQTT断开连接回调（GUI线程）"""
+        if not self.is_current_transport():
+            return
         self.mqtt_connected = False
-        print(f"MQTT断开连接，返回码: {rc}")
+        self.outbox_timer.stop()
+        self.outbox_sending = None
+        logger.info("MQTT断开连接，返回码: %s", rc)
         if rc != 0:
-            print("意外断开连接，启动重连定时器")
-            QMetaObject.invokeMethod(self.reconnect_timer, "start", Qt.QueuedConnection)
+            logger.warning("意外断开连接，安排重连")
+            self.reconnect_scheduler.schedule()
             
-    def on_publish(self, client, userdata, mid, reason_code=None, properties=None):
-        """MQTT消息发布回调"""
-        try:
-            status = "成功" if reason_code is None or not reason_code.is_failure else f"失败({reason_code.getName()})"
-            print(f"消息已发布，消息ID: {mid}, 状态: {status}")
-        except Exception as e:
-            print(f"处理发布回调时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+    def on_publish(self, mid, reason_code, latency):
+        """MQTT消息发布确认回调（GUI线程），latency为从提交到确认的秒数"""
+        logger.debug("消息已发布，消息ID: %s, 延迟: %.1fms", mid, latency * 1000)
+            
+    def on_publish_failed(self, topic, error):
+        """MQTT消息发布失败回调（GUI线程）"""
+        logger.warning("消息发布失败 - 主题: %s, 原因: %s", topic, error)
+        if topic.endswith('/content') or topic.endswith('/chunk'):
+            self.status_label.setText(f"发送失败: {error}")
             
     def calculate_content_hash(self, content_type: str, content) -> str:
         """计算内容的哈希值"""
         try:
             if content_type == "image" and isinstance(content, QImage):
-                # 将 QImage 转换为字节数组
-                buffer = QByteArray()
-                buffer_device = QBuffer(buffer)
-                buffer_device.open(QBuffer.OpenModeFlag.WriteOnly)
-                content.save(buffer_device, "PNG")
-                buffer_device.close()
-                content_bytes = buffer.data()
-            elif content_type == "image" and isinstance(content, bytes):
-                content_bytes = content
-            else:
-                content_bytes = content if isinstance(content, bytes) else str(content).encode('utf-8')
-                
-            return hashlib.sha256(content_bytes).hexdigest()
+                return image_fingerprint(content)
+            if isinstance(content, str):
+                return text_fingerprint(content)
+            return bytes_fingerprint(content)
         except Exception as e:
-            print(f"计算哈希值时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("计算哈希值时出错: %s", e)
             return str(time.time())  # 如果计算失败，返回时间戳作为备用
 
-    def send_clipboard_content(self, content_type: str, compressed_content: bytes):
-        """发送剪贴板内容到MQTT服务器"""
-        if not self.mqtt_client or not self.mqtt_connected:
-            print("MQTT未连接，无法发送消息")
-            return
+    def send_clipboard_content(self, content_type: str, compressed_content: bytes | None, delta=None,
+                               is_compressed: bool = True, compressed_chunks: list[bytes] | None = None,
+                               trace: dict | None = None):
+        """发送剪贴板内容到MQTT服务器
+
+        delta 为 (基准指纹, 文本指纹, 增量) 时，若所有在线对端都支持增量同步则只发送增量；
+        is_compressed 为False时 compressed_content 是不可压缩的原始数据；
+        compressed_chunks 为超大文本流式压缩后的分块，对端支持时直接作为分块发送；
+        trace 为 {"captured", "encoded"} 微秒时间戳，开启跟踪时随消息发送。
+        返回各条发布的Future，未发送时返回空列表。
+        """
+        if not self.mqtt_transport or not self.mqtt_connected:
+            logger.warning("MQTT未连接，无法发送消息")
+            return []
             
         try:
             config = load_config()
             topic_prefix = config.get('mqtt', {}).get('topic_prefix', 'copier/clipboard')
             
+            # 按在线对端的协议版本编码
+            version = self.codec.negotiate_version(self.peer_protocols.values())
+            message_id = str(uuid.uuid4())
+            traced = trace is not None and config.get('tracing', {}).get('enabled', True)
+            if compressed_chunks is not None:
+                if version >= STREAMING_PROTOCOL_VERSION:
+                    header = self.codec.encode_header(content_type, version, message_id)
+                    transfer_id, frames = self.chunk_sender.split_stream(header, compressed_chunks)
+                    futures = self.publish_chunks(
+                        frames, self.sync_tracer.outgoing(message_id, trace) if traced else None)
+                    if traced:
+                        self.sync_tracer.track(message_id, futures)
+                    logger.info("消息已流式分块发送 - 传输: %s, 块数: %s", transfer_id, len(frames))
+                    return futures
+                # 旧版对端需要完整的消息，分块拼接后就是带原始大小的zstd帧
+                compressed_content = b"".join(compressed_chunks)
+            if delta is not None and version >= DELTA_PROTOCOL_VERSION:
+                base_hash, content_hash, delta_content = delta
+                mqtt_content_type, payload = self.codec.encode(
+                    content_type, delta_content, version, message_id, base_hash, content_hash)
+                # 保留完整内容，对端缺少基准时重发
+                self.delta_fallbacks.add(message_id, content_type, compressed_content, is_compressed)
+                logger.info("使用增量发送 - 完整: %s, 增量: %s", len(compressed_content), len(delta_content))
+            else:
+                if not is_compressed and version < UNCOMPRESSED_PROTOCOL_VERSION:
+                    # 旧版对端只能解析zstd压缩的数据
+                    compressed_content = self.data_processor.compress_data(compressed_content)
+                    is_compressed = True
+                elif is_compressed:
+                    # 还不知道任何对端或有对端没有该字典时改为普通压缩
+                    dict_id = self.data_processor.dictionary_id(compressed_content)
+                    if dict_id and (not self.peer_dictionaries or
+                                    not all(dict_id in ids for ids in self.peer_dictionaries.values())):
+                        compressed_content = self.data_processor.without_dictionary(compressed_content)
+                mqtt_content_type, payload = self.codec.encode(content_type, compressed_content, version,
+                                                               message_id, compressed=is_compressed)
+            
+            # 超过单块大小时分块发送
+            if version >= CHUNKED_PROTOCOL_VERSION and self.chunk_sender.needs_chunking(payload):
+                transfer_id, frames = self.chunk_sender.split(payload)
+                futures = self.publish_chunks(
+                    frames, self.sync_tracer.outgoing(message_id, trace) if traced else None)
+                if traced:
+                    self.sync_tracer.track(message_id, futures)
+                logger.info("消息已分块发送 - 传输: %s, 块数: %s, 大小: %s",
+                            transfer_id, len(frames), len(payload))
+                return futures
+            
             # 创建消息属性
-            properties = mqtt.Properties(PacketTypes.PUBLISH)
+            properties = Properties(PacketTypes.PUBLISH)
             properties.MessageExpiryInterval = 3600  # 消息1小时后过期
-            properties.ContentType = f"application/x-copier-{content_type}"
-            properties.PayloadFormatIndicator = 1  # 表示是应用程序定义的数据
+            properties.ContentType = mqtt_content_type
+            properties.PayloadFormatIndicator = 0  # 二进制负载
             
-            # 计算消息ID
-            message_id = str(uuid.uuid4())
             properties.CorrelationData = message_id.encode()
+            if traced:
+                properties.UserProperty = self.sync_tracer.outgoing(message_id, trace)
             
             # 发布消息，使用QoS 2确保只传递一次
-            info = self.mqtt_client.publish(
-                f"{topic_prefix}/content",
-                compressed_content,
+            future = self.mqtt_transport.publish(
+                f"{topic_prefix}/{self.client_id}/content",
+                payload,
                 qos=2,  # 使用QoS 2
                 retain=False,
                 properties=properties
             )
             
-            # 等待消息发送完成
-            info.wait_for_publish()
+            if traced:
+                self.sync_tracer.track(message_id, [future])
             
-            print(f"消息已发送 - ID: {message_id}, mid: {info.mid}")
+            # 不等待确认，结果由 on_publish/on_publish_failed 报告
+            logger.debug("消息已提交发送 - ID: %s, 协议版本: %s, 大小: %s",
+                         message_id, version, len(payload))
+            return [future]
             
         except Exception as e:
-            print(f"发送消息时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("发送消息时出错: %s", e)
+            return []
+
+    def drain_outbox(self):
+        """重连后逐条发送离线期间排队的内容，每次定时器触发只发一条"""
+        if not self.mqtt_transport or not self.mqtt_connected:
+            self.outbox_timer.stop()
+            return
+        try:
+            if self.outbox_sending is not None:
+                entry, futures = self.outbox_sending
+                if not all(future.done() for future in futures):
+                    return  # 上一条还在等待确认
+                self.outbox_sending = None
+                if any(future.cancelled() or future.exception() is not None for future in futures):
+                    # 保留在队列中，下次连接后重试
+                    logger.warning("待发送内容发送失败，下次连接后重试 - 条目: %s", entry.id)
+                    self.outbox_timer.stop()
+                    return
+                self.outbox.remove(entry.id)
+
+            entry = self.outbox.peek()
+            if entry is None:
+                self.outbox_timer.stop()
+                logger.info("待发送队列已清空")
+                return
+            # 对端未必有增量基准，始终发送完整内容
+            futures = self.send_clipboard_content(entry.content_type, self.outbox.read(entry),
+                                                  is_compressed=entry.is_compressed)
+            if not futures:
+                self.outbox_timer.stop()
+                return
+            self.outbox_sending = (entry, futures)
+            logger.info("发送待发送队列中的%s内容 - 剩余: %s", entry.content_type, len(self.outbox))
+        except Exception as e:
+            logger.exception("发送待发送队列时出错: %s", e)
+            self.outbox_timer.stop()
 
     def setup_tray(self):
         self.tray_icon = QSystemTrayIcon(self)
@@ -654,6 +1196,14 @@ class MainWindow(QMainWindow):
         toggle_action = tray_menu.addAction("显示/隐藏")
         toggle_action.triggered.connect(self.toggle_window)
         
+        # 用最新的历史记录重新训练压缩字典
+        train_action = tray_menu.addAction("重新训练压缩字典")
+        train_action.triggered.connect(self.train_compression_dictionary)
+        
+        # 各阶段耗时和计数
+        metrics_action = tray_menu.addAction("调试信息")
+        metrics_action.triggered.connect(self.show_metrics)
+        
         tray_menu.addSeparator()
         
         # 添加退出动作
@@ -681,55 +1231,80 @@ class MainWindow(QMainWindow):
             self.toggle_window()
 
     def show_settings(self):
+        # 保存后由 on_config_changed 应用新设置
         dialog = SettingsDialog(self)
-        if dialog.exec() == SettingsDialog.Accepted:
-            self.setup_mqtt()  # 重新连接MQTT服务器
+        dialog.exec()
 
     def cleanup_and_quit(self):
         """清理并退出程序"""
-        print("开始清理资源...")
+        logger.info("开始清理资源...")
         try:
             # 停止所有定时器
             if hasattr(self, 'clipboard_timer'):
                 self.clipboard_timer.stop()
-            if hasattr(self, 'reconnect_timer'):
-                self.reconnect_timer.stop()
+            if hasattr(self, 'reconnect_scheduler'):
+                self.reconnect_scheduler.cancel()
+            if hasattr(self, 'outbox_timer'):
+                self.outbox_timer.stop()
+            
+            # 停止指标端点，开启了定期保存时写入最后一次
+            if getattr(self, 'metrics_server', None):
+                self.metrics_server.stop()
+            if hasattr(self, 'metrics_dump_timer') and self.metrics_dump_timer.isActive():
+                self.metrics_dump_timer.stop()
+                self.dump_metrics()
+            
+            # 停止后台编码
+            if hasattr(self, 'encode_pipeline'):
+                self.encode_pipeline.shutdown()
+                logger.info("编码统计:\n%s", self.data_processor.stats.summary())
+            
+            # 停止缩略图生成并写完剩余的历史记录
+            if hasattr(self, 'history_model'):
+                self.history_model.shutdown()
+            if hasattr(self, 'history_store'):
+                logger.debug("保存历史记录...")
+                self.history_store.close()
             
             # 断开MQTT连接
-            if hasattr(self, 'mqtt_client') and self.mqtt_client:
+            if hasattr(self, 'mqtt_transport') and self.mqtt_transport:
                 try:
-                    print("断开MQTT连接...")
-                    if self.mqtt_client.is_connected():
+                    logger.debug("断开MQTT连接...")
+                    if self.mqtt_transport.is_connected():
                         self.publish_status("offline")
-                        self.mqtt_client.disconnect()
-                    self.mqtt_client.loop_stop()
+                    # 等待离线状态等已排队的消息发出后断开
+                    self.mqtt_transport.stop()
+                    logger.info("发布统计: %s", self.mqtt_transport.stats.summary())
+                    logger.info("重连统计: %s", self.reconnect_scheduler.stats.summary())
                 except Exception as e:
-                    print(f"断开MQTT连接时出错: {str(e)}")
+                    logger.error("断开MQTT连接时出错: %s", e)
+            
+            # 未发送的内容留在待发送队列中，下次启动后补发
+            if hasattr(self, 'outbox'):
+                self.outbox.close()
             
             # 保存窗口状态
             try:
-                print("保存窗口状态...")
+                logger.debug("保存窗口状态...")
                 settings = QSettings('Copier', 'Copier')
                 settings.setValue('geometry', self.saveGeometry())
                 settings.setValue('windowState', self.saveState())
             except Exception as e:
-                print(f"保存窗口状态时出错: {str(e)}")
+                logger.error("保存窗口状态时出错: %s", e)
             
             # 清理系统托盘
             if hasattr(self, 'tray_icon'):
-                print("清理系统托盘...")
+                logger.debug("清理系统托盘...")
                 self.tray_icon.hide()
                 self.tray_icon.deleteLater()
             
-            print("清理完成，准备退出...")
+            logger.info("清理完成，准备退出...")
             # 使用 singleShot 确保在主线程中退出
             QTimer.singleShot(0, lambda: (
                 QApplication.instance().quit()
             ))
         except Exception as e:
-            print(f"清理资源时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("清理资源时出错: %s", e)
             # 如果清理失败，强制退出
             QApplication.instance().quit()
 
@@ -763,6 +1338,10 @@ class MainWindow(QMainWindow):
         hide_shortcut = QShortcut(QKeySequence("Esc"), self)
         hide_shortcut.activated.connect(self.hide)
         
+        # Ctrl+Shift+D 打开调试面板
+        metrics_shortcut = QShortcut(QKeySequence("Ctrl+Shift+D"), self)
+        metrics_shortcut.activated.connect(self.show_metrics)
+        
         # Ctrl+Q 退出程序
         quit_shortcut = QShortcut(QKeySequence("Ctrl+Q"), self)
         quit_shortcut.activated.connect(self.cleanup_and_quit)
@@ -781,87 +1360,113 @@ class MainWindow(QMainWindow):
         current_text = self.search_box.text()
         self.filter_history(current_text)
 
+    def on_search_text_changed(self, text):
+        """搜索框输入变化时延迟执行搜索，连续输入只搜索一次"""
+        self.search_timer.start()
+
     def filter_history(self, text):
         """根据搜索文本过滤历史记录"""
-        text = text.lower()
-        for i in range(self.history_list.count()):
-            item = self.history_list.item(i)
-            if not hasattr(item, 'clipboard_item'):
-                continue
-                
-            clipboard_item = item.clipboard_item
-            if clipboard_item.content_type == "text":
-                content = clipboard_item.content.lower()
-                item.setHidden(text not in content)
-            else:  # image
-                item.setHidden(bool(text) and text != "图片")
+        text = text.strip()
+        if not text:
+            self.history_model.set_filter(None)
+            return
+            
+        try:
+            start = time.perf_counter()
+            matched_ids = self.history_store.search(text, self.SEARCH_RESULT_LIMIT)
+            logger.info("搜索 \"%s\" 命中 %s 条，耗时 %.1fms",
+                        text, len(matched_ids), (time.perf_counter() - start) * 1000)
+        except Exception as e:
+            logger.error("搜索历史记录时出错: %s", e)
+            return
+            
+        # 搜索结果直接来自存储，包含列表中尚未加载的旧记录
+        self.history_model.set_filter(matched_ids)
 
-    def add_to_history(self, content_type: str, content, timestamp: int):
+    def add_to_history(self, content_type: str, content, timestamp: int, fingerprint: str | None = None):
         """添加内容到历史记录"""
-        # 创建新的历史记录项
-        clipboard_item = ClipboardItem(content_type, content, timestamp)
-        list_item = QListWidgetItem()
-        list_item.clipboard_item = clipboard_item
-        
-        # 设置文本和样式
-        self.update_list_item(list_item)
-        
-        # 将新项添加到列表开头
-        self.history_list.insertItem(0, list_item)
+        # 写入持久化存储（后台线程完成）
+        entry_id = self.history_store.add(content_type, content, timestamp, fingerprint)
         
-        # 如果超过最大历史记录数，删除最后一项
-        while self.history_list.count() > 50:
-            self.history_list.takeItem(self.history_list.count() - 1)
+        # 创建新的历史记录项并添加到列表开头
+        clipboard_item = ClipboardItem(content_type, content, timestamp, fingerprint,
+                                       entry_id, self.history_store)
+        self.history_model.prepend(clipboard_item, self.HISTORY_CONTENT_IN_MEMORY)
+
+    def load_history(self):
+        """启动时从存储加载历史记录ID，元数据和缩略图在显示时按需读取"""
+        try:
+            self.history_model.load()
+            logger.info("已加载 %s 条历史记录", self.history_model.rowCount())
+        except Exception as e:
+            logger.exception("加载历史记录时出错: %s", e)
 
     def setup_mqtt(self):
-        """设置MQTT客户端"""
+        """设置MQTT客户端，启动时和修改设置后调用"""
+        self.reconnect_scheduler.cancel()
         try:
-            if self.mqtt_client:
+            if self.mqtt_transport:
+                # 旧连接的信号不再处理，避免其断开回调影响新连接
+                old_transport = self.mqtt_transport
+                old_transport.blockSignals(True)
                 try:
-                    self.mqtt_client.disconnect()
-                except:
-                    pass
+                    old_transport.stop(timeout=0)
+                except Exception as e:
+                    logger.error("停止旧的MQTT连接时出错: %s", e)
+                old_transport.deleteLater()
+                self.mqtt_transport = None
                     
+            # paho客户端（含ssl）和asyncio在窗口显示后才导入
+            import paho.mqtt.client as mqtt
+            from mqtt_transport import create_transport, DEFAULT_MAX_INFLIGHT
+            
             # 加载配置
             config = load_config()
-            mqtt_config = config.get('mqtt', {})
+            mqtt_config = config.mqtt
+            self.mqtt_connection_settings = {key: value for key, value in mqtt_config.items()
+                                             if key not in LIVE_MQTT_SETTINGS}
             
             # 创建新的客户端实例
             client_id = f"copier_{platform.node()}_{uuid.uuid4().hex[:8]}"
-            self.mqtt_client = mqtt.Client(
+            client = mqtt.Client(
                 client_id=client_id,
                 protocol=mqtt.MQTTv5,
                 transport="tcp",
-                callback_api_version=mqtt.CallbackAPIVersion.VERSION2
+                callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                reconnect_on_failure=False  # 由reconnect_scheduler安排重连
             )
             
-            # 设置回调
-            self.mqtt_client.on_connect = self.on_connect
-            self.mqtt_client.on_disconnect = self.on_disconnect
-            self.mqtt_client.on_message = self.on_mqtt_message
-            self.mqtt_client.on_publish = self.on_publish
+            # 由传输驱动网络循环，回调经信号在GUI线程中执行
+            self.mqtt_transport = create_transport(client, mqtt_config.get('loop', 'asyncio'),
+                                                   mqtt_config.get('max_inflight', DEFAULT_MAX_INFLIGHT), self)
+            self.mqtt_transport.connected.connect(self.on_connect)
+            self.mqtt_transport.connect_error.connect(self.on_connect_error)
+            self.mqtt_transport.disconnected.connect(self.on_disconnect)
+            self.mqtt_transport.message_received.connect(self.on_mqtt_message)
+            self.mqtt_transport.published.connect(self.on_publish)
+            self.mqtt_transport.publish_failed.connect(self.on_publish_failed)
             
             # 设置客户端选项
-            self.mqtt_client.enable_logger()
+            client.enable_logger()
             
             try:
                 # 设置连接属性
-                connect_properties = mqtt.Properties(mqtt.PacketTypes.CONNECT)
+                connect_properties = Properties(PacketTypes.CONNECT)
                 connect_properties.SessionExpiryInterval = 0  # 会话在断开连接时立即过期
                 
                 # 设置遗嘱消息
-                will_properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+                will_properties = Properties(PacketTypes.PUBLISH)
                 will_properties.MessageExpiryInterval = 3600  # 1小时后过期
                 will_properties.ContentType = "application/json"
                 
                 will_payload = json.dumps({
-                    "client_id": client_id,
+                    "client_id": self.client_id,
                     "status": "offline",
                     "timestamp": int(time.time())
                 }).encode()
                 
-                self.mqtt_client.will_set(
-                    topic=f"{mqtt_config.get('topic_prefix', 'copier/clipboard')}/status",
+                client.will_set(
+                    topic=f"{mqtt_config.get('topic_prefix', 'copier/clipboard')}/{self.client_id}/status",
                     payload=will_payload,
                     qos=1,
                     retain=True,
@@ -871,6 +1476,7 @@ class MainWindow(QMainWindow):
                 # 设置TLS（如果配置了）
                 if mqtt_config.get('use_tls', False):
                     # 设置TLS上下文
+                    import ssl
                     context = ssl.create_default_context()
                     
                     # 如果提供了CA证书，加载它
@@ -884,125 +1490,198 @@ class MainWindow(QMainWindow):
                     if certfile and keyfile and os.path.exists(certfile) and os.path.exists(keyfile):
                         context.load_cert_chain(certfile, keyfile)
                     
-                    self.mqtt_client.tls_set_context(context)
+                    client.tls_set_context(context)
                     
                     # 如果不验证服务器证书
                     if not mqtt_config.get('verify_cert', True):
-                        self.mqtt_client.tls_insecure_set(True)
+                        client.tls_insecure_set(True)
                 
                 # 设置用户名和密码（如果配置了）
                 username = mqtt_config.get('username')
                 password = mqtt_config.get('password')
                 if username:
-                    self.mqtt_client.username_pw_set(username, password)
+                    client.username_pw_set(username, password)
                 
                 # 连接到服务器
                 host = mqtt_config.get('host', 'localhost')
                 port = mqtt_config.get('port', 1883)
                 keepalive = mqtt_config.get('keepalive', 60)
                 
-                print(f"正在连接到MQTT服务器 {host}:{port}")
-                self.mqtt_client.connect(
-                    host=host,
-                    port=port,
-                    keepalive=keepalive,
-                    properties=connect_properties
-                )
-                
-                # 启动网络循环
-                self.mqtt_client.loop_start()
+                logger.info("正在连接到MQTT服务器 %s:%s", host, port)
+                # 连接结果通过 connected/connect_error 信号返回
+                self.mqtt_transport.connect(host, port, keepalive, connect_properties)
                 
             except Exception as e:
-                print(f"连接MQTT服务器时出错: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                self.reconnect_timer.start()
+                logger.exception("连接MQTT服务器时出错: %s", e)
+                self.reconnect_scheduler.schedule()
                 
         except Exception as e:
-            print(f"设置MQTT时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("设置MQTT时出错: %s", e)
             
-    def on_connect(self, client, userdata, flags, reason_code, properties):
-        """MQTT v5 连接回调"""
+    def on_config_changed(self, config, sections):
+        """配置文件变化（GUI线程），sections为变化的顶层部分"""
+        try:
+            if 'image' in sections:
+                self.data_processor.image_settings = ImageEncodeSettings.from_config(config.image)
+            if 'history' in sections:
+                self.history_max_stored = config.history.get('max_stored', 5000)
+                self.history_store.max_entries = self.history_max_stored
+                self.history_model.max_entries = self.history_max_stored
+            if 'outbox' in sections:
+                self.outbox.max_entries = config.outbox.get('max_entries', DEFAULT_MAX_ENTRIES)
+                self.outbox.max_bytes = config.outbox.get('max_bytes', DEFAULT_MAX_BYTES)
+                self.outbox_timer.setInterval(config.outbox.get('drain_interval_ms', 500))
+            if 'logging' in sections:
+                log_service.apply(config.get('logging'))
+            if 'mqtt' in sections:
+                mqtt_config = config.mqtt
+                self.reconnect_scheduler.min_delay = max(0.1, float(mqtt_config.get('reconnect_min_delay',
+                                                                                    DEFAULT_MIN_DELAY)))
+                self.reconnect_scheduler.max_delay = max(self.reconnect_scheduler.min_delay,
+                                                         float(mqtt_config.get('reconnect_max_delay',
+                                                                               DEFAULT_MAX_DELAY)))
+                chunk_size = max(MIN_CHUNK_SIZE, int(mqtt_config.get('chunk_size', DEFAULT_CHUNK_SIZE)))
+                self.chunk_sender.chunk_size = chunk_size
+                self.encode_pipeline.stream_chunk_size = chunk_size
+                # 服务器、认证、主题前缀（遗嘱消息和订阅）等变化需要重新建立连接
+                connection = {key: value for key, value in mqtt_config.items() if key not in LIVE_MQTT_SETTINGS}
+                if connection != self.mqtt_connection_settings:
+                    logger.info("MQTT连接设置已变化，重新连接")
+                    self.setup_mqtt()
+        except Exception as e:
+            logger.exception("应用配置时出错: %s", e)
+
+    def reconnect_mqtt(self):
+        """重连定时到达，复用现有客户端重新连接，不重新读取配置"""
+        if not self.mqtt_transport:
+            self.setup_mqtt()
+            return
+        logger.info("正在重新连接MQTT服务器")
+        self.status_label.setText("正在重连...")
+        self.mqtt_transport.reconnect()
+
+    def is_current_transport(self) -> bool:
+        """连接状态信号是否来自当前的传输，已被替换的旧连接排队中的信号应忽略"""
+        return self.sender() is self.mqtt_transport
+        
+    def on_connect_error(self, error):
+        """无法建立MQTT连接（GUI线程）"""
+        if not self.is_current_transport():
+            return
+        logger.error("连接MQTT服务器时出错: %s", error)
+        self.mqtt_connected = False
+        self.status_label.setText(f"连接错误: {error}")
+        self.reconnect_scheduler.schedule()
+        
+    def on_connect(self, reason_code, properties):
+        """MQTT v5 连接回调（GUI线程）"""
+        if not self.is_current_transport():
+            return
         try:
             if reason_code.is_failure:
-                print(f"MQTT连接失败，原因: {reason_code.getName()}")
+                logger.warning("MQTT连接失败，原因: %s", reason_code.getName())
                 self.mqtt_connected = False
                 self.status_label.setText(f"连接失败: {reason_code.getName()}")
-                QMetaObject.invokeMethod(self.reconnect_timer, "start", Qt.QueuedConnection)
+                self.reconnect_scheduler.schedule()
                 return
                 
-            print(f"MQTT连接成功，返回码: {reason_code.value}")
+            logger.info("MQTT连接成功，返回码: %s", reason_code.value)
             self.mqtt_connected = True
             self.status_label.setText("已连接")
-            QMetaObject.invokeMethod(self.reconnect_timer, "stop", Qt.QueuedConnection)
+            self.reconnect_scheduler.connected()
+            if startup_profiler.enabled and startup_profiler.first("MQTT连接成功"):
+                logger.info("启动后 %.1fms MQTT连接成功", startup_profiler.elapsed() * 1000)
             
             # 订阅主题
             config = load_config()
             topic_prefix = config.get('mqtt', {}).get('topic_prefix', 'copier/clipboard')
             topics = [
                 (f"{topic_prefix}/+/content", 2),  # QoS 2，接收所有客户端的内容
-                (f"{topic_prefix}/+/status", 1)    # QoS 1，接收所有客户端的状态
+                (f"{topic_prefix}/+/status", 1),   # QoS 1，接收所有客户端的状态
+                (f"{topic_prefix}/status", 1),     # QoS 1，接收状态（含旧版客户端）
+                (f"{topic_prefix}/+/chunk", 1),    # QoS 1，接收大负载的分块
+                (f"{topic_prefix}/{self.client_id}/resend", 1),  # QoS 1，其他客户端的补发请求
+                (f"{topic_prefix}/{self.client_id}/nack", 1),    # QoS 1，无法还原增量的对端请求完整内容
+                (f"{topic_prefix}/{self.client_id}/trace", 0),   # QoS 0，端到端延迟跟踪的确认和回复
+                (f"{topic_prefix}/dictionaries/+", 1)            # QoS 1，对端发布的压缩字典（保留消息）
             ]
+            if topic_prefix != "copier":
+                topics.append(("copier/+/content", 1))  # QoS 1，旧版客户端的JSON内容
             
             # 订阅主题
             for topic, qos in topics:
-                print(f"订阅主题: {topic}, QoS: {qos}")
-                subscribe_properties = mqtt.Properties(mqtt.PacketTypes.SUBSCRIBE)
+                logger.debug("订阅主题: %s, QoS: %s", topic, qos)
+                subscribe_properties = Properties(PacketTypes.SUBSCRIBE)
                 subscribe_properties.SubscriptionIdentifier = 1
-                self.mqtt_client.subscribe(topic, qos=qos, properties=subscribe_properties)
+                self.mqtt_transport.subscribe(topic, qos=qos, properties=subscribe_properties)
                 
             # 发布上线状态
             status_payload = json.dumps({
                 "client_id": self.client_id,
                 "status": "online",
+                "protocol_version": PROTOCOL_VERSION,
+                "dictionaries": self.compression_dictionaries.ids(),
                 "timestamp": int(time.time())
             }).encode()
             
-            status_properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+            status_properties = Properties(PacketTypes.PUBLISH)
             status_properties.MessageExpiryInterval = 3600  # 1小时后过期
             status_properties.ContentType = "application/json"
             
-            self.mqtt_client.publish(
-                topic=f"{topic_prefix}/status",
+            # 每个客户端的状态保留在各自的主题上，后上线的客户端能收到所有对端的协议版本
+            self.mqtt_transport.publish(
+                topic=f"{topic_prefix}/{self.client_id}/status",
                 payload=status_payload,
                 qos=1,
                 retain=True,
                 properties=status_properties
             )
             
+            # 断线期间未收完的分块传输请求补发
+            self.request_missing_chunks()
+            
+            # 补发离线期间的内容，第一条在间隔后发送，先收到对端的状态以便协商协议版本
+            if len(self.outbox):
+                logger.info("待发送队列中有 %s 条内容，开始补发", len(self.outbox))
+                self.outbox_sending = None
+                self.outbox_timer.start()
+            
+            # 发布本地压缩字典；还没有字典时用历史记录训练一个
+            if self.compression_dictionaries.ids():
+                self.publish_dictionaries()
+            else:
+                self.train_compression_dictionary()
+            
         except Exception as e:
-            print(f"处理连接回调时出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("处理连接回调时出错: %s", e)
             self.mqtt_connected = False
             self.status_label.setText(f"连接错误: {str(e)}")
-            QMetaObject.invokeMethod(self.reconnect_timer, "start", Qt.QueuedConnection)
+            self.reconnect_scheduler.schedule()
             
     def publish_status(self, status):
         """发布客户端状态到MQTT服务器"""
-        if not self.mqtt_client or not self.mqtt_connected:
-            print(f"MQTT未连接，无法发布状态: {status}")
+        if not self.mqtt_transport or not self.mqtt_connected:
+            logger.warning("MQTT未连接，无法发布状态: %s", status)
             return
             
         try:
             config = load_config()
             topic_prefix = config.get('mqtt', {}).get('topic_prefix', 'copier/clipboard')
-            topic = f"{topic_prefix}/status"
+            topic = f"{topic_prefix}/{self.client_id}/status"
             
             payload = {
                 "client_id": self.client_id,
                 "status": status,
+                "protocol_version": PROTOCOL_VERSION,
+                "dictionaries": self.compression_dictionaries.ids(),
                 "timestamp": int(time.time() * 1000)
             }
             
-            print(f"正在发布状态: {status}")
-            result = self.mqtt_client.publish(topic, json.dumps(payload), qos=1, retain=True)
-            print(f"状态发布结果: {result}")
+            logger.debug("正在发布状态: %s", status)
+            self.mqtt_transport.publish(topic, json.dumps(payload), qos=1, retain=True)
             
         except Exception as e:
-            print(f"发布状态时出错: {str(e)}")
+            logger.error("发布状态时出错: %s", e)
 
     def setup_ui(self):
         self.setWindowTitle(f"Copier v{self.VERSION}")
@@ -1030,18 +1709,18 @@ class MainWindow(QMainWindow):
             QPushButton:hover {
                 background-color: #454545;
             }
-            QListWidget {
+            QListView {
                 background-color: #2b2b2b;
                 border: 1px solid #555555;
                 color: #ffffff;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 5px;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #3b3b3b;
             }
-            QListWidget::item:hover {
+            QListView::item:hover {
                 background-color: #353535;
             }
             QScrollBar:vertical {
@@ -1090,7 +1769,13 @@ class MainWindow(QMainWindow):
         # 添加搜索框
         self.search_box = QLineEdit()
         self.search_box.setPlaceholderText("搜索历史记录...")
-        self.search_box.textChanged.connect(self.filter_history)
+        self.search_box.textChanged.connect(self.on_search_text_changed)
+        
+        # 搜索防抖：停止输入150ms后再查询
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(lambda: self.filter_history(self.search_box.text()))
         self.search_box.setStyleSheet("""
             QLineEdit {
                 background-color: #3b3b3b;
@@ -1107,9 +1792,13 @@ class MainWindow(QMainWindow):
         left_layout.addWidget(header_widget)
         
         # 历史列表
-        self.history_list = QListWidget()
-        self.history_list.itemClicked.connect(self.on_history_item_clicked)
-        self.history_list.itemDoubleClicked.connect(self.on_history_item_double_clicked)
+        self.history_list = QListView()
+        self.history_list.setModel(self.history_model)
+        self.history_list.setUniformItemSizes(True)  # 所有行等高，滚动时无需逐行计算尺寸
+        self.history_list.setIconSize(QSize(HistoryListModel.ICON_SIZE, HistoryListModel.ICON_SIZE))
+        self.history_list.setSelectionMode(QListView.SelectionMode.SingleSelection)
+        self.history_list.clicked.connect(self.on_history_item_clicked)
+        self.history_list.doubleClicked.connect(self.on_history_item_double_clicked)
         left_layout.addWidget(self.history_list)
         
         # 创建右侧面板
@@ -1191,9 +1880,6 @@ class MainWindow(QMainWindow):
         splitter.setStretchFactor(1, 2)  # 右侧面板
         
         main_layout.addWidget(splitter)
-        
-        # 初始化系统托盘
-        self.setup_tray()
 
     def on_clipboard_change(self):
         """剪贴板内容变化回调"""
@@ -1206,84 +1892,63 @@ class MainWindow(QMainWindow):
             
             # 检查处理间隔
             if current_time - self.last_processed_time < 2:  # 至少2秒间隔
-                print("处理间隔太短，跳过")
+                logger.info("处理间隔太短，跳过")
                 return
                 
-            mime = self.clipboard.mimeData()
-            current_hash = None
-            
-            if mime.hasImage():
-                image = mime.imageData()
-                if image and not image.isNull():
-                    # 转换为固定格式和大小的图片以确保一致性
-                    scaled_image = image.scaled(800, 800, Qt.AspectRatioMode.KeepAspectRatio, 
-                                             Qt.TransformationMode.SmoothTransformation)
-                    buffer = QByteArray()
-                    buffer_device = QBuffer(buffer)
-                    buffer_device.open(QBuffer.OpenModeFlag.WriteOnly)
-                    scaled_image.save(buffer_device, "PNG")
-                    buffer_device.close()
-                    current_hash = hashlib.md5(buffer.data()).hexdigest()
-                    buffer = None  # 清理缓冲区
-            
-            if mime.hasText():
-                text = mime.text()
-                if text:
-                    current_hash = hashlib.md5(text.encode()).hexdigest()
-            elif mime.hasUrls():
-                for url in mime.urls():
-                    file_path = url.toLocalFile()
-                    if file_path and any(file_path.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']):
-                        try:
-                            image = QImage(file_path)
-                            if not image.isNull():
-                                # 转换为固定格式和大小的图片以确保一致性
-                                scaled_image = image.scaled(800, 800, Qt.AspectRatioMode.KeepAspectRatio, 
-                                                         Qt.TransformationMode.SmoothTransformation)
-                                buffer = QByteArray()
-                                buffer_device = QBuffer(buffer)
-                                buffer_device.open(QBuffer.OpenModeFlag.WriteOnly)
-                                scaled_image.save(buffer_device, "PNG")
-                                buffer_device.close()
-                                current_hash = hashlib.md5(buffer.data()).hexdigest()
-                                buffer = None  # 清理缓冲区
-                        except Exception as e:
-                            print(f"处理图片文件时出错: {str(e)}")
-            
-            # 如果内容有变化，处理新内容
-            if current_hash and current_hash != self.last_processed_hash:
-                print(f"检测到剪贴板内容变化，新哈希值: {current_hash}")
-                self.last_processed_hash = current_hash
-                
+            # capture 为读取剪贴板内容的总耗时，包含其中计算指纹的 hash 阶段
+            captured_at = now_us()
+            with metrics.stage("capture").time():
+                mime = self.clipboard.mimeData()
+                current_hash = None
+                text = None
+                image = None
+                image_path = None
+            
+                # 每次变化只读取一次内容并计算一次指纹
                 if mime.hasImage():
                     image = mime.imageData()
                     if image and not image.isNull():
-                        print("从剪贴板获取到新图片")
-                        self.last_processed_time = current_time
-                        self.process_image(image)
-                elif mime.hasText():
+                        current_hash = self.clipboard_fingerprint(image_fingerprint, image)
+                    else:
+                        image = None
+            
+                if image is None and mime.hasText():
                     text = mime.text()
                     if text:
-                        print(f"从剪贴板获取到文本，长度：{len(text)}")
-                        self.last_processed_time = current_time
-                        self.process_text(text)
-                elif mime.hasUrls():
+                        current_hash = self.clipboard_fingerprint(text_fingerprint, text)
+                elif image is None and mime.hasUrls():
                     for url in mime.urls():
                         file_path = url.toLocalFile()
                         if file_path and any(file_path.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']):
                             try:
-                                image = QImage(file_path)
-                                if not image.isNull():
-                                    print(f"从文件加载图片: {file_path}")
-                                    self.last_processed_time = current_time
-                                    self.process_image(image)
+                                file_image = QImage(file_path)
+                                if not file_image.isNull():
+                                    image = file_image
+                                    image_path = file_path
+                                    current_hash = self.clipboard_fingerprint(image_fingerprint, image)
+                                    break
                             except Exception as e:
-                                print(f"处理图片文件时出错: {str(e)}")
+                                logger.error("处理图片文件时出错: %s", e)
+            
+            # 如果内容有变化，处理新内容
+            if current_hash and current_hash != self.last_processed_hash:
+                logger.debug("检测到剪贴板内容变化，新哈希值: %s", current_hash)
+                metrics.counter("copier_clipboard_changes_total", "检测到的本机剪贴板变化次数").inc()
+                self.last_processed_hash = current_hash
+                self.last_processed_time = current_time
+                
+                if image is not None:
+                    if image_path:
+                        logger.debug("从文件加载图片: %s", image_path)
+                    else:
+                        logger.debug("从剪贴板获取到新图片")
+                    self.process_image(image, current_hash, captured_at)
+                elif text:
+                    logger.debug("从剪贴板获取到文本，长度：%s", len(text))
+                    self.process_text(text, current_hash, captured_at)
             
         except Exception as e:
-            print(f"处理剪贴板变化时出错: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("处理剪贴板变化时出错: %s", e)
             
         finally:
             self.is_processing = False
@@ -1292,11 +1957,23 @@ class MainWindow(QMainWindow):
         import gc
         gc.collect()
         
+    def clipboard_fingerprint(self, fingerprint, content) -> str:
+        """计算剪贴板内容的指纹，计入 hash 阶段的耗时"""
+        with metrics.stage("hash").time():
+            return fingerprint(content)
+
     def on_polling_timer(self):
         """轮询定时器回调"""
         pass
 
 if __name__ == "__main__":
+    startup_profiler.enabled = '--profile-startup' in sys.argv
+    # 日志在单独的线程中写入 ~/.copier/logs，退出前写完剩余的记录
+    log_service.start(load_config().get('logging'))
+    startup_profiler.mark("启动日志")
     app = QApplication(sys.argv)
+    startup_profiler.mark("创建QApplication")
     window = MainWindow()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    log_service.stop()
+    sys.exit(exit_code)
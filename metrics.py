@@ -0,0 +1,244 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from config import CONFIG_DIR
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = os.path.join(CONFIG_DIR, 'metrics.json')
+
+# 耗时直方图的分桶上限（秒），从50µs（文本指纹）到10s（超大图片）
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+# 剪贴板内容从捕获到写入对端剪贴板经过的阶段
+STAGES = ("capture", "hash", "encode", "compress", "publish", "receive", "decode", "clipboard_set")
+STAGE_METRIC = "copier_stage_seconds"
+
+
+class Counter:
+    """只增不减的计数"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _Timer:
+    """with块的耗时记入直方图"""
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram: 'Histogram'):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+
+class Histogram:
+    """固定分桶的直方图，记录次数、总和和落入各桶的次数"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # 最后一个桶是+Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, count, total = list(self._counts), self.count, self.sum
+        return {
+            "count": count,
+            "sum": total,
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts)),
+            "p50": self._quantile(counts, count, 0.50),
+            "p95": self._quantile(counts, count, 0.95),
+            "p99": self._quantile(counts, count, 0.99),
+        }
+
+    def _quantile(self, counts: list[int], count: int, q: float) -> float | None:
+        """按分桶估计分位数，在桶内线性插值"""
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """计数和直方图的登记处，可导出为Prometheus文本格式或JSON
+
+    counter/histogram 按名称和标签返回同一个对象，可在任意线程中调用；
+    collector 在导出时调用，把已有的统计（压缩、重连、待发送队列等）转换为指标。
+    """
+
+    def __init__(self):
+        self._metrics = {}  # (名称, 标签) -> Counter/Histogram
+        self._descriptions = {}  # 名称 -> (类型, 说明)
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, kind: str, name: str, description: str, labels: dict, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = factory()
+                    self._descriptions.setdefault(name, (kind, description))
+        return metric
+
+    def counter(self, name: str, description: str = "", **labels) -> Counter:
+        return self._get("counter", name, description, labels, Counter)
+
+    def histogram(self, name: str, description: str = "", buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+        return self._get("histogram", name, description, labels, lambda: Histogram(buckets))
+
+    def stage(self, stage: str) -> Histogram:
+        """处理阶段的耗时直方图"""
+        return self.histogram(STAGE_METRIC, "剪贴板同步各阶段的耗时（秒）", stage=stage)
+
+    def add_collector(self, collector):
+        """collector() 返回 [(名称, 类型, 说明, 标签dict, 值)]，类型为 counter 或 gauge"""
+        self._collectors.append(collector)
+
+    def _items(self) -> list:
+        with self._lock:
+            return sorted(self._metrics.items(), key=lambda item: item[0])
+
+    def _collected(self) -> list:
+        samples = []
+        for collector in list(self._collectors):
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logger.error("收集指标时出错: %s", e)
+        return samples
+
+    def snapshot(self) -> dict:
+        """所有指标的当前值，直方图包含分位数估计"""
+        result = {}
+        for (name, labels), metric in self._items():
+            value = metric.snapshot() if isinstance(metric, Histogram) else metric.value
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for name, _, _, labels, value in self._collected():
+            result.setdefault(name, []).append({"labels": labels, "value": value})
+        return result
+
+    def to_prometheus(self) -> str:
+        lines = []
+        described = set()
+
+        def describe(name, kind, description):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), metric in self._items():
+            kind, description = self._descriptions[name]
+            describe(name, kind, description)
+            if isinstance(metric, Histogram):
+                snapshot = metric.snapshot()
+                cumulative = 0
+                for bound, count in snapshot["buckets"].items():
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {snapshot['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+        for name, kind, description, labels, value in self._collected():
+            describe(name, kind, description)
+            lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str = METRICS_FILE):
+        """写入JSON文件，先写临时文件再替换"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({"timestamp": int(time.time()), "metrics": self.snapshot()}, f, indent=2)
+        os.replace(temp_path, path)
+
+
+metrics = MetricsRegistry()
+
+
+class MetricsServer:
+    """在本机端口提供 /metrics（Prometheus文本格式）和 /metrics.json"""
+
+    def __init__(self, port: int, host: str = '127.0.0.1', registry: MetricsRegistry = metrics):
+        # 只有开启HTTP端点时才导入http.server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry.to_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry.snapshot()).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # 不输出每个请求
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._server.shutdown()
+        self._server.server_close()
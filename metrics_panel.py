@@ -0,0 +1,99 @@
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QPushButton
+from PySide6.QtCore import QTimer
+from PySide6.QtGui import QFontDatabase
+from metrics import metrics, STAGES, STAGE_METRIC
+
+REFRESH_INTERVAL = 1000  # 毫秒
+
+
+def _format_ms(seconds) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.2f}"
+
+
+def format_metrics(snapshot: dict) -> str:
+    """把指标快照排版为各阶段耗时表和其他指标的列表"""
+    stages = {entry["labels"].get("stage"): entry["value"] for entry in snapshot.get(STAGE_METRIC, [])}
+    # 中文标题每个字占两列，宽度相应减少
+    lines = [f"{'阶段':<14}{'次数':>6}{'平均ms':>8}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}"]
+    for stage in STAGES:
+        value = stages.get(stage)
+        if not value or not value["count"]:
+            lines.append(f"{stage:<16}{0:>8}{'-':>10}{'-':>10}{'-':>10}{'-':>10}")
+            continue
+        lines.append(f"{stage:<16}{value['count']:>8}{_format_ms(value['sum'] / value['count']):>10}"
+                     f"{_format_ms(value['p50']):>10}{_format_ms(value['p95']):>10}{_format_ms(value['p99']):>10}")
+    lines.append("")
+    for name, entries in sorted(snapshot.items()):
+        if name == STAGE_METRIC:
+            continue
+        for entry in entries:
+            labels = ",".join(f"{key}={value}" for key, value in entry["labels"].items())
+            value = entry["value"]
+            if isinstance(value, dict):
+                value = f"次数 {value['count']}, p50 {_format_ms(value['p50'])}ms"
+            lines.append(f"{name}{'{' + labels + '}' if labels else ''} {value}")
+    return "\n".join(lines)
+
+
+class MetricsDialog(QDialog):
+    """调试面板：每秒刷新各阶段耗时和计数
+
+    report 返回附加在指标之后的文本，dump 在保存指标时一并调用。
+    """
+
+    def __init__(self, parent=None, report=None, dump=None):
+        super().__init__(parent)
+        self.report = report
+        self.extra_dump = dump
+        self.setWindowTitle("调试信息")
+        self.setMinimumSize(640, 480)
+
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        layout.addWidget(self.text)
+
+        button_layout = QHBoxLayout()
+        self.dump_button = QPushButton("保存为JSON")
+        self.dump_button.clicked.connect(self.dump)
+        button_layout.addWidget(self.dump_button)
+        self.close_button = QPushButton("关闭")
+        self.close_button.clicked.connect(self.close)
+        button_layout.addWidget(self.close_button)
+        layout.addLayout(button_layout)
+
+        # 只在面板显示时刷新
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_INTERVAL)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        super().closeEvent(event)
+
+    def refresh(self):
+        scroll = self.text.verticalScrollBar().value()
+        text = format_metrics(metrics.snapshot())
+        if self.report is not None:
+            text = self.report() + "\n\n" + text
+        self.text.setPlainText(text)
+        self.text.verticalScrollBar().setValue(scroll)
+
+    def dump(self):
+        try:
+            metrics.dump()
+            if self.extra_dump is not None:
+                self.extra_dump()
+            self.setWindowTitle("调试信息 - 已保存到 ~/.copier/")
+        except Exception as e:
+            self.setWindowTitle(f"调试信息 - 保存失败: {str(e)}")
@@ -0,0 +1,438 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from collections import deque
+import paho.mqtt.client as mqtt
+from PySide6.QtCore import QObject, Signal
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_INFLIGHT = 20  # 同时等待确认的发布数，与paho默认的max_inflight_messages一致
+DEFAULT_MAX_PENDING_BYTES = 64 * 1024 * 1024  # 排队等待发送的负载上限，超过时拒绝新的发布
+MISC_INTERVAL = 1.0  # 处理心跳和超时重试的间隔（秒）
+LATENCY_SAMPLES = 1000  # 统计发布延迟时保留的最近样本数
+TRANSPORT_LOOPS = ("asyncio", "thread")
+
+
+class TransportBusyError(Exception):
+    """发送队列已满"""
+
+
+class PublishStats:
+    """发布延迟（从调用publish到收到确认）和失败次数的统计"""
+
+    def __init__(self, max_samples: int = LATENCY_SAMPLES):
+        self._latencies = deque(maxlen=max_samples)
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+            self.completed += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            completed, failed = self.completed, self.failed
+        if not latencies:
+            return {"completed": completed, "failed": failed}
+        return {
+            "completed": completed,
+            "failed": failed,
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "p95_ms": latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)] * 1000,
+            "max_ms": latencies[-1] * 1000,
+        }
+
+    def summary(self) -> str:
+        stats = self.snapshot()
+        if "p50_ms" not in stats:
+            return f"完成{stats['completed']}条, 失败{stats['failed']}条"
+        return (f"完成{stats['completed']}条, 失败{stats['failed']}条, 延迟p50 {stats['p50_ms']:.1f}ms, "
+                f"p95 {stats['p95_ms']:.1f}ms, 最大 {stats['max_ms']:.1f}ms")
+
+
+class MqttTransport(QObject):
+    """驱动paho客户端的网络循环，所有回调都通过信号转到GUI线程
+
+    publish/subscribe 可在GUI线程调用，立即返回 concurrent.futures.Future，
+    发布的Future在收到对端确认（QoS 0为写入socket）后完成，结果为mid；
+    完成和失败同时以 published/publish_failed 信号通知，调用方无需等待Future。
+    子类实现 connect/reconnect/publish/subscribe/stop。
+    """
+    connected = Signal(object, object)  # reason_code, properties
+    connect_error = Signal(str)  # 建立连接时的异常
+    disconnected = Signal(object)  # reason_code
+    message_received = Signal(object)  # paho.mqtt.client.MQTTMessage
+    published = Signal(int, object, float)  # mid, reason_code, 从调用publish到确认的秒数
+    publish_failed = Signal(str, str)  # topic, 错误信息
+    congestion_changed = Signal(bool)  # 发送队列是否已满
+
+    def __init__(self, client: mqtt.Client, max_pending_bytes: int = DEFAULT_MAX_PENDING_BYTES, parent=None):
+        super().__init__(parent)
+        self.client = client
+        self.max_pending_bytes = max_pending_bytes
+        self._pending_bytes = 0
+        self._congested = False
+        self._publishes = {}  # mid -> (Future, 调用publish的时间)
+        self._completed = {}  # 登记前已确认的mid -> (reason_code, 确认时间)
+        self._lock = threading.Lock()
+        self.stats = PublishStats()
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.on_publish = self._on_publish
+
+    # 以下回调在网络线程中执行，只发出信号
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        self.connected.emit(reason_code, properties)
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self._fail_publishes(ConnectionError(f"连接已断开: {reason_code}"))
+        self.disconnected.emit(reason_code)
+
+    def _on_message(self, client, userdata, message):
+        self.message_received.emit(message)
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        now = time.perf_counter()
+        with self._lock:
+            entry = self._publishes.pop(mid, None)
+            if entry is None:
+                # 线程模式下确认可能先于登记到达，由_track完成
+                self._completed[mid] = (reason_code, now)
+                return
+        future, started = entry
+        self._finish(future, mid, reason_code, now - started)
+
+    def _finish(self, future: concurrent.futures.Future, mid: int, reason_code, latency: float):
+        if future.done():
+            return
+        if reason_code.is_failure:
+            future.set_exception(RuntimeError(f"发布失败: {reason_code.getName()}"))
+            return
+        self.stats.record(latency)
+        metrics.stage("publish").observe(latency)
+        future.set_result(mid)
+        self.published.emit(mid, reason_code, latency)
+
+    def _track(self, info: mqtt.MQTTMessageInfo, future: concurrent.futures.Future, started: float):
+        """记录发布的mid，在on_publish时完成future"""
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            future.set_exception(ConnectionError(f"发布失败: {mqtt.error_string(info.rc)}"))
+            return
+        with self._lock:
+            completed = self._completed.pop(info.mid, None)
+            if completed is None:
+                self._publishes[info.mid] = (future, started)
+                return
+        reason_code, finished = completed
+        self._finish(future, info.mid, reason_code, finished - started)
+
+    def _begin(self, topic: str, payload) -> tuple[concurrent.futures.Future, bool]:
+        """创建发布的Future并预留队列空间，返回(Future, 是否已被拒绝)"""
+        future = concurrent.futures.Future()
+        size = self._payload_size(payload)
+        if not self._reserve(size):
+            self.stats.record_failure()
+            metrics.counter("copier_publish_failures_total", "发布失败（含队列已满被拒绝）的次数").inc()
+            future.set_exception(TransportBusyError("发送队列已满"))
+            self.publish_failed.emit(topic, "发送队列已满")
+            return future, True
+
+        def done(future):
+            self._release(size)
+            error = future.exception() if not future.cancelled() else None
+            if error is not None:
+                self.stats.record_failure()
+                metrics.counter("copier_publish_failures_total", "发布失败（含队列已满被拒绝）的次数").inc()
+                self.publish_failed.emit(topic, str(error))
+            elif not future.cancelled():
+                metrics.counter("copier_payload_bytes_total", "收发的MQTT负载字节数", direction="sent").inc(size)
+
+        future.add_done_callback(done)
+        return future, False
+
+    def _fail_publishes(self, error: Exception):
+        """连接断开后，等待确认的发布不会再有回调"""
+        with self._lock:
+            entries, self._publishes = list(self._publishes.values()), {}
+            self._completed.clear()
+        for future, _ in entries:
+            if not future.done():
+                future.set_exception(error)
+
+    def _reserve(self, size: int) -> bool:
+        """为待发送的负载预留队列空间，队列已满时返回False"""
+        with self._lock:
+            # 队列为空时总是接受，单个超大负载也能发出
+            if self._pending_bytes and self._pending_bytes + size > self.max_pending_bytes:
+                newly_congested = not self._congested
+                self._congested = True
+            else:
+                self._pending_bytes += size
+                return True
+        if newly_congested:
+            self.congestion_changed.emit(True)
+        return False
+
+    def _release(self, size: int):
+        with self._lock:
+            self._pending_bytes -= size
+            relieved = self._congested and self._pending_bytes <= self.max_pending_bytes // 2
+            if relieved:
+                self._congested = False
+        if relieved:
+            self.congestion_changed.emit(False)
+
+    @staticmethod
+    def _payload_size(payload) -> int:
+        if payload is None:
+            return 0
+        return len(payload.encode('utf-8') if isinstance(payload, str) else payload)
+
+    def is_connected(self) -> bool:
+        return self.client.is_connected()
+
+    def pending_bytes(self) -> int:
+        with self._lock:
+            return self._pending_bytes
+
+    def connect(self, host: str, port: int, keepalive: int, properties=None):
+        raise NotImplementedError
+
+    def reconnect(self):
+        """复用当前客户端及其连接参数重新连接，结果同样通过 connected/connect_error 信号返回"""
+        raise NotImplementedError
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False,
+                properties=None) -> concurrent.futures.Future:
+        raise NotImplementedError
+
+    def subscribe(self, topic: str, qos: int = 0, properties=None) -> concurrent.futures.Future:
+        raise NotImplementedError
+
+    def stop(self, timeout: float = 2.0):
+        """断开连接并停止网络循环，timeout内尽量发完已排队的消息"""
+        raise NotImplementedError
+
+
+class ThreadMqttTransport(MqttTransport):
+    """使用paho自带的后台线程（loop_start）"""
+
+    def connect(self, host: str, port: int, keepalive: int, properties=None):
+        try:
+            self.client.connect(host=host, port=port, keepalive=keepalive, properties=properties)
+        except Exception as e:
+            self.connect_error.emit(str(e))
+            return
+        self.client.loop_start()
+
+    def reconnect(self):
+        try:
+            # 客户端创建时关闭了自动重连，连接断开后网络线程已退出
+            self.client.loop_stop()
+            self.client.reconnect()
+        except Exception as e:
+            self.connect_error.emit(str(e))
+            return
+        self.client.loop_start()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        started = time.perf_counter()
+        future, rejected = self._begin(topic, payload)
+        if rejected:
+            return future
+        try:
+            info = self.client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+            self._track(info, future, started)
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def subscribe(self, topic, qos=0, properties=None):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(self.client.subscribe(topic, qos=qos, properties=properties))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def stop(self, timeout=2.0):
+        try:
+            if self.client.is_connected():
+                self.client.disconnect()
+        finally:
+            self.client.loop_stop()
+        self._fail_publishes(ConnectionError("传输已停止"))
+
+
+class AsyncioMqttTransport(MqttTransport):
+    """在专用线程的asyncio事件循环中驱动paho客户端
+
+    socket读写由事件循环的add_reader/add_writer触发，客户端只在循环线程中访问；
+    发布经信号量限制同时等待确认的数量，超过的在循环中排队，不阻塞调用方。
+    """
+
+    def __init__(self, client: mqtt.Client, max_inflight: int = DEFAULT_MAX_INFLIGHT,
+                 max_pending_bytes: int = DEFAULT_MAX_PENDING_BYTES, parent=None):
+        super().__init__(client, max_pending_bytes, parent)
+        # 窗口由本类控制，paho内部不再限制，避免消息滞留在paho队列中无法计时
+        client.max_inflight_messages_set(0)
+        self.max_inflight = max_inflight
+        self._loop = asyncio.new_event_loop()
+        self._inflight = None  # 在循环线程中创建
+        self._misc_task = None
+        self._thread = threading.Thread(target=self._run_loop, name="mqtt-asyncio", daemon=True)
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._inflight = asyncio.Semaphore(self.max_inflight)
+        self._loop.run_forever()
+        # 取消仍在等待的任务（心跳、排队中的发布）后再关闭循环
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    # socket回调都发生在循环线程中（由connect/loop_read/loop_write触发）
+    def _on_socket_open(self, client, userdata, sock):
+        self._loop.add_reader(sock, client.loop_read)
+        if self._misc_task is None:
+            self._misc_task = self._loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        # 发送心跳、检查超时；loop_misc在连接断开后返回错误
+        try:
+            while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                await asyncio.sleep(MISC_INTERVAL)
+        finally:
+            self._misc_task = None
+
+    def _call(self, func, *args) -> concurrent.futures.Future:
+        """在循环线程中执行func，返回其结果的Future"""
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        if self._loop.is_closed():
+            future.set_exception(RuntimeError("传输已停止"))
+        else:
+            self._loop.call_soon_threadsafe(run)
+        return future
+
+    def connect(self, host, port, keepalive, properties=None):
+        def connect():
+            try:
+                # 连接在循环线程中同步进行（含DNS和TLS握手），不占用GUI线程
+                self.client.connect(host=host, port=port, keepalive=keepalive, properties=properties)
+            except Exception as e:
+                self.connect_error.emit(str(e))
+
+        self._call(connect)
+
+    def reconnect(self):
+        def reconnect():
+            if self.client.is_connected():
+                return
+            try:
+                self.client.reconnect()
+            except Exception as e:
+                self.connect_error.emit(str(e))
+
+        self._call(reconnect)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        # 延迟从调用时开始计算，包含在窗口外排队的时间
+        started = time.perf_counter()
+        future, rejected = self._begin(topic, payload)
+        if rejected:
+            return future
+
+        async def publish():
+            try:
+                async with self._inflight:
+                    if future.done():
+                        return
+                    done = asyncio.wrap_future(future)
+                    try:
+                        info = self.client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+                        self._track(info, future, started)
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                    # 确认到达（或连接断开）后才让出窗口
+                    await asyncio.wait([done])
+            except asyncio.CancelledError:
+                # 传输停止时仍在排队
+                if not future.done():
+                    future.set_exception(ConnectionError("传输已停止"))
+                raise
+
+        try:
+            asyncio.run_coroutine_threadsafe(publish(), self._loop)
+        except RuntimeError as e:
+            future.set_exception(e)
+        return future
+
+    def subscribe(self, topic, qos=0, properties=None):
+        return self._call(self.client.subscribe, topic, qos, None, properties)
+
+    def stop(self, timeout=2.0):
+        async def shutdown():
+            # 尽量等待已排队的发布完成，再断开连接
+            deadline = self._loop.time() + timeout
+            while self.pending_bytes() and self._loop.time() < deadline and self.client.is_connected():
+                await asyncio.sleep(0.05)
+            if self.client.is_connected():
+                self.client.disconnect()
+                # 等DISCONNECT包写出
+                while self.client.want_write() and self._loop.time() < deadline:
+                    await asyncio.sleep(0.01)
+            self._fail_publishes(ConnectionError("传输已停止"))
+            self._loop.stop()
+
+        if self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join(timeout + 1.0)
+
+
+def create_transport(client: mqtt.Client, loop: str = "asyncio", max_inflight: int = DEFAULT_MAX_INFLIGHT,
+                     parent=None) -> MqttTransport:
+    """按配置的网络循环创建传输，max_inflight为同时等待确认的发布数"""
+    if loop not in TRANSPORT_LOOPS:
+        logger.warning("未知的MQTT网络循环 %s，使用 asyncio", loop)
+    if loop == "thread":
+        client.max_inflight_messages_set(max_inflight)
+        return ThreadMqttTransport(client, parent=parent)
+    return AsyncioMqttTransport(client, max_inflight, parent=parent)
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from config import CONFIG_DIR
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_FILE = os.path.join(CONFIG_DIR, 'outbox.log')
+
+DEFAULT_MAX_ENTRIES = 50  # 离线期间最多保留的条目，超过时丢弃最旧的
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 所有条目负载的总大小上限
+COMPACT_MIN_BYTES = 1024 * 1024  # 文件超过该大小且一半以上是已发送的记录时重写
+
+_RECORD_HEADER = struct.Struct(">BII")  # 记录类型, 记录体长度, 记录体CRC32
+_META_LENGTH = struct.Struct(">I")
+_RECORD_ADD = 1
+_RECORD_DONE = 2
+
+
+class OutboxEntry:
+    """等待发送的剪贴板内容"""
+
+    def __init__(self, entry_id: int, content_type: str, is_compressed: bool, content_hash: str,
+                 timestamp: int, offset: int, size: int):
+        self.id = entry_id
+        self.content_type = content_type
+        self.is_compressed = is_compressed  # 为False时负载是不可压缩的原始数据
+        self.content_hash = content_hash
+        self.timestamp = timestamp  # 毫秒
+        self.offset = offset  # 负载在日志文件中的位置
+        self.size = size
+
+
+def _encode_add(entry_id: int, content_type: str, is_compressed: bool, content_hash: str, timestamp: int,
+                payload: bytes) -> tuple[bytes, int]:
+    """编码ADD记录体，返回(记录体, 负载在记录体中的位置)"""
+    meta = json.dumps({"id": entry_id, "type": content_type, "compressed": is_compressed,
+                       "hash": content_hash, "timestamp": timestamp}).encode()
+    return _META_LENGTH.pack(len(meta)) + meta + payload, _META_LENGTH.size + len(meta)
+
+
+class Outbox:
+    """离线时待发送内容的持久化队列，保存为 ~/.copier/outbox.log
+
+    日志只追加：ADD记录保存内容，DONE记录标记已发送或被取代。启动时重放日志恢复队列，
+    末尾写了一半的记录（断电、强制退出）会被截掉。同一内容再次加入时只保留最新的一条。
+    只在GUI线程中使用。
+    """
+
+    def __init__(self, path: str = OUTBOX_FILE, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # id -> OutboxEntry，按加入顺序
+        self._next_id = 1
+        self._dead_bytes = 0  # 已发送条目在文件中占用的字节
+        self._file = None
+
+    def load(self):
+        """重放日志恢复队列"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a+b')
+        self._file.seek(0)
+        position = 0
+        while True:
+            header = self._file.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                break
+            kind, length, crc = _RECORD_HEADER.unpack(header)
+            body = self._file.read(length)
+            if len(body) < length or zlib.crc32(body) != crc or kind not in (_RECORD_ADD, _RECORD_DONE):
+                break
+            body_offset = position + _RECORD_HEADER.size
+            if kind == _RECORD_ADD:
+                self._replay_add(body, body_offset)
+            else:
+                self._replay_done(body)
+            position = body_offset + length
+
+        file_size = os.path.getsize(self.path)
+        if position < file_size:
+            logger.warning("待发送队列末尾有不完整的记录，已截断: %s字节", file_size - position)
+            self._file.truncate(position)
+        self._file.seek(0, os.SEEK_END)
+        if self._entries:
+            logger.info("待发送队列中有 %s 条内容", len(self._entries))
+        self._compact_if_needed()
+
+    def _replay_add(self, body: bytes, body_offset: int):
+        (meta_length,) = _META_LENGTH.unpack_from(body)
+        meta = json.loads(body[_META_LENGTH.size:_META_LENGTH.size + meta_length])
+        payload_offset = body_offset + _META_LENGTH.size + meta_length
+        entry = OutboxEntry(meta["id"], meta["type"], meta["compressed"], meta["hash"], meta["timestamp"],
+                            payload_offset, len(body) - _META_LENGTH.size - meta_length)
+        self._entries[entry.id] = entry
+        self._next_id = max(self._next_id, entry.id + 1)
+
+    def _replay_done(self, body: bytes):
+        entry = self._entries.pop(json.loads(body)["id"], None)
+        if entry is not None:
+            self._dead_bytes += entry.size
+
+    def _append(self, kind: int, body: bytes) -> int:
+        """追加一条记录并同步到磁盘，返回记录体在文件中的位置"""
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell() + _RECORD_HEADER.size
+        self._file.write(_RECORD_HEADER.pack(kind, len(body), zlib.crc32(body)) + body)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return offset
+
+    def add(self, content_type: str, payload: bytes, is_compressed: bool, content_hash: str,
+            timestamp: int) -> OutboxEntry | None:
+        """加入待发送的内容，相同内容的旧条目被取代；超过容量时丢弃最旧的条目"""
+        if len(payload) > self.max_bytes:
+            logger.warning("内容太大（%s字节），不加入待发送队列", len(payload))
+            return None
+        for entry in list(self._entries.values()):
+            if entry.content_hash == content_hash:
+                self.remove(entry.id)
+
+        entry_id = self._next_id
+        self._next_id += 1
+        body, payload_start = _encode_add(entry_id, content_type, is_compressed, content_hash, timestamp, payload)
+        body_offset = self._append(_RECORD_ADD, body)
+        entry = OutboxEntry(entry_id, content_type, is_compressed, content_hash, timestamp,
+                            body_offset + payload_start, len(payload))
+        self._entries[entry_id] = entry
+
+        while len(self._entries) > self.max_entries or self.pending_bytes() > self.max_bytes:
+            oldest = next(iter(self._entries.values()))
+            logger.warning("待发送队列已满，丢弃最早的%s内容", oldest.content_type)
+            self.remove(oldest.id)
+        return entry
+
+    def peek(self) -> OutboxEntry | None:
+        """最早加入的条目"""
+        return next(iter(self._entries.values()), None)
+
+    def read(self, entry: OutboxEntry) -> bytes:
+        """读取条目的负载"""
+        self._file.seek(entry.offset)
+        payload = self._file.read(entry.size)
+        self._file.seek(0, os.SEEK_END)
+        return payload
+
+    def remove(self, entry_id: int):
+        """标记条目已发送（或已被取代）"""
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._append(_RECORD_DONE, json.dumps({"id": entry_id}).encode())
+        self._dead_bytes += entry.size
+        self._compact_if_needed()
+
+    def pending_bytes(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _compact_if_needed(self):
+        """已发送的记录占多数时重写日志，只保留未发送的条目"""
+        size = self._file.seek(0, os.SEEK_END)
+        if size < COMPACT_MIN_BYTES or self._dead_bytes < size // 2:
+            return
+        temp_path = self.path + '.tmp'
+        entries = OrderedDict()
+        with open(temp_path, 'wb') as out:
+            position = 0
+            for entry in self._entries.values():
+                body, payload_start = _encode_add(entry.id, entry.content_type, entry.is_compressed,
+                                                  entry.content_hash, entry.timestamp, self.read(entry))
+                out.write(_RECORD_HEADER.pack(_RECORD_ADD, len(body), zlib.crc32(body)) + body)
+                entries[entry.id] = OutboxEntry(entry.id, entry.content_type, entry.is_compressed,
+                                                entry.content_hash, entry.timestamp,
+                                                position + _RECORD_HEADER.size + payload_start, entry.size)
+                position += _RECORD_HEADER.size + len(body)
+            out.flush()
+            os.fsync(out.fileno())
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'a+b')
+        self._entries = entries
+        self._dead_bytes = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,99 @@
+import logging
+import random
+import time
+from PySide6.QtCore import QObject, QTimer, Signal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_DELAY = 1.0  # 第一次重连的等待上限（秒）
+DEFAULT_MAX_DELAY = 60.0  # 等待上限最多增长到该值
+
+
+class ReconnectStats:
+    """重连次数和从断开到恢复连接所用时间的统计"""
+
+    def __init__(self):
+        self.attempts = 0
+        self.recoveries = 0
+        self.last_recovery = None  # 秒
+        self.max_recovery = 0.0
+
+    def record_attempt(self):
+        self.attempts += 1
+
+    def record_recovery(self, seconds: float):
+        self.recoveries += 1
+        self.last_recovery = seconds
+        self.max_recovery = max(self.max_recovery, seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "recoveries": self.recoveries,
+            "last_recovery_s": self.last_recovery,
+            "max_recovery_s": self.max_recovery,
+        }
+
+    def summary(self) -> str:
+        if self.last_recovery is None:
+            return f"重连{self.attempts}次"
+        return (f"重连{self.attempts}次, 恢复{self.recoveries}次, 最近一次恢复用时 {self.last_recovery:.1f}s, "
+                f"最长 {self.max_recovery:.1f}s")
+
+
+class ReconnectScheduler(QObject):
+    """按指数退避安排重连，等待时间在 [0, min(max_delay, min_delay * 2^n)] 中随机选取（full jitter）
+
+    大量客户端在服务器重启后同时断开时，随机等待把重连分散开，避免同时涌向服务器。
+    只在GUI线程中使用，到时间后发出 reconnect 信号，由调用方执行实际的重连。
+    """
+    reconnect = Signal()
+
+    def __init__(self, min_delay: float = DEFAULT_MIN_DELAY, max_delay: float = DEFAULT_MAX_DELAY, parent=None):
+        super().__init__(parent)
+        self.min_delay = max(0.1, float(min_delay))
+        self.max_delay = max(self.min_delay, float(max_delay))
+        self.stats = ReconnectStats()
+        self._failures = 0  # 连续失败次数，决定等待上限
+        self._outage_started = None  # 本次断开的开始时间
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._fire)
+
+    def next_delay(self) -> float:
+        """下一次重连前等待的秒数"""
+        ceiling = min(self.max_delay, self.min_delay * 2 ** min(self._failures, 32))
+        return random.uniform(0, ceiling)
+
+    def schedule(self):
+        """连接失败或断开时调用；已在等待时忽略，同一次失败可能同时报告断开和连接错误"""
+        if self._outage_started is None:
+            self._outage_started = time.monotonic()
+        if self._timer.isActive():
+            return
+        delay = self.next_delay()
+        self._failures += 1
+        logger.info("%.1f秒后重连（第%s次）", delay, self._failures)
+        self._timer.start(int(delay * 1000))
+
+    def connected(self):
+        """连接成功，记录恢复用时并重置退避"""
+        self._timer.stop()
+        self._failures = 0
+        if self._outage_started is not None:
+            seconds = time.monotonic() - self._outage_started
+            self._outage_started = None
+            self.stats.record_recovery(seconds)
+            logger.info("MQTT连接已恢复，用时 %.1fs", seconds)
+
+    def cancel(self):
+        """取消等待中的重连，例如改用新配置重新连接时"""
+        self._timer.stop()
+        self._failures = 0
+
+    def is_pending(self) -> bool:
+        return self._timer.isActive()
+
+    def _fire(self):
+        self.stats.record_attempt()
+        self.reconnect.emit()
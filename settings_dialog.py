@@ -11,7 +11,7 @@ class SettingsDialog(QDialog):
         self.setMinimumWidth(400)
         
         # 缓存当前配置
-        self.current_config = load_config()
+        self.current_config = load_config().to_dict()
         
         self.setup_ui()
         self.load_settings()
@@ -75,15 +75,15 @@ class SettingsDialog(QDialog):
         self.topic_prefix_input.setText(mqtt_config.get('topic_prefix', 'copier/clipboard'))
 
     def save_settings(self):
-        config = {
-            'mqtt': {
-                'host': self.host_input.text().strip(),
-                'port': self.port_input.value(),
-                'username': self.username_input.text().strip(),
-                'password': self.password_input.text(),
-                'topic_prefix': self.topic_prefix_input.text().strip()
-            }
-        }
+        # 保留配置文件中的其他设置（如历史记录、TLS等），只更新对话框中的字段
+        config = json.loads(json.dumps(self.current_config))
+        config.setdefault('mqtt', {}).update({
+            'host': self.host_input.text().strip(),
+            'port': self.port_input.value(),
+            'username': self.username_input.text().strip(),
+            'password': self.password_input.text(),
+            'topic_prefix': self.topic_prefix_input.text().strip()
+        })
         
         # 只有当配置确实发生变化时才保存
         if config != self.current_config:
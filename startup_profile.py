@@ -0,0 +1,37 @@
+import time
+
+
+class StartupProfiler:
+    """记录启动各阶段的耗时，使用 --profile-startup 启动时输出
+
+    从导入main.py开始计时，mark 记录从上一个标记到现在的耗时。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._started = time.perf_counter()
+        self._last = self._started
+        self.phases = []  # [(阶段名, 耗时秒)]
+        self._events = set()
+
+    def mark(self, name: str):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def first(self, name: str) -> bool:
+        """事件第一次发生时记录为一个阶段，返回是否是第一次"""
+        if name in self._events:
+            return False
+        self._events.add(name)
+        self.mark(name)
+        return True
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def report(self) -> str:
+        width = max((len(name) for name, _ in self.phases), default=0)
+        lines = [f"  {name:<{width}}  {seconds * 1000:8.1f}ms" for name, seconds in self.phases]
+        lines.append(f"  {'合计':<{width}}  {sum(seconds for _, seconds in self.phases) * 1000:8.1f}ms")
+        return "启动耗时:\n" + "\n".join(lines)
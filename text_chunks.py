@@ -0,0 +1,14 @@
+TEXT_SLICE_CHARS = 1024 * 1024  # 每次编码的字符数
+
+
+def iter_utf8(text: str, slice_chars: int = TEXT_SLICE_CHARS):
+    """分段把文本编码为UTF-8，避免为超长文本一次生成完整副本"""
+    for offset in range(0, len(text), slice_chars):
+        yield text[offset:offset + slice_chars].encode('utf-8')
+
+
+def utf8_length(text: str) -> int:
+    """文本编码为UTF-8后的字节数"""
+    if text.isascii():
+        return len(text)
+    return sum(len(part) for part in iter_utf8(text))
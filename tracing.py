@@ -0,0 +1,337 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from config import CONFIG_DIR
+from metrics import metrics
+
+TRACES_FILE = os.path.join(CONFIG_DIR, 'traces.json')
+
+# 一次同步经过的时间点：前四个由发送方记录（发送方时钟），后三个由接收方记录
+SENDER_STAGES = ("captured", "encoded", "published", "broker_acked")
+RECEIVER_STAGES = ("received", "decoded", "applied")
+TRACE_STAGES = SENDER_STAGES + RECEIVER_STAGES
+
+# 报告中的分段耗时 (名称, 开始, 结束)，transit 跨越两台设备，按时钟偏差换算
+SEGMENTS = (
+    ("encode", "captured", "encoded"),
+    ("send", "encoded", "published"),
+    ("broker_ack", "published", "broker_acked"),
+    ("transit", "published", "received"),
+    ("decode", "received", "decoded"),
+    ("apply", "decoded", "applied"),
+)
+
+# MQTT v5 用户属性，时间戳为微秒的十进制字符串
+TRACE_PROPERTY = "copier-trace"
+KIND_PROPERTY = "copier-kind"  # ack：接收方的确认；reply：发送方对确认的回复
+FROM_PROPERTY = "copier-from"
+SENT_PROPERTY = "copier-sent"  # ack/reply 发出的时间
+ACK_RECEIVED_PROPERTY = "copier-ack-received"  # 发送方收到ack的时间
+STAGE_PREFIX = "copier-t-"
+
+MAX_PENDING = 256  # 等待确认或回复的跟踪数，超过时丢弃最旧的
+MAX_PEERS = 32
+OFFSET_SAMPLES = 8
+RECENT_TRACES = 1000
+
+
+def now_us() -> int:
+    """微秒时间戳；跨设备比较只能用墙上时钟，偏差由 ClockOffset 估计"""
+    return time.time_ns() // 1000
+
+
+def user_properties(properties) -> dict:
+    """MQTT消息属性中的用户属性"""
+    return dict(getattr(properties, 'UserProperty', None) or ())
+
+
+def _stage_properties(stamps: dict, stages) -> list[tuple[str, str]]:
+    return [(STAGE_PREFIX + stage, str(stamps[stage])) for stage in stages if stage in stamps]
+
+
+def _parse_stages(props: dict, stages) -> dict:
+    stamps = {}
+    for stage in stages:
+        value = props.get(STAGE_PREFIX + stage)
+        if value is not None:
+            try:
+                stamps[stage] = int(value)
+            except ValueError:
+                pass
+    return stamps
+
+
+def _percentile(values: list, q: float):
+    """已排序列表的最近秩分位数"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(q * len(values) + 0.5) - 1))]
+
+
+class ClockOffset:
+    """对端时钟相对本机的偏差估计（NTP方式）
+
+    每次往返得到一个样本：t1、t4为本机发出和收到的时间，t2、t3为对端收到和发出的时间，
+    偏差 = ((t2 - t1) + (t3 - t4)) / 2，往返 = (t4 - t1) - (t3 - t2)。
+    往返越短受路径不对称的影响越小，因此取最近几个样本中往返最短的一个，误差不超过往返的一半。
+    """
+
+    def __init__(self, max_samples: int = OFFSET_SAMPLES):
+        self.samples = deque(maxlen=max_samples)  # (往返, 偏差)，微秒
+
+    def add(self, t1: int, t2: int, t3: int, t4: int):
+        delay = (t4 - t1) - (t3 - t2)
+        if delay < 0:
+            return  # 对端处理时间比往返还长，时间戳有误
+        self.samples.append((delay, ((t2 - t1) + (t3 - t4)) / 2))
+
+    def estimate(self) -> tuple[float, float] | None:
+        """(偏差, 误差上限)，微秒；对端时间减去偏差即为本机时间"""
+        if not self.samples:
+            return None
+        delay, offset = min(self.samples)
+        return offset, delay / 2
+
+
+class SyncTrace:
+    """一次从对端复制到本机粘贴的跟踪，发送方和接收方的时间戳各用自己的时钟"""
+
+    def __init__(self, trace_id: str, peer_id: str, stamps: dict):
+        self.trace_id = trace_id
+        self.peer_id = peer_id  # 发送方
+        self.stamps = stamps  # {阶段: 微秒}
+        self.ack_sent = None
+        self.offset = None  # 发送方时钟减本机时钟（微秒），完成时确定
+        self.uncertainty = None
+
+    def mark(self, stage: str):
+        self.stamps.setdefault(stage, now_us())
+
+    def local(self, stage: str) -> float | None:
+        """阶段的本机时间，发送方的时间戳按偏差换算"""
+        value = self.stamps.get(stage)
+        if value is None or stage not in SENDER_STAGES:
+            return value
+        return value - (self.offset or 0)
+
+    def duration(self, start: str, end: str) -> float | None:
+        """两个阶段之间的秒数"""
+        if start in SENDER_STAGES and end in SENDER_STAGES:
+            begin, finish = self.stamps.get(start), self.stamps.get(end)  # 同一时钟，无需换算
+        else:
+            begin, finish = self.local(start), self.local(end)
+        if begin is None or finish is None:
+            return None
+        return (finish - begin) / 1e6
+
+    def latency(self) -> float | None:
+        """复制到粘贴的秒数"""
+        return self.duration("captured", "applied")
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "peer_id": self.peer_id,
+            "stamps_us": dict(self.stamps),
+            "clock_offset_us": self.offset,
+            "clock_uncertainty_us": self.uncertainty,
+            "latency_s": self.latency(),
+            "segments_s": {name: self.duration(start, end) for name, start, end in SEGMENTS},
+        }
+
+
+class SyncTracer:
+    """用MQTT v5用户属性跟踪端到端同步延迟
+
+    发送方在内容消息中带上跟踪id和 captured/encoded/published 时间戳。接收方写入剪贴板后
+    向发送方的 trace 主题发送ack，带上 received/decoded/applied；发送方回复 broker_acked
+    和收到ack的时间。ack和回复构成一次往返，接收方由此估计时钟偏差，再把发送方的时间戳
+    换算到本机时钟，得到复制到粘贴的延迟。发送方从内容消息和ack的往返也估计对端的偏差。
+
+    broker_acked 在网络线程中记录，collect/summary 可能在指标端点的线程中调用，其余方法在GUI线程中调用；
+    时钟偏差样本和最近完成的跟踪只在持有锁时读写。
+    """
+
+    def __init__(self, client_id: str, max_pending: int = MAX_PENDING, max_recent: int = RECENT_TRACES):
+        self.client_id = client_id
+        self.max_pending = max_pending
+        self._sent = OrderedDict()  # 跟踪id -> {阶段: 微秒}，本机发出的内容
+        self._received = OrderedDict()  # 跟踪id -> SyncTrace，已发送ack、等待回复
+        self.offsets = OrderedDict()  # 对端id -> ClockOffset
+        self.completed = deque(maxlen=max_recent)
+        self.expired = 0  # 没等到回复就被丢弃的跟踪数
+        self._lock = threading.Lock()
+
+    # 发送方
+
+    def outgoing(self, trace_id: str, stamps: dict) -> list[tuple[str, str]]:
+        """发布内容前调用，记录 published，返回要附加的用户属性"""
+        stamps = dict(stamps)
+        stamps["published"] = now_us()
+        with self._lock:
+            self._sent[trace_id] = stamps
+            while len(self._sent) > self.max_pending:
+                self._sent.popitem(last=False)
+        return [(TRACE_PROPERTY, trace_id), (FROM_PROPERTY, self.client_id),
+                *_stage_properties(stamps, ("captured", "encoded", "published"))]
+
+    def track(self, trace_id: str, futures: list):
+        """所有发布都收到服务器确认时记录 broker_acked"""
+        def done(_):
+            if all(future.done() and not future.cancelled() and future.exception() is None
+                   for future in futures):
+                acked = now_us()
+                with self._lock:
+                    stamps = self._sent.get(trace_id)
+                    if stamps is not None:
+                        stamps.setdefault("broker_acked", acked)
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def on_ack(self, props: dict, received_at: int) -> tuple[str, list[tuple[str, str]]] | None:
+        """收到接收方的ack，返回 (接收方id, 回复的用户属性)"""
+        trace_id, peer_id = props.get(TRACE_PROPERTY), props.get(FROM_PROPERTY)
+        if not trace_id or not peer_id:
+            return None
+        with self._lock:
+            stamps = dict(self._sent.get(trace_id, {}))
+        peer_stamps = _parse_stages(props, RECEIVER_STAGES)
+        try:
+            ack_sent = int(props[SENT_PROPERTY])
+            if "published" in stamps and "received" in peer_stamps:
+                with self._lock:
+                    self._offset(peer_id).add(stamps["published"], peer_stamps["received"], ack_sent, received_at)
+        except (KeyError, ValueError):
+            pass
+        reply = [(TRACE_PROPERTY, trace_id), (KIND_PROPERTY, "reply"), (FROM_PROPERTY, self.client_id),
+                 *_stage_properties(stamps, ("broker_acked",)),
+                 (ACK_RECEIVED_PROPERTY, str(received_at)), (SENT_PROPERTY, str(now_us()))]
+        return peer_id, reply
+
+    # 接收方
+
+    def incoming(self, props: dict, received_at: int) -> SyncTrace | None:
+        """收到带跟踪属性的内容消息，返回用于记录接收各阶段的跟踪"""
+        trace_id, peer_id = props.get(TRACE_PROPERTY), props.get(FROM_PROPERTY)
+        if not trace_id or not peer_id or peer_id == self.client_id:
+            return None
+        stamps = _parse_stages(props, ("captured", "encoded", "published"))
+        stamps["received"] = received_at
+        return SyncTrace(trace_id, peer_id, stamps)
+
+    def ack_properties(self, trace: SyncTrace) -> list[tuple[str, str]]:
+        """内容写入剪贴板后发给发送方的ack，发出后等待回复"""
+        trace.ack_sent = now_us()
+        self._received[trace.trace_id] = trace
+        while len(self._received) > self.max_pending:
+            self._received.popitem(last=False)
+            with self._lock:
+                self.expired += 1
+        return [(TRACE_PROPERTY, trace.trace_id), (KIND_PROPERTY, "ack"), (FROM_PROPERTY, self.client_id),
+                *_stage_properties(trace.stamps, RECEIVER_STAGES), (SENT_PROPERTY, str(trace.ack_sent))]
+
+    def on_reply(self, props: dict, received_at: int) -> SyncTrace | None:
+        """收到发送方的回复，估计时钟偏差并完成跟踪"""
+        trace = self._received.pop(props.get(TRACE_PROPERTY), None)
+        if trace is None:
+            return None
+        try:
+            ack_received, reply_sent = int(props[ACK_RECEIVED_PROPERTY]), int(props[SENT_PROPERTY])
+        except (KeyError, ValueError):
+            ack_received = None
+        with self._lock:
+            if ack_received is not None:
+                self._offset(trace.peer_id).add(trace.ack_sent, ack_received, reply_sent, received_at)
+            estimate = self.offsets[trace.peer_id].estimate() if trace.peer_id in self.offsets else None
+        trace.stamps.update(_parse_stages(props, ("broker_acked",)))
+        if estimate is None:
+            return None
+        trace.offset, trace.uncertainty = estimate
+        self._record(trace)
+        return trace
+
+    def _offset(self, peer_id: str) -> ClockOffset:
+        # 调用方持有锁
+        offset = self.offsets.pop(peer_id, None) or ClockOffset()
+        self.offsets[peer_id] = offset  # 最近用到的对端排在最后
+        while len(self.offsets) > MAX_PEERS:
+            self.offsets.popitem(last=False)
+        return offset
+
+    def _record(self, trace: SyncTrace):
+        with self._lock:
+            self.completed.append(trace)
+        latency = trace.latency()
+        if latency is not None:
+            metrics.histogram("copier_sync_latency_seconds", "从对端复制到本机写入剪贴板的延迟（秒）").observe(
+                max(0.0, latency))
+        for name, start, end in SEGMENTS:
+            seconds = trace.duration(start, end)
+            if seconds is not None:
+                metrics.histogram("copier_sync_segment_seconds", "端到端同步各分段的耗时（秒）",
+                                  segment=name).observe(max(0.0, seconds))
+
+    # 报告
+
+    def _snapshot(self) -> tuple[list, int, dict]:
+        """在锁内复制最近完成的跟踪、未完成数和各对端的时钟偏差估计"""
+        with self._lock:
+            estimates = {peer_id: offset.estimate() for peer_id, offset in self.offsets.items()}
+            return list(self.completed), self.expired, {
+                peer_id: estimate for peer_id, estimate in estimates.items() if estimate is not None}
+
+    def collect(self) -> list:
+        """指标collector：各对端的时钟偏差估计"""
+        _, expired, estimates = self._snapshot()
+        samples = [("copier_sync_traces_expired_total", "counter", "没有等到发送方回复的跟踪数", {}, expired)]
+        for peer_id, estimate in estimates.items():
+            samples.append(("copier_clock_offset_seconds", "gauge", "对端时钟相对本机的偏差（秒）",
+                            {"peer": peer_id}, estimate[0] / 1e6))
+        return samples
+
+    def summary(self) -> dict:
+        """最近完成的跟踪的延迟分位数、各分段中位数和各对端的时钟偏差"""
+        traces, expired, estimates = self._snapshot()
+        latencies = sorted(latency for latency in (trace.latency() for trace in traces) if latency is not None)
+        segments = {}
+        for name, start, end in SEGMENTS:
+            values = sorted(value for value in (trace.duration(start, end) for trace in traces) if value is not None)
+            segments[name] = {"p50_s": _percentile(values, 0.50), "p99_s": _percentile(values, 0.99)}
+        offsets = {peer_id: {"offset_s": estimate[0] / 1e6, "uncertainty_s": estimate[1] / 1e6}
+                   for peer_id, estimate in estimates.items()}
+        return {
+            "count": len(latencies),
+            "expired": expired,
+            "latency_s": {"p50": _percentile(latencies, 0.50), "p95": _percentile(latencies, 0.95),
+                          "p99": _percentile(latencies, 0.99), "max": latencies[-1] if latencies else None},
+            "segments": segments,
+            "clock_offsets": offsets,
+        }
+
+    def report(self) -> str:
+        summary = self.summary()
+
+        def ms(seconds):
+            return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+        latency = summary["latency_s"]
+        lines = [f"端到端同步延迟（最近 {summary['count']} 次，未完成 {summary['expired']} 次）",
+                 f"  复制到粘贴  p50 {ms(latency['p50'])}ms  p95 {ms(latency['p95'])}ms  "
+                 f"p99 {ms(latency['p99'])}ms  最大 {ms(latency['max'])}ms"]
+        for name, values in summary["segments"].items():
+            lines.append(f"  {name:<10}  p50 {ms(values['p50_s'])}ms  p99 {ms(values['p99_s'])}ms")
+        for peer_id, values in summary["clock_offsets"].items():
+            lines.append(f"  时钟偏差 {peer_id}: {values['offset_s'] * 1000:+.1f}ms "
+                         f"±{values['uncertainty_s'] * 1000:.1f}ms")
+        return "\n".join(lines)
+
+    def dump(self, path: str = TRACES_FILE):
+        """汇总和最近的跟踪写入JSON文件，先写临时文件再替换"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({"timestamp": int(time.time()), "summary": self.summary(),
+                       "traces": [trace.to_dict() for trace in self._snapshot()[0]]}, f, indent=2)
+        os.replace(temp_path, path)